@@ -68,7 +68,7 @@ class JobFetcher(AgentBase):
                     else:
                         extractorCore = None
                     jobSpecs = []
-                    fileStatMap = dict()
+                    jobFileGroupsList = []
                     sw_startconvert = core_utils.get_stopwatch()
                     for job in jobs:
                         timeNow = datetime.datetime.utcnow()
@@ -87,13 +87,17 @@ class JobFetcher(AgentBase):
                         fileGroupDictList = [jobSpec.get_input_file_attributes()]
                         if extractorCore is not None:
                             fileGroupDictList.append(extractorCore.get_aux_inputs(jobSpec))
+                        jobFileGroupsList.append((jobSpec, fileGroupDictList))
+                    # check status of input files in bulk
+                    lfnSet = set()
+                    for jobSpec, fileGroupDictList in jobFileGroupsList:
+                        for fileGroupDict in fileGroupDictList:
+                            lfnSet.update(fileGroupDict)
+                    fileStatMap = self.dbProxy.get_files_status(lfnSet, 'input', queueConfig.ddmEndpointIn, 'starting')
+                    for jobSpec, fileGroupDictList in jobFileGroupsList:
                         for fileGroupDict in fileGroupDictList:
                             for tmpLFN, fileAttrs in iteritems(fileGroupDict):
-                                # check file status
-                                if tmpLFN not in fileStatMap:
-                                    fileStatMap[tmpLFN] = self.dbProxy.get_file_status(tmpLFN, 'input',
-                                                                                       queueConfig.ddmEndpointIn,
-                                                                                       'starting')
+                                fileStatMap.setdefault(tmpLFN, dict())
                                 # make file spec
                                 fileSpec = FileSpec()
                                 fileSpec.PandaID = jobSpec.PandaID
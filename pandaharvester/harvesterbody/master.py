@@ -2,12 +2,14 @@ import os
 import pwd
 import grp
 import sys
+import time
 import socket
 import signal
 import logging
 import daemon.pidfile
 import argparse
 import threading
+import multiprocessing
 import cProfile
 import atexit
 from future.utils import iteritems
@@ -31,12 +33,22 @@ _logger = core_utils.setup_logger('master')
 master_instance = False
 master_lock = threading.Lock()
 
+# start agent processes from a fresh interpreter not to inherit locks held by threads in the master
+try:
+    mp_context = multiprocessing.get_context('spawn')
+except AttributeError:
+    # python 2
+    mp_context = multiprocessing
+
 
 # the master class which runs the main process
 class Master(object):
+    # names of agents
+    agentNames = ('credmanager', 'commandmanager', 'cacher', 'watcher', 'jobfetcher', 'propagator', 'monitor',
+                  'preparator', 'submitter', 'stager', 'eventfeeder', 'sweeper', 'servicemonitor')
 
     # constructor
-    def __init__(self, single_mode=False, stop_event=None, daemon_mode=True):
+    def __init__(self, single_mode=False, stop_event=None, daemon_mode=True, child_process=False):
         # initialize database and config
         self.singleMode = single_mode
         self.stopEvent = stop_event
@@ -45,128 +57,25 @@ class Master(object):
         self.communicatorPool = CommunicatorPool()
         from pandaharvester.harvestercore.queue_config_mapper import QueueConfigMapper
         self.queueConfigMapper = QueueConfigMapper()
-        from pandaharvester.harvestercore.db_proxy_pool import DBProxyPool as DBProxy
-        dbProxy = DBProxy()
-        dbProxy.make_tables(self.queueConfigMapper)
+        # tables are made by the master process
+        if not child_process:
+            from pandaharvester.harvestercore.db_proxy_pool import DBProxyPool as DBProxy
+            dbProxy = DBProxy()
+            dbProxy.make_tables(self.queueConfigMapper)
+        self.procStartTimeMap = {}
 
     # main loop
     def start(self):
-        # thread list
-        thrList = []
-        # Credential Manager
-        from pandaharvester.harvesterbody.cred_manager import CredManager
-        thr = CredManager(single_mode=self.singleMode)
-        thr.set_stop_event(self.stopEvent)
-        thr.execute()
-        thr.start()
-        thrList.append(thr)
-        # Command manager
-        from pandaharvester.harvesterbody.command_manager import CommandManager
-        thr = CommandManager(self.communicatorPool, self.queueConfigMapper, single_mode=self.singleMode)
-        thr.set_stop_event(self.stopEvent)
-        thr.start()
-        thrList.append(thr)
-        # Cacher
-        from pandaharvester.harvesterbody.cacher import Cacher
-        thr = Cacher(self.communicatorPool, single_mode=self.singleMode)
-        thr.set_stop_event(self.stopEvent)
-        thr.execute(force_update=True, skip_lock=True)
-        thr.start()
-        thrList.append(thr)
-        # Watcher
-        from pandaharvester.harvesterbody.watcher import Watcher
-        thr = Watcher(single_mode=self.singleMode)
-        thr.set_stop_event(self.stopEvent)
-        thr.start()
-        thrList.append(thr)
-        # Job Fetcher
-        from pandaharvester.harvesterbody.job_fetcher import JobFetcher
-        nThr = harvester_config.jobfetcher.nThreads
-        for iThr in range(nThr):
-            thr = JobFetcher(self.communicatorPool,
-                             self.queueConfigMapper,
-                             single_mode=self.singleMode)
-            thr.set_stop_event(self.stopEvent)
-            thr.start()
-            thrList.append(thr)
-        # Propagator
-        from pandaharvester.harvesterbody.propagator import Propagator
-        nThr = harvester_config.propagator.nThreads
-        for iThr in range(nThr):
-            thr = Propagator(self.communicatorPool,
-                             self.queueConfigMapper,
-                             single_mode=self.singleMode)
-            thr.set_stop_event(self.stopEvent)
-            thr.start()
-            thrList.append(thr)
-        # Monitor
-        from pandaharvester.harvesterbody.monitor import Monitor
-        nThr = harvester_config.monitor.nThreads
-        for iThr in range(nThr):
-            thr = Monitor(self.queueConfigMapper,
-                          single_mode=self.singleMode)
-            thr.set_stop_event(self.stopEvent)
-            thr.start()
-            thrList.append(thr)
-        # Preparator
-        from pandaharvester.harvesterbody.preparator import Preparator
-        nThr = harvester_config.preparator.nThreads
-        for iThr in range(nThr):
-            thr = Preparator(self.communicatorPool,
-                             self.queueConfigMapper,
-                             single_mode=self.singleMode)
-            thr.set_stop_event(self.stopEvent)
-            thr.start()
-            thrList.append(thr)
-        # Submitter
-        from pandaharvester.harvesterbody.submitter import Submitter
-        nThr = harvester_config.submitter.nThreads
-        for iThr in range(nThr):
-            thr = Submitter(self.queueConfigMapper,
-                            single_mode=self.singleMode)
-            thr.set_stop_event(self.stopEvent)
-            thr.start()
-            thrList.append(thr)
-        # Stager
-        from pandaharvester.harvesterbody.stager import Stager
-        nThr = harvester_config.stager.nThreads
-        for iThr in range(nThr):
-            thr = Stager(self.queueConfigMapper,
-                         single_mode=self.singleMode)
-            thr.set_stop_event(self.stopEvent)
-            thr.start()
-            thrList.append(thr)
-        # EventFeeder
-        from pandaharvester.harvesterbody.event_feeder import EventFeeder
-        nThr = harvester_config.eventfeeder.nThreads
-        for iThr in range(nThr):
-            thr = EventFeeder(self.communicatorPool,
-                              self.queueConfigMapper,
-                              single_mode=self.singleMode)
-            thr.set_stop_event(self.stopEvent)
-            thr.start()
-            thrList.append(thr)
-        # Sweeper
-        from pandaharvester.harvesterbody.sweeper import Sweeper
-        nThr = harvester_config.sweeper.nThreads
-        for iThr in range(nThr):
-            thr = Sweeper(self.queueConfigMapper,
-                          single_mode=self.singleMode)
-            thr.set_stop_event(self.stopEvent)
-            thr.start()
-            thrList.append(thr)
-        # Service monitor
-        try:
-            sm_active = harvester_config.service_monitor.active
-        except:
-            sm_active = False
-
-        if sm_active:
-            from pandaharvester.harvesterbody.service_monitor import ServiceMonitor
-            thr = ServiceMonitor(options.pid, single_mode=self.singleMode)
-            thr.set_stop_event(self.stopEvent)
-            thr.start()
-            thrList.append(thr)
+        # agents to run in child processes
+        agentGroups = self.get_agent_process_groups()
+        procMap = {}
+        for groupName, agentNames in agentGroups:
+            procMap[groupName] = self.start_agent_process(groupName, agentNames)
+        # agents to run as threads in this process
+        agentNames = set(self.agentNames)
+        for groupName, groupAgentNames in agentGroups:
+            agentNames -= set(groupAgentNames)
+        thrList = self.start_agents(agentNames)
 
         # Report itself to APF Mon
         apf_mon = Apfmon(self.queueConfigMapper)
@@ -182,11 +91,246 @@ class Master(object):
             self.stopEvent.wait(1)
             if self.stopEvent.is_set():
                 break
+            # restart dead child processes
+            self.supervise_agent_processes(procMap, dict(agentGroups))
         ##################
         # join
         if self.daemonMode:
             for thr in thrList:
                 thr.join()
+            self.stop_agent_processes(procMap)
+
+    # get groups of agents to run in child processes, such as "monitor;submitter,sweeper"
+    def get_agent_process_groups(self):
+        agentGroups = []
+        groupsStr = getattr(harvester_config.master, 'agentProcessGroups', None)
+        if not groupsStr or self.singleMode or not self.daemonMode:
+            return agentGroups
+        for iGroup, groupStr in enumerate(groupsStr.split(';')):
+            agentNames = [name.strip().lower() for name in groupStr.split(',') if name.strip()]
+            unknownNames = set(agentNames) - set(self.agentNames)
+            if unknownNames:
+                _logger.error('skipped unknown agents {0} in agentProcessGroups'.format(','.join(sorted(unknownNames))))
+                agentNames = [name for name in agentNames if name not in unknownNames]
+            if agentNames:
+                agentGroups.append(('group{0}'.format(iGroup), agentNames))
+        return agentGroups
+
+    # start a child process to run a group of agents
+    def start_agent_process(self, group_name, agent_names):
+        pidFile = options.pid if options is not None else None
+        proc = mp_context.Process(target=run_agent_process,
+                                  args=(group_name, agent_names, os.getpid(), self.singleMode, pidFile),
+                                  name='harvester-{0}'.format(group_name))
+        proc.start()
+        self.procStartTimeMap[group_name] = time.time()
+        _logger.info('started {0} with agents={1} in PID={2}'.format(group_name, ','.join(agent_names), proc.pid))
+        return proc
+
+    # restart child processes which died unexpectedly
+    def supervise_agent_processes(self, proc_map, agent_groups):
+        restartInterval = getattr(harvester_config.master, 'agentProcessRestartInterval', 60)
+        for groupName, proc in list(proc_map.items()):
+            if proc.is_alive():
+                continue
+            lastStart = self.procStartTimeMap.get(groupName, 0)
+            if time.time() - lastStart < restartInterval:
+                continue
+            _logger.error('{0} in PID={1} died with exitcode={2}. Restarting'.format(groupName, proc.pid, proc.exitcode))
+            proc.join()
+            proc_map[groupName] = self.start_agent_process(groupName, agent_groups[groupName])
+
+    # stop child processes gracefully, and kill them if they don't stop in time
+    def stop_agent_processes(self, proc_map):
+        stopTimeout = getattr(harvester_config.master, 'agentProcessStopTimeout', 60)
+        for proc in proc_map.values():
+            if proc.is_alive():
+                # SIGTERM to set the stop event in the child
+                proc.terminate()
+        deadline = time.time() + stopTimeout
+        for groupName, proc in proc_map.items():
+            proc.join(max(deadline - time.time(), 0))
+            if proc.is_alive():
+                _logger.error('{0} in PID={1} did not stop in {2} sec. Killing'.format(groupName, proc.pid,
+                                                                                     stopTimeout))
+                try:
+                    os.kill(proc.pid, signal.SIGKILL)
+                except Exception:
+                    pass
+                proc.join()
+
+    # main of child process to run agents as threads with own connection pools
+    def run_agent_process(self, group_name, agent_names, parent_pid):
+        self.stopEvent = threading.Event()
+
+        # stop agents at the end of their cycles
+        def catch_sigterm(sig, frame):
+            _logger.info('{0} got signal={1} to be stopped'.format(group_name, sig))
+            self.stopEvent.set()
+
+        # not to remove the pid file of the master
+        for sig in (signal.SIGALRM, signal.SIGUSR2):
+            signal.signal(sig, signal.SIG_DFL)
+        for sig in (signal.SIGINT, signal.SIGHUP, signal.SIGTERM):
+            signal.signal(sig, catch_sigterm)
+        # not to share DB connections and sessions with the parent when forked
+        from pandaharvester.harvestercore.db_proxy_pool import DBProxyPool as DBProxy
+        DBProxy.reset_instance()
+        thrList = self.start_agents(agent_names)
+        _logger.info('{0} started agents={1}'.format(group_name, ','.join(agent_names)))
+        # stop when the parent is gone
+        while not self.stopEvent.is_set():
+            if os.getppid() != parent_pid:
+                _logger.info('{0} stopping since the master process is gone'.format(group_name))
+                self.stopEvent.set()
+                break
+            self.stopEvent.wait(1)
+        # join with timeout to be interruptable by signals
+        for thr in thrList:
+            while thr.is_alive():
+                thr.join(1)
+        _logger.info('{0} stopped'.format(group_name))
+
+    # start agents as threads in the current process
+    def start_agents(self, agent_names):
+        # thread list
+        thrList = []
+        # Credential Manager
+        if 'credmanager' in agent_names:
+            from pandaharvester.harvesterbody.cred_manager import CredManager
+            thr = CredManager(single_mode=self.singleMode)
+            thr.set_stop_event(self.stopEvent)
+            thr.execute()
+            thr.start()
+            thrList.append(thr)
+        # Command manager
+        if 'commandmanager' in agent_names:
+            from pandaharvester.harvesterbody.command_manager import CommandManager
+            thr = CommandManager(self.communicatorPool, self.queueConfigMapper, single_mode=self.singleMode)
+            thr.set_stop_event(self.stopEvent)
+            thr.start()
+            thrList.append(thr)
+        # Cacher
+        if 'cacher' in agent_names:
+            from pandaharvester.harvesterbody.cacher import Cacher
+            thr = Cacher(self.communicatorPool, single_mode=self.singleMode)
+            thr.set_stop_event(self.stopEvent)
+            thr.execute(force_update=True, skip_lock=True)
+            thr.start()
+            thrList.append(thr)
+        # Watcher
+        if 'watcher' in agent_names:
+            from pandaharvester.harvesterbody.watcher import Watcher
+            thr = Watcher(single_mode=self.singleMode)
+            thr.set_stop_event(self.stopEvent)
+            thr.start()
+            thrList.append(thr)
+        # Job Fetcher
+        if 'jobfetcher' in agent_names:
+            from pandaharvester.harvesterbody.job_fetcher import JobFetcher
+            nThr = harvester_config.jobfetcher.nThreads
+            for iThr in range(nThr):
+                thr = JobFetcher(self.communicatorPool,
+                                 self.queueConfigMapper,
+                                 single_mode=self.singleMode)
+                thr.set_stop_event(self.stopEvent)
+                thr.start()
+                thrList.append(thr)
+        # Propagator
+        if 'propagator' in agent_names:
+            from pandaharvester.harvesterbody.propagator import Propagator
+            nThr = harvester_config.propagator.nThreads
+            for iThr in range(nThr):
+                thr = Propagator(self.communicatorPool,
+                                 self.queueConfigMapper,
+                                 single_mode=self.singleMode)
+                thr.set_stop_event(self.stopEvent)
+                thr.start()
+                thrList.append(thr)
+        # Monitor
+        if 'monitor' in agent_names:
+            from pandaharvester.harvesterbody.monitor import Monitor
+            nThr = harvester_config.monitor.nThreads
+            for iThr in range(nThr):
+                thr = Monitor(self.queueConfigMapper,
+                              single_mode=self.singleMode)
+                thr.set_stop_event(self.stopEvent)
+                thr.start()
+                thrList.append(thr)
+        # Preparator
+        if 'preparator' in agent_names:
+            from pandaharvester.harvesterbody.preparator import Preparator
+            nThr = harvester_config.preparator.nThreads
+            for iThr in range(nThr):
+                thr = Preparator(self.communicatorPool,
+                                 self.queueConfigMapper,
+                                 single_mode=self.singleMode)
+                thr.set_stop_event(self.stopEvent)
+                thr.start()
+                thrList.append(thr)
+        # Submitter
+        if 'submitter' in agent_names:
+            from pandaharvester.harvesterbody.submitter import Submitter
+            nThr = harvester_config.submitter.nThreads
+            for iThr in range(nThr):
+                thr = Submitter(self.queueConfigMapper,
+                                single_mode=self.singleMode)
+                thr.set_stop_event(self.stopEvent)
+                thr.start()
+                thrList.append(thr)
+        # Stager
+        if 'stager' in agent_names:
+            from pandaharvester.harvesterbody.stager import Stager
+            nThr = harvester_config.stager.nThreads
+            for iThr in range(nThr):
+                thr = Stager(self.queueConfigMapper,
+                             single_mode=self.singleMode)
+                thr.set_stop_event(self.stopEvent)
+                thr.start()
+                thrList.append(thr)
+        # EventFeeder
+        if 'eventfeeder' in agent_names:
+            from pandaharvester.harvesterbody.event_feeder import EventFeeder
+            nThr = harvester_config.eventfeeder.nThreads
+            for iThr in range(nThr):
+                thr = EventFeeder(self.communicatorPool,
+                                  self.queueConfigMapper,
+                                  single_mode=self.singleMode)
+                thr.set_stop_event(self.stopEvent)
+                thr.start()
+                thrList.append(thr)
+        # Sweeper
+        if 'sweeper' in agent_names:
+            from pandaharvester.harvesterbody.sweeper import Sweeper
+            nThr = harvester_config.sweeper.nThreads
+            for iThr in range(nThr):
+                thr = Sweeper(self.queueConfigMapper,
+                              single_mode=self.singleMode)
+                thr.set_stop_event(self.stopEvent)
+                thr.start()
+                thrList.append(thr)
+        # Service monitor
+        if 'servicemonitor' in agent_names:
+            try:
+                sm_active = harvester_config.service_monitor.active
+            except:
+                sm_active = False
+            if sm_active:
+                from pandaharvester.harvesterbody.service_monitor import ServiceMonitor
+                thr = ServiceMonitor(options.pid, single_mode=self.singleMode)
+                thr.set_stop_event(self.stopEvent)
+                thr.start()
+                thrList.append(thr)
+        return thrList
+
+
+# entry point of child processes for agent groups
+def run_agent_process(group_name, agent_names, parent_pid, single_mode, pid_file):
+    global options
+    if options is None:
+        options = argparse.Namespace(pid=pid_file)
+    master = Master(single_mode=single_mode, stop_event=threading.Event(), child_process=True)
+    master.run_agent_process(group_name, agent_names, parent_pid)
 
 
 # dummy context
@@ -407,6 +551,9 @@ def main(daemon_mode=True):
 
 if __name__ == "__main__":
     main()
+elif __name__ == "__mp_main__":
+    # imported in child processes of agent groups
+    pass
 else:
     # started by WSGI
     with master_lock:
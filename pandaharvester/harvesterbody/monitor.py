@@ -3,6 +3,9 @@ import datetime
 import collections
 import random
 import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from future.utils import iteritems
 
 from pandaharvester.harvesterconfig import harvester_config
@@ -14,6 +17,7 @@ from pandaharvester.harvesterbody.agent_base import AgentBase
 from pandaharvester.harvestercore.pilot_errors import PilotErrors
 from pandaharvester.harvestercore.fifos import MonitorFIFO, MonitorEventFIFO
 from pandaharvester.harvestermisc.apfmon import Apfmon
+from pandaharvester.harvestermessenger.base_messenger import inspect_one_worker
 
 # logger
 _logger = core_utils.setup_logger('monitor')
@@ -39,6 +43,19 @@ class Monitor(AgentBase):
             for pluginConf in harvester_config.monitor.eventBasedPlugins:
                 pluginFactory = PluginFactory()
                 self.eventBasedMonCoreList.append(pluginFactory.get_plugin(pluginConf))
+        # executor to check queues concurrently
+        self.nQueueThreads = getattr(harvester_config.monitor, 'nQueueThreads', 1)
+        self.maxQueueThreadsPerPlugin = getattr(harvester_config.monitor, 'maxQueueThreadsPerPlugin', None)
+        self.queueCheckTimeout = getattr(harvester_config.monitor, 'queueCheckTimeout', None)
+        if self.nQueueThreads > 1:
+            self.queueExecutor = ThreadPoolExecutor(self.nQueueThreads)
+        else:
+            self.queueExecutor = None
+        self.pluginSemaphoreMap = {}
+        self.pluginSemaphoreMapLock = threading.Lock()
+        # (queueName, configID) of timed-out checks still running, not to check the queues concurrently
+        self.busyQueueKeys = set()
+        self.busyQueueKeysLock = threading.Lock()
 
     # main loop
     def run(self):
@@ -52,6 +69,9 @@ class Monitor(AgentBase):
         fifoCheckDuration = getattr(harvester_config.monitor, 'fifoCheckDuration', 30)
         fifoMaxWorkersPerChunk = getattr(harvester_config.monitor, 'fifoMaxWorkersPerChunk', 500)
         fifoProtectiveDequeue = getattr(harvester_config.monitor, 'fifoProtectiveDequeue', True)
+        fifoBatchDequeue = getattr(harvester_config.monitor, 'fifoBatchDequeue', False)
+        fifoMaxWorkersToDequeue = getattr(harvester_config.monitor, 'fifoMaxWorkersToDequeue', fifoMaxWorkersPerChunk)
+        fifoMaxChunksToDequeue = max(1, fifoMaxWorkersToDequeue // fifoMaxWorkersPerChunk)
         eventBasedCheckInterval = getattr(harvester_config.monitor, 'eventBasedCheckInterval', 300)
         eventBasedTimeWindow = getattr(harvester_config.monitor, 'eventBasedTimeWindow', 450)
         eventBasedCheckMaxEvents = getattr(harvester_config.monitor, 'eventBasedCheckMaxEvents', 500)
@@ -83,27 +103,30 @@ class Monitor(AgentBase):
                                                                        lockedBy)
                 mainLog.debug('got {0} queues'.format(len(workSpecsPerQueue)))
                 # loop over all workers
+                task_list = []
                 for queueName, configIdWorkSpecs in iteritems(workSpecsPerQueue):
                     for configID, workSpecsList in iteritems(configIdWorkSpecs):
-                        retVal = self.monitor_agent_core(lockedBy, queueName, workSpecsList, config_id=configID, check_source='DB')
-                        if monitor_fifo.enabled and retVal is not None:
-                            workSpecsToEnqueue, workSpecsToEnqueueToHead, timeNow_timestamp, fifoCheckInterval = retVal
-                            if workSpecsToEnqueue:
-                                mainLog.debug('putting workers to FIFO')
-                                try:
-                                    score = fifoCheckInterval + timeNow_timestamp
-                                    monitor_fifo.put((queueName, workSpecsToEnqueue), score)
-                                    mainLog.info('put workers of {0} to FIFO with score {1}'.format(queueName, score))
-                                except Exception as errStr:
-                                    mainLog.error('failed to put object from FIFO: {0}'.format(errStr))
-                            if workSpecsToEnqueueToHead:
-                                mainLog.debug('putting workers to FIFO head')
-                                try:
-                                    score = fifoCheckInterval - timeNow_timestamp
-                                    monitor_fifo.put((queueName, workSpecsToEnqueueToHead), score)
-                                    mainLog.info('put workers of {0} to FIFO with score {1}'.format(queueName, score))
-                                except Exception as errStr:
-                                    mainLog.error('failed to put object from FIFO head: {0}'.format(errStr))
+                        task_list.append((queueName, configID, workSpecsList))
+                retValList = self.monitor_agent_core_many(lockedBy, task_list, check_source='DB')
+                for (queueName, configID, workSpecsList), retVal in zip(task_list, retValList):
+                    if monitor_fifo.enabled and retVal is not None:
+                        workSpecsToEnqueue, workSpecsToEnqueueToHead, timeNow_timestamp, fifoCheckInterval = retVal
+                        if workSpecsToEnqueue:
+                            mainLog.debug('putting workers to FIFO')
+                            try:
+                                score = fifoCheckInterval + timeNow_timestamp
+                                monitor_fifo.put((queueName, workSpecsToEnqueue), score)
+                                mainLog.info('put workers of {0} to FIFO with score {1}'.format(queueName, score))
+                            except Exception as errStr:
+                                mainLog.error('failed to put object from FIFO: {0}'.format(errStr))
+                        if workSpecsToEnqueueToHead:
+                            mainLog.debug('putting workers to FIFO head')
+                            try:
+                                score = fifoCheckInterval - timeNow_timestamp
+                                monitor_fifo.put((queueName, workSpecsToEnqueueToHead), score)
+                                mainLog.info('put workers of {0} to FIFO with score {1}'.format(queueName, score))
+                            except Exception as errStr:
+                                mainLog.error('failed to put object from FIFO head: {0}'.format(errStr))
                 last_DB_cycle_timestamp = time.time()
                 if sw_db.get_elapsed_time_in_sec() > harvester_config.monitor.lockInterval:
                     mainLog.warning('a single DB cycle was longer than lockInterval ' + sw_db.get_elapsed_time())
@@ -124,6 +147,7 @@ class Monitor(AgentBase):
                 remaining_obj_to_enqueue_dict = {}
                 remaining_obj_to_enqueue_to_head_dict = {}
                 n_chunk_peeked_stat, sum_overhead_time_stat = 0, 0.0
+                n_chunks_checked_stat, n_workers_checked_stat = 0, 0
                 # go get workers
                 if self.monitor_event_fifo.enabled:
                     # run with workers reported from plugin (event-based check)
@@ -156,81 +180,142 @@ class Monitor(AgentBase):
                         last_event_dispose_timestamp = time.time()
                 if to_run_fifo_check:
                     # run with workers from FIFO
+                    sw_fifo_run = core_utils.get_stopwatch()
                     while time.time() < last_fifo_cycle_timestamp + fifoCheckDuration:
                         sw.reset()
                         n_loops += 1
-                        retVal, overhead_time = monitor_fifo.to_check_workers()
+                        obj_gotten_list = []
+                        if fifoBatchDequeue:
+                            # dequeue all ripe chunks up to the budget at once
+                            try:
+                                obj_gotten_list = monitor_fifo.getmany(maxscore=time.time(),
+                                                                       count=fifoMaxChunksToDequeue,
+                                                                       protective=fifoProtectiveDequeue,
+                                                                       decode_item=False)
+                            except Exception as errStr:
+                                mainLog.error('failed to get objects from FIFO: {0}'.format(errStr))
+                            if obj_gotten_list:
+                                retVal, overhead_time = True, None
+                                if obj_gotten_list[0].score >= 0:
+                                    overhead_time = time.time() - obj_gotten_list[0].score
+                                mainLog.debug('got {0} chunks from FIFO'.format(len(obj_gotten_list)))
+                            else:
+                                retVal, overhead_time = False, monitor_fifo.to_check_workers()[1]
+                        else:
+                            retVal, overhead_time = monitor_fifo.to_check_workers()
                         if overhead_time is not None:
                             n_chunk_peeked_stat += 1
                             sum_overhead_time_stat += overhead_time
                         if retVal:
-                            # check fifo size
-                            fifo_size = monitor_fifo.size()
-                            mainLog.debug('FIFO size is {0}'.format(fifo_size))
-                            mainLog.debug('starting run with FIFO')
-                            try:
-                                obj_gotten = monitor_fifo.get(timeout=1, protective=fifoProtectiveDequeue)
-                            except Exception as errStr:
-                                mainLog.error('failed to get object from FIFO: {0}'.format(errStr))
-                            else:
-                                if obj_gotten is not None:
-                                    sw_fifo = core_utils.get_stopwatch()
-                                    if fifoProtectiveDequeue:
-                                        obj_dequeued_id_list.append(obj_gotten.id)
+                            if not fifoBatchDequeue:
+                                # check fifo size
+                                fifo_size = monitor_fifo.size()
+                                mainLog.debug('FIFO size is {0}'.format(fifo_size))
+                                mainLog.debug('starting run with FIFO')
+                                try:
+                                    obj_gotten = monitor_fifo.get(timeout=1, protective=fifoProtectiveDequeue)
+                                except Exception as errStr:
+                                    mainLog.error('failed to get object from FIFO: {0}'.format(errStr))
+                                else:
+                                    if obj_gotten is not None:
+                                        obj_gotten_list = [obj_gotten]
+                                    else:
+                                        mainLog.debug('got nothing in FIFO')
+                            # decode chunks and fill pandaid_list of workers
+                            chunk_list = []
+                            for obj_gotten in obj_gotten_list:
+                                if fifoBatchDequeue:
+                                    queueName, workSpecsList = monitor_fifo.decode(obj_gotten.item)
+                                else:
                                     queueName, workSpecsList = obj_gotten.item
-                                    mainLog.debug('got a chunk of {0} workers of {1} from FIFO'.format(len(workSpecsList), queueName) + sw.get_elapsed_time())
-                                    sw.reset()
-                                    configID = None
-                                    for workSpecs in workSpecsList:
-                                        if configID is None and len(workSpecs) > 0:
-                                            configID = workSpecs[0].configID
-                                        for workSpec in workSpecs:
-                                            if workSpec.pandaid_list is None:
-                                                _jobspec_list = workSpec.get_jobspec_list()
-                                                if _jobspec_list is not None:
-                                                    workSpec.pandaid_list = [j.PandaID for j in workSpec.get_jobspec_list()]
-                                                else:
-                                                    workSpec.pandaid_list = []
-                                                workSpec.force_update('pandaid_list')
+                                configID = None
+                                for workSpecs in workSpecsList:
+                                    if configID is None and len(workSpecs) > 0:
+                                        configID = workSpecs[0].configID
+                                    for workSpec in workSpecs:
+                                        if workSpec.pandaid_list is None:
+                                            _jobspec_list = workSpec.get_jobspec_list()
+                                            if _jobspec_list is not None:
+                                                workSpec.pandaid_list = [j.PandaID for j in workSpec.get_jobspec_list()]
+                                            else:
+                                                workSpec.pandaid_list = []
+                                            workSpec.force_update('pandaid_list')
+                                chunk_list.append((queueName, configID, workSpecsList))
+                            # check all chunks concurrently
+                            retValList = None
+                            unchecked_indices = set()
+                            if self.queueExecutor is not None and len(chunk_list) > 1:
+                                retValList = self.monitor_agent_core_many(lockedBy, chunk_list, from_fifo=True,
+                                                                          check_source='FIFO',
+                                                                          unchecked_indices=unchecked_indices)
+                            for i_obj, obj_gotten in enumerate(obj_gotten_list):
+                                if i_obj in unchecked_indices:
+                                    # give back chunks timed out or skipped
+                                    self.give_back_chunks(monitor_fifo, [obj_gotten], fifoProtectiveDequeue, mainLog)
+                                    continue
+                                sw_fifo = core_utils.get_stopwatch()
+                                if fifoProtectiveDequeue:
+                                    obj_dequeued_id_list.append(obj_gotten.id)
+                                queueName, configID, workSpecsList = chunk_list[i_obj]
+                                mainLog.debug('got a chunk of {0} workers of {1} from FIFO'.format(len(workSpecsList), queueName) + sw.get_elapsed_time())
+                                sw.reset()
+                                if retValList is not None:
+                                    retVal = retValList[i_obj]
+                                else:
                                     retVal = self.monitor_agent_core(lockedBy, queueName, workSpecsList, from_fifo=True,
                                                                      config_id=configID, check_source='FIFO')
-                                    if retVal is not None:
-                                        workSpecsToEnqueue, workSpecsToEnqueueToHead, timeNow_timestamp, fifoCheckInterval = retVal
-                                        qc_key = (queueName, configID)
-                                        try:
-                                            if len(obj_to_enqueue_dict[qc_key][0]) + len(workSpecsToEnqueue) <= fifoMaxWorkersPerChunk:
-                                                obj_to_enqueue_dict[qc_key][0].extend(workSpecsToEnqueue)
-                                                obj_to_enqueue_dict[qc_key][1] = max(obj_to_enqueue_dict[qc_key][1], timeNow_timestamp)
-                                                obj_to_enqueue_dict[qc_key][2] = max(obj_to_enqueue_dict[qc_key][2], fifoCheckInterval)
-                                            else:
-                                                to_break = True
-                                                remaining_obj_to_enqueue_dict[qc_key] = [workSpecsToEnqueue, timeNow_timestamp, fifoCheckInterval]
-                                        except Exception as errStr:
-                                            mainLog.error('failed to gather workers for FIFO: {0}'.format(errStr))
+                                n_chunks_checked_stat += 1
+                                n_workers_checked_stat += sum(len(workSpecs) for workSpecs in workSpecsList)
+                                if retVal is not None:
+                                    workSpecsToEnqueue, workSpecsToEnqueueToHead, timeNow_timestamp, fifoCheckInterval = retVal
+                                    qc_key = (queueName, configID)
+                                    try:
+                                        if len(obj_to_enqueue_dict[qc_key][0]) + len(workSpecsToEnqueue) <= fifoMaxWorkersPerChunk:
+                                            obj_to_enqueue_dict[qc_key][0].extend(workSpecsToEnqueue)
+                                            obj_to_enqueue_dict[qc_key][1] = max(obj_to_enqueue_dict[qc_key][1], timeNow_timestamp)
+                                            obj_to_enqueue_dict[qc_key][2] = max(obj_to_enqueue_dict[qc_key][2], fifoCheckInterval)
+                                        elif qc_key in remaining_obj_to_enqueue_dict:
+                                            # more chunks already checked concurrently
+                                            remaining_obj_to_enqueue_dict[qc_key][0].extend(workSpecsToEnqueue)
+                                            remaining_obj_to_enqueue_dict[qc_key][1] = max(remaining_obj_to_enqueue_dict[qc_key][1], timeNow_timestamp)
+                                            remaining_obj_to_enqueue_dict[qc_key][2] = max(remaining_obj_to_enqueue_dict[qc_key][2], fifoCheckInterval)
+                                        else:
                                             to_break = True
-                                        try:
-                                            if len(obj_to_enqueue_to_head_dict[qc_key][0]) + len(workSpecsToEnqueueToHead) <= fifoMaxWorkersPerChunk:
-                                                obj_to_enqueue_to_head_dict[qc_key][0].extend(workSpecsToEnqueueToHead)
-                                                obj_to_enqueue_to_head_dict[qc_key][1] = max(obj_to_enqueue_to_head_dict[qc_key][1], timeNow_timestamp)
-                                                obj_to_enqueue_to_head_dict[qc_key][2] = max(obj_to_enqueue_to_head_dict[qc_key][2], fifoCheckInterval)
-                                            else:
-                                                to_break = True
-                                                remaining_obj_to_enqueue_to_head_dict[qc_key] = [workSpecsToEnqueueToHead, timeNow_timestamp, fifoCheckInterval]
-                                        except Exception as errStr:
-                                            mainLog.error('failed to gather workers for FIFO head: {0}'.format(errStr))
+                                            remaining_obj_to_enqueue_dict[qc_key] = [workSpecsToEnqueue, timeNow_timestamp, fifoCheckInterval]
+                                    except Exception as errStr:
+                                        mainLog.error('failed to gather workers for FIFO: {0}'.format(errStr))
+                                        to_break = True
+                                    try:
+                                        if len(obj_to_enqueue_to_head_dict[qc_key][0]) + len(workSpecsToEnqueueToHead) <= fifoMaxWorkersPerChunk:
+                                            obj_to_enqueue_to_head_dict[qc_key][0].extend(workSpecsToEnqueueToHead)
+                                            obj_to_enqueue_to_head_dict[qc_key][1] = max(obj_to_enqueue_to_head_dict[qc_key][1], timeNow_timestamp)
+                                            obj_to_enqueue_to_head_dict[qc_key][2] = max(obj_to_enqueue_to_head_dict[qc_key][2], fifoCheckInterval)
+                                        elif qc_key in remaining_obj_to_enqueue_to_head_dict:
+                                            # more chunks already checked concurrently
+                                            remaining_obj_to_enqueue_to_head_dict[qc_key][0].extend(workSpecsToEnqueueToHead)
+                                            remaining_obj_to_enqueue_to_head_dict[qc_key][1] = max(remaining_obj_to_enqueue_to_head_dict[qc_key][1], timeNow_timestamp)
+                                            remaining_obj_to_enqueue_to_head_dict[qc_key][2] = max(remaining_obj_to_enqueue_to_head_dict[qc_key][2], fifoCheckInterval)
+                                        else:
                                             to_break = True
-                                        mainLog.debug('checked {0} workers from FIFO'.format(len(workSpecsList)) + sw.get_elapsed_time())
-                                    else:
-                                        mainLog.debug('monitor_agent_core returned None. Skipped putting to FIFO')
-                                    if sw_fifo.get_elapsed_time_in_sec() > harvester_config.monitor.lockInterval:
-                                        mainLog.warning('a single FIFO cycle was longer than lockInterval ' + sw_fifo.get_elapsed_time())
-                                    else:
-                                        mainLog.debug('done a FIFO cycle' + sw_fifo.get_elapsed_time())
-                                        n_loops_hit += 1
-                                    if to_break:
-                                        break
+                                            remaining_obj_to_enqueue_to_head_dict[qc_key] = [workSpecsToEnqueueToHead, timeNow_timestamp, fifoCheckInterval]
+                                    except Exception as errStr:
+                                        mainLog.error('failed to gather workers for FIFO head: {0}'.format(errStr))
+                                        to_break = True
+                                    mainLog.debug('checked {0} workers from FIFO'.format(len(workSpecsList)) + sw.get_elapsed_time())
                                 else:
-                                    mainLog.debug('got nothing in FIFO')
+                                    mainLog.debug('monitor_agent_core returned None. Skipped putting to FIFO')
+                                if sw_fifo.get_elapsed_time_in_sec() > harvester_config.monitor.lockInterval:
+                                    mainLog.warning('a single FIFO cycle was longer than lockInterval ' + sw_fifo.get_elapsed_time())
+                                else:
+                                    mainLog.debug('done a FIFO cycle' + sw_fifo.get_elapsed_time())
+                                    n_loops_hit += 1
+                                if to_break and retValList is None:
+                                    # give back chunks dequeued but not checked
+                                    self.give_back_chunks(monitor_fifo, obj_gotten_list[i_obj+1:], fifoProtectiveDequeue,
+                                                          mainLog)
+                                    break
+                            if to_break:
+                                break
                         else:
                             mainLog.debug('workers in FIFO too young to check. Skipped')
                             if self.singleMode:
@@ -240,35 +325,40 @@ class Monitor(AgentBase):
                             else:
                                 time.sleep(max(fifoCheckDuration*random.uniform(0.1, 1), adjusted_sleepTime))
                     mainLog.debug('run {0} loops, including {1} FIFO cycles'.format(n_loops, n_loops_hit))
+                    time_fifo_run = sw_fifo_run.get_elapsed_time_in_sec(precise=True)
+                    mainLog.info('checked {0} workers in {1} chunks from FIFO in {2:.3f} sec ({3:.1f} workers/sec)'.format(
+                                    n_workers_checked_stat, n_chunks_checked_stat, time_fifo_run,
+                                    n_workers_checked_stat / time_fifo_run if time_fifo_run > 0 else 0.))
                 # enqueue to fifo
                 sw.reset()
                 n_chunk_put = 0
                 mainLog.debug('putting worker chunks to FIFO')
-                for _dct in (obj_to_enqueue_dict, remaining_obj_to_enqueue_dict):
+                obj_score_list = []
+                for _dct, head_offset in ((obj_to_enqueue_dict, 0),
+                                          (remaining_obj_to_enqueue_dict, 0),
+                                          (obj_to_enqueue_to_head_dict, 2**32),
+                                          (remaining_obj_to_enqueue_to_head_dict, 2**32)):
                     for ((queueName, configID), obj_to_enqueue) in iteritems(_dct):
                         try:
                             workSpecsToEnqueue, timeNow_timestamp, fifoCheckInterval = obj_to_enqueue
                             if workSpecsToEnqueue:
-                                score = fifoCheckInterval + timeNow_timestamp
-                                monitor_fifo.put((queueName, workSpecsToEnqueue), score)
-                                n_chunk_put += 1
+                                score = fifoCheckInterval + timeNow_timestamp - head_offset
+                                if fifoBatchDequeue:
+                                    obj_score_list.append(((queueName, workSpecsToEnqueue), score))
+                                else:
+                                    monitor_fifo.put((queueName, workSpecsToEnqueue), score)
+                                    n_chunk_put += 1
                                 mainLog.info('put a chunk of {0} workers of {1} to FIFO with score {2}'.format(
                                                 len(workSpecsToEnqueue), queueName, score))
                         except Exception as errStr:
                             mainLog.error('failed to put object from FIFO: {0}'.format(errStr))
-                mainLog.debug('putting worker chunks to FIFO head')
-                for _dct in (obj_to_enqueue_to_head_dict, remaining_obj_to_enqueue_to_head_dict):
-                    for ((queueName, configID), obj_to_enqueue_to_head) in iteritems(_dct):
-                        try:
-                            workSpecsToEnqueueToHead, timeNow_timestamp, fifoCheckInterval = obj_to_enqueue_to_head
-                            if workSpecsToEnqueueToHead:
-                                score = fifoCheckInterval + timeNow_timestamp - 2**32
-                                monitor_fifo.put((queueName, workSpecsToEnqueueToHead), score)
-                                n_chunk_put += 1
-                                mainLog.info('put a chunk of {0} workers of {1} to FIFO with score {2}'.format(
-                                                len(workSpecsToEnqueueToHead), queueName, score))
-                        except Exception as errStr:
-                            mainLog.error('failed to put object from FIFO head: {0}'.format(errStr))
+                if obj_score_list:
+                    # put all chunks in one go
+                    try:
+                        monitor_fifo.putmany(obj_score_list)
+                        n_chunk_put += len(obj_score_list)
+                    except Exception as errStr:
+                        mainLog.error('failed to put objects to FIFO: {0}'.format(errStr))
                 # delete protective dequeued objects
                 if fifoProtectiveDequeue and len(obj_dequeued_id_list) > 0:
                     monitor_fifo.delete(ids=obj_dequeued_id_list)
@@ -290,8 +380,142 @@ class Monitor(AgentBase):
                 mainLog.debug('terminated')
                 return
 
+    # get semaphore to limit the number of queues checked concurrently with the same monitor plugin
+    def get_plugin_semaphore(self, queue_name, config_id):
+        if not self.maxQueueThreadsPerPlugin:
+            return None
+        try:
+            monConf = self.queueConfigMapper.get_queue(queue_name, config_id).monitor
+            pluginKey = '{0}.{1}'.format(monConf['module'], monConf['name'])
+        except Exception:
+            pluginKey = None
+        with self.pluginSemaphoreMapLock:
+            if pluginKey not in self.pluginSemaphoreMap:
+                self.pluginSemaphoreMap[pluginKey] = threading.BoundedSemaphore(self.maxQueueThreadsPerPlugin)
+            return self.pluginSemaphoreMap[pluginKey]
+
+    # run monitor_agent_core for a list of (queueName, configID, workSpecsList) and return results in the same order.
+    # queues are checked concurrently when nQueueThreads > 1. Indices of tasks which timed out or were skipped
+    # since the previous check of the queue is still running are added to unchecked_indices
+    def monitor_agent_core_many(self, lockedBy, task_list, from_fifo=False, check_source=None,
+                                unchecked_indices=None):
+        if unchecked_indices is None:
+            unchecked_indices = set()
+        if self.queueExecutor is None or len(task_list) <= 1:
+            return [self.monitor_agent_core(lockedBy, queueName, workSpecsList, from_fifo=from_fifo,
+                                            config_id=configID, check_source=check_source)
+                    for queueName, configID, workSpecsList in task_list]
+        tmpLog = self.make_logger(_logger, 'id={0}'.format(lockedBy), method_name='monitor_agent_core_many')
+        cancelEventMap = {}
+        finishedTasks = set()
+        # deadlines are measured from submission, including time waiting for the executor and the plugin semaphore
+        if self.queueCheckTimeout is None:
+            deadline = None
+        else:
+            deadline = time.time() + self.queueCheckTimeout
+
+        def _check_queue(i_task, queueName, configID, workSpecsList):
+            semaphore = self.get_plugin_semaphore(queueName, configID)
+            gotSemaphore = False
+            try:
+                if semaphore is not None:
+                    # poll not to wait for the semaphore beyond the deadline
+                    while not semaphore.acquire(False):
+                        if cancelEventMap[i_task].is_set() or (deadline is not None and time.time() > deadline):
+                            tmpLog.warning('gave up waiting for the plugin of {0} configID={1}'.format(
+                                            queueName, configID))
+                            cancelEventMap[i_task].set()
+                            return None
+                        time.sleep(0.1)
+                    gotSemaphore = True
+                return self.monitor_agent_core(lockedBy, queueName, workSpecsList, from_fifo=from_fifo,
+                                               config_id=configID, check_source=check_source,
+                                               cancel_event=cancelEventMap[i_task])
+            finally:
+                if gotSemaphore:
+                    semaphore.release()
+                with self.busyQueueKeysLock:
+                    finishedTasks.add(i_task)
+                    if cancelEventMap[i_task].is_set():
+                        self.busyQueueKeys.discard((queueName, configID))
+        futureList = []
+        for i_task, task in enumerate(task_list):
+            queueName, configID = task[:2]
+            with self.busyQueueKeysLock:
+                isBusy = (queueName, configID) in self.busyQueueKeys
+            if isBusy:
+                tmpLog.warning('skipped {0} configID={1} since the previous check is still running'.format(
+                                queueName, configID))
+                futureList.append(None)
+                continue
+            cancelEventMap[i_task] = threading.Event()
+            futureList.append(self.queueExecutor.submit(_check_queue, i_task, *task))
+        retValList = []
+        hasTimedOut = False
+        for i_task, future in enumerate(futureList):
+            queueName, configID = task_list[i_task][:2]
+            retVal = None
+            isUnchecked = future is None
+            while future is not None:
+                try:
+                    if deadline is None:
+                        retVal = future.result()
+                    else:
+                        retVal = future.result(timeout=max(deadline - time.time(), 0))
+                    break
+                except FuturesTimeoutError:
+                    isUnchecked = True
+                    if future.cancel():
+                        # not started yet
+                        tmpLog.warning('timed out to wait for checking {0} configID={1} after {2} sec. Skipped'.format(
+                                        queueName, configID, self.queueCheckTimeout))
+                        break
+                    with self.busyQueueKeysLock:
+                        isFinished = i_task in finishedTasks
+                        if not isFinished:
+                            # cancel DB updates in the task and block the queue until it ends
+                            self.busyQueueKeys.add((queueName, configID))
+                            cancelEventMap[i_task].set()
+                    if isFinished:
+                        # just finished
+                        isUnchecked = False
+                        try:
+                            retVal = future.result()
+                        except Exception as errStr:
+                            tmpLog.error('failed to check {0} configID={1} with {2}'.format(queueName, configID, errStr))
+                        break
+                    tmpLog.warning('timed out to check {0} configID={1} after {2} sec. Skipped'.format(
+                                    queueName, configID, self.queueCheckTimeout))
+                    hasTimedOut = True
+                    break
+                except Exception as errStr:
+                    tmpLog.error('failed to check {0} configID={1} with {2}'.format(queueName, configID, errStr))
+                    break
+            if isUnchecked or (i_task in cancelEventMap and cancelEventMap[i_task].is_set()):
+                unchecked_indices.add(i_task)
+            retValList.append(retVal)
+        if hasTimedOut:
+            # fresh executor not to let timed-out threads occupy workers
+            self.queueExecutor.shutdown(wait=False)
+            self.queueExecutor = ThreadPoolExecutor(self.nQueueThreads)
+        return retValList
+
+    # give back chunks which were dequeued but not checked
+    def give_back_chunks(self, monitor_fifo, obj_list, protective, tmp_log):
+        if not obj_list:
+            return
+        try:
+            if protective:
+                monitor_fifo.restore(ids=[obj.id for obj in obj_list])
+            else:
+                monitor_fifo.putmany([(obj.item, obj.score) for obj in obj_list], encode_item=False)
+            tmp_log.debug('gave back {0} chunks to FIFO'.format(len(obj_list)))
+        except Exception as errStr:
+            tmp_log.error('failed to give back chunks to FIFO: {0}'.format(errStr))
+
     # core of monitor agent to check workers in workSpecsList of queueName
-    def monitor_agent_core(self, lockedBy, queueName, workSpecsList, from_fifo=False, config_id=None, check_source=None):
+    def monitor_agent_core(self, lockedBy, queueName, workSpecsList, from_fifo=False, config_id=None, check_source=None,
+                           cancel_event=None):
         tmpQueLog = self.make_logger(_logger, 'id={0} queue={1}'.format(lockedBy, queueName),
                                      method_name='run')
         # check queue
@@ -327,6 +551,9 @@ class Monitor(AgentBase):
         allWorkers = [item for sublist in workSpecsList for item in sublist]
         tmpQueLog.debug('checking {0} workers'.format(len(allWorkers)))
         tmpStat, tmpRetMap = self.check_workers(monCore, messenger, allWorkers, queueConfig, tmpQueLog, from_fifo)
+        if cancel_event is not None and cancel_event.is_set():
+            tmpQueLog.warning('cancelled since timed out. Skipped updating jobs and workers')
+            return None
         if tmpStat:
             # loop over all worker chunks
             tmpQueLog.debug('update jobs and workers')
@@ -432,7 +659,10 @@ class Monitor(AgentBase):
                     tmpQueLog.debug('updating {0} jobs with {1} workers'.format(len(jobSpecs), len(workSpecs)))
                     core_utils.update_job_attributes_with_workers(mapType, jobSpecs, workSpecs,
                                                                   filesToStageOutList, eventsToUpdateList)
-                # update local database
+                # update local database unless cancelled
+                if cancel_event is not None and cancel_event.is_set():
+                    tmpQueLog.warning('cancelled since timed out. Skipped updating jobs and workers')
+                    return None
                 tmpRet = self.dbProxy.update_jobs_workers(jobSpecs, workSpecs, lockedBy, pandaIDsList)
                 if not tmpRet:
                     for workSpec in workSpecs:
@@ -612,6 +842,23 @@ class Monitor(AgentBase):
                 tmp_log.debug('Nothing to be checked with plugin')
                 tmpOut = []
             timeNow = datetime.datetime.utcnow()
+            # expired heartbeat - only when requested in the configuration
+            try:
+                # check if the queue configuration requires checking for worker heartbeat
+                worker_heartbeat_limit = int(queue_config.messenger['worker_heartbeat'])
+            except (AttributeError, KeyError):
+                worker_heartbeat_limit = None
+            # inspect workers with messenger in bulk
+            workersToInspect = [workSpec for workSpec, _ in itertools.chain(
+                                    zip(workersToCheck, tmpOut), thingsToPostProcess)
+                                if workSpec.workerID in retMap]
+            if hasattr(messenger, 'inspect_workers'):
+                inspectMap = messenger.inspect_workers(workersToInspect, worker_heartbeat_limit)
+            else:
+                inspectMap = dict()
+                for workSpec in workersToInspect:
+                    inspectMap[workSpec.workerID] = inspect_one_worker(messenger, workSpec, worker_heartbeat_limit)
+            tmp_log.debug('inspected {0} workers with messenger'.format(len(workersToInspect)))
             for workSpec, (newStatus, diagMessage) in itertools.chain(
                     zip(workersToCheck, tmpOut), thingsToPostProcess):
                 workerID = workSpec.workerID
@@ -634,8 +881,9 @@ class Monitor(AgentBase):
                         else:
                             # use original status
                             newStatus = workSpec.status
+                    inspectRet = inspectMap[workerID]
                     # request kill
-                    if messenger.kill_requested(workSpec):
+                    if inspectRet['killRequested']:
                         tmp_log.debug('kill workerID={0} as requested'.format(workerID))
                         self.dbProxy.kill_worker(workSpec.workerID)
                     # stuck queuing for too long
@@ -646,17 +894,12 @@ class Monitor(AgentBase):
                         self.dbProxy.kill_worker(workSpec.workerID)
                         diagMessage = 'Killed by Harvester due to worker queuing too long' + diagMessage
                         workSpec.set_pilot_error(PilotErrors.ERR_FAILEDBYSERVER, diagMessage)
-                    # expired heartbeat - only when requested in the configuration
-                    try:
-                        # check if the queue configuration requires checking for worker heartbeat
-                        worker_heartbeat_limit = int(queue_config.messenger['worker_heartbeat'])
-                    except (AttributeError, KeyError):
-                        worker_heartbeat_limit = None
+                    # expired heartbeat
                     tmp_log.debug(
                         'workerID={0} heartbeat limit is configured to {1}'.format(workerID,
                                                                                    worker_heartbeat_limit))
                     if worker_heartbeat_limit:
-                        if messenger.is_alive(workSpec, worker_heartbeat_limit):
+                        if inspectRet['isAlive']:
                             tmp_log.debug('heartbeat for workerID={0} is valid'.format(workerID))
                         else:
                             tmp_log.debug('heartbeat for workerID={0} expired: sending kill request'.format(
@@ -665,23 +908,17 @@ class Monitor(AgentBase):
                             diagMessage = 'Killed by Harvester due to worker heartbeat expired. ' + diagMessage
                             workSpec.set_pilot_error(PilotErrors.ERR_FAILEDBYSERVER, diagMessage)
                     # get work attributes
-                    workAttributes = messenger.get_work_attributes(workSpec)
-                    retMap[workerID]['workAttributes'] = workAttributes
+                    retMap[workerID]['workAttributes'] = inspectRet['workAttributes']
                     # get output files
-                    filesToStageOut = messenger.get_files_to_stage_out(workSpec)
-                    retMap[workerID]['filesToStageOut'] = filesToStageOut
+                    retMap[workerID]['filesToStageOut'] = inspectRet['filesToStageOut']
                     # get events to update
                     if workSpec.eventsRequest in [WorkSpec.EV_useEvents, WorkSpec.EV_requestEvents]:
-                        eventsToUpdate = messenger.events_to_update(workSpec)
-                        retMap[workerID]['eventsToUpdate'] = eventsToUpdate
+                        retMap[workerID]['eventsToUpdate'] = inspectRet['eventsToUpdate']
                     # request events
                     if workSpec.eventsRequest == WorkSpec.EV_useEvents:
-                        eventsRequestParams = messenger.events_requested(workSpec)
-                        retMap[workerID]['eventsRequestParams'] = eventsRequestParams
+                        retMap[workerID]['eventsRequestParams'] = inspectRet['eventsRequestParams']
                     # get PandaIDs for pull model
-                    if workSpec.mapType == WorkSpec.MT_NoJob:
-                        pandaIDs = messenger.get_panda_ids(workSpec)
-                    retMap[workerID]['pandaIDs'] = pandaIDs
+                    retMap[workerID]['pandaIDs'] = inspectRet['pandaIDs']
                     # keep original new status
                     retMap[workerID]['monStatus'] = newStatus
                     # set running or idle while there are events to update or files to stage out
@@ -28,7 +28,7 @@ class BaseCommunicator(with_metaclass(abc.ABCMeta, object)):
         return [], ''
 
     # update jobs
-    def update_jobs(self, jobspec_list, id):
+    def update_jobs(self, jobspec_list, id, max_workers=None):
         return [{'StatusCode': 0, 'ErrorDiag': '', 'command': ''}] * len(jobspec_list)
 
     # get events
@@ -10,14 +10,18 @@ except Exception:
     pass
 import sys
 import json
+import time
 import pickle
 import zlib
 import uuid
 import inspect
 import datetime
 import requests
+import requests.adapters
+import threading
 import traceback
 from future.utils import iteritems
+from concurrent.futures import ThreadPoolExecutor
 # TO BE REMOVED for python2.7
 import requests.packages.urllib3
 try:
@@ -42,6 +46,96 @@ class PandaCommunicator(BaseCommunicator):
                 self.useInspect = True
         else:
             self.verbose = False
+        # persistent session
+        self.useSession = True
+        if hasattr(harvester_config.pandacon, 'useSession'):
+            self.useSession = harvester_config.pandacon.useSession
+        try:
+            self.sessionMaxIdle = harvester_config.pandacon.sessionMaxIdle
+        except Exception:
+            self.sessionMaxIdle = 60
+        try:
+            self.sessionMaxRequests = harvester_config.pandacon.sessionMaxRequests
+        except Exception:
+            self.sessionMaxRequests = 1000
+        try:
+            self.sessionPoolSize = harvester_config.pandacon.sessionPoolSize
+        except Exception:
+            self.sessionPoolSize = 2
+        self.defaultCert = (harvester_config.pandacon.cert_file,
+                            harvester_config.pandacon.key_file)
+        # sessions are thread-local since some methods send requests from multiple threads
+        self.sessionLocal = threading.local()
+        # the max number of concurrent requests in update_jobs
+        try:
+            self.updateJobsMaxWorkers = harvester_config.pandacon.updateJobsMaxWorkers
+        except Exception:
+            self.updateJobsMaxWorkers = 1
+        # persistent executor for update_jobs to reuse the thread-local sessions of its threads
+        self.updateJobsExecutor = None
+        self.updateJobsExecutorSize = None
+        self.updateJobsExecutorLock = threading.Lock()
+
+    # get the persistent executor for update_jobs
+    def get_update_jobs_executor(self, max_workers):
+        with self.updateJobsExecutorLock:
+            if self.updateJobsExecutor is None or self.updateJobsExecutorSize != max_workers:
+                if self.updateJobsExecutor is not None:
+                    self.updateJobsExecutor.shutdown(wait=False)
+                self.updateJobsExecutor = ThreadPoolExecutor(max_workers)
+                self.updateJobsExecutorSize = max_workers
+            return self.updateJobsExecutor
+
+    # close the persistent session
+    def close_session(self):
+        session = getattr(self.sessionLocal, 'session', None)
+        if session is not None:
+            try:
+                session.close()
+            except Exception:
+                pass
+        self.sessionLocal.session = None
+        self.sessionLocal.numRequests = 0
+
+    # get the persistent session, which is recycled after too many requests or too long idle time
+    def get_session(self):
+        timeNow = time.time()
+        if getattr(self.sessionLocal, 'session', None) is not None:
+            if (self.sessionMaxRequests and self.sessionLocal.numRequests >= self.sessionMaxRequests) or \
+                    (self.sessionMaxIdle and timeNow - self.sessionLocal.lastUsed > self.sessionMaxIdle):
+                self.close_session()
+        if getattr(self.sessionLocal, 'session', None) is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=self.sessionPoolSize,
+                                                    pool_maxsize=self.sessionPoolSize)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.verify = harvester_config.pandacon.ca_cert
+            session.cert = self.defaultCert
+            self.sessionLocal.session = session
+            self.sessionLocal.numRequests = 0
+        self.sessionLocal.numRequests += 1
+        self.sessionLocal.lastUsed = timeNow
+        return self.sessionLocal.session
+
+    # send POST via the persistent session if possible, otherwise with a one-off connection
+    def send_post(self, url, headers=None, cert=None, **kwargs):
+        if headers is None:
+            headers = {}
+        # the session is bound to the default certificate
+        if self.useSession and (cert is None or tuple(cert) == self.defaultCert):
+            session = self.get_session()
+            try:
+                return session.post(url, headers=headers, **kwargs)
+            except requests.exceptions.ConnectionError:
+                self.close_session()
+                raise
+        headers = dict(headers)
+        headers['Connection'] = 'close'
+        if cert is not None:
+            kwargs['cert'] = cert
+            kwargs['verify'] = harvester_config.pandacon.ca_cert
+        return requests.post(url, headers=headers, **kwargs)
 
     # POST with http
     def post(self, path, data):
@@ -56,11 +150,10 @@ class PandaCommunicator(BaseCommunicator):
             url = '{0}/{1}'.format(harvester_config.pandacon.pandaURL, path)
             if self.verbose:
                 tmpLog.debug('exec={0} URL={1} data={2}'.format(tmpExec, url, str(data)))
-            res = requests.post(url,
-                                data=data,
-                                headers={"Accept": "application/json",
-                                         "Connection": "close"},
-                                timeout=harvester_config.pandacon.timeout)
+            res = self.send_post(url,
+                                 data=data,
+                                 headers={"Accept": "application/json"},
+                                 timeout=harvester_config.pandacon.timeout)
             if self.verbose:
                 tmpLog.debug('exec={0} code={1} return={2}'.format(tmpExec, res.status_code, res.text))
             if res.status_code == 200:
@@ -88,16 +181,13 @@ class PandaCommunicator(BaseCommunicator):
             if self.verbose:
                 tmpLog.debug('exec={0} URL={1} data={2}'.format(tmpExec, url, str(data)))
             if cert is None:
-                cert = (harvester_config.pandacon.cert_file,
-                        harvester_config.pandacon.key_file)
+                cert = self.defaultCert
             sw = core_utils.get_stopwatch()
-            res = requests.post(url,
-                                data=data,
-                                headers={"Accept": "application/json",
-                                         "Connection": "close"},
-                                timeout=harvester_config.pandacon.timeout,
-                                verify=harvester_config.pandacon.ca_cert,
-                                cert=cert)
+            res = self.send_post(url,
+                                 data=data,
+                                 headers={"Accept": "application/json"},
+                                 timeout=harvester_config.pandacon.timeout,
+                                 cert=cert)
             if self.verbose:
                 tmpLog.debug('exec={0} code={1} {3}. return={2}'.format(tmpExec, res.status_code, res.text,
                                                                         sw.get_elapsed_time()))
@@ -127,13 +217,11 @@ class PandaCommunicator(BaseCommunicator):
             if self.verbose:
                 tmpLog.debug('exec={0} URL={1} files={2}'.format(tmpExec, url, files['file'][0]))
             if cert is None:
-                cert = (harvester_config.pandacon.cert_file,
-                        harvester_config.pandacon.key_file)
-            res = requests.post(url,
-                                files=files,
-                                timeout=harvester_config.pandacon.timeout,
-                                verify=harvester_config.pandacon.ca_cert,
-                                cert=cert)
+                cert = self.defaultCert
+            res = self.send_post(url,
+                                 files=files,
+                                 timeout=harvester_config.pandacon.timeout,
+                                 cert=cert)
             if self.verbose:
                 tmpLog.debug('exec={0} code={1} return={2}'.format(tmpExec, res.status_code, res.text))
             if res.status_code == 200:
@@ -195,89 +283,117 @@ class PandaCommunicator(BaseCommunicator):
         return [], errStr
 
     # update jobs
-    def update_jobs(self, jobspec_list, id):
+    def update_jobs(self, jobspec_list, id, max_workers=None):
         sw = core_utils.get_stopwatch()
         tmpLogG = self.make_logger('id={0}'.format(id), method_name='update_jobs')
         tmpLogG.debug('update {0} jobs'.format(len(jobspec_list)))
+        if max_workers is None:
+            max_workers = self.updateJobsMaxWorkers
+        nLookup = 100
+        retList = []
+        if max_workers is None or max_workers <= 1:
+            # update events
+            for jobSpec in jobspec_list:
+                self.update_events_of_job(jobSpec, tmpLogG)
+            # update jobs in bulk
+            for iLookup in range(0, len(jobspec_list), nLookup):
+                retList += self.update_jobs_in_bulk(jobspec_list[iLookup:iLookup+nLookup], id, tmpLogG)
+        else:
+            tmpLogG.debug('use {0} concurrent requests'.format(max_workers))
+            pool = self.get_update_jobs_executor(max_workers)
+            # update events
+            eventFutures = [pool.submit(self.update_events_of_job, jobSpec, tmpLogG)
+                            for jobSpec in jobspec_list]
+
+            # update jobs in bulk once events of the jobs are updated. Event tasks are queued earlier
+            # than bulk tasks so that they are already running when a bulk task waits for them
+            def _update_sub_list(i_lookup):
+                for eventFuture in eventFutures[i_lookup:i_lookup+nLookup]:
+                    eventFuture.result()
+                return self.update_jobs_in_bulk(jobspec_list[i_lookup:i_lookup+nLookup], id, tmpLogG)
+            bulkFutures = [pool.submit(_update_sub_list, iLookup)
+                           for iLookup in range(0, len(jobspec_list), nLookup)]
+            # collect results in the original order
+            for bulkFuture in bulkFutures:
+                retList += bulkFuture.result()
+        tmpLogG.debug('done' + sw.get_elapsed_time())
+        return retList
+
+    # update events of a job
+    def update_events_of_job(self, job_spec, tmp_log):
+        eventRanges, eventSpecs = job_spec.to_event_data(max_events=10000)
+        if eventRanges != []:
+            tmp_log.debug('update {0} events for PandaID={1}'.format(len(eventSpecs), job_spec.PandaID))
+            tmpRet = self.update_event_ranges(eventRanges, tmp_log)
+            if tmpRet['StatusCode'] == 0:
+                for eventSpec, retVal in zip(eventSpecs, tmpRet['Returns']):
+                    if retVal in [True, False] and eventSpec.is_final_status():
+                        eventSpec.subStatus = 'done'
+
+    # update a slice of jobs with one updateJobsInBulk call
+    def update_jobs_in_bulk(self, jobspec_list, id, tmp_log):
         retList = []
-        # update events
+        dataList = []
         for jobSpec in jobspec_list:
-            eventRanges, eventSpecs = jobSpec.to_event_data(max_events=10000)
-            if eventRanges != []:
-                tmpLogG.debug('update {0} events for PandaID={1}'.format(len(eventSpecs), jobSpec.PandaID))
-                tmpRet = self.update_event_ranges(eventRanges, tmpLogG)
-                if tmpRet['StatusCode'] == 0:
-                    for eventSpec, retVal in zip(eventSpecs, tmpRet['Returns']):
-                        if retVal in [True, False] and eventSpec.is_final_status():
-                            eventSpec.subStatus = 'done'
-        # update jobs in bulk
-        nLookup = 100
-        iLookup = 0
-        while iLookup < len(jobspec_list):
-            dataList = []
-            jobSpecSubList = jobspec_list[iLookup:iLookup+nLookup]
-            for jobSpec in jobSpecSubList:
-                data = jobSpec.get_job_attributes_for_panda()
-                data['jobId'] = jobSpec.PandaID
-                data['siteName'] = jobSpec.computingSite
-                data['state'] = jobSpec.get_status()
-                data['attemptNr'] = jobSpec.attemptNr
-                data['jobSubStatus'] = jobSpec.subStatus
-                # change cancelled to failed to be accepted by panda server
-                if data['state'] in ['cancelled', 'missed']:
-                    if jobSpec.is_pilot_closed():
-                        data['jobSubStatus'] = 'pilot_closed'
-                    else:
-                        data['jobSubStatus'] = data['state']
-                    data['state'] = 'failed'
-                if jobSpec.startTime is not None and 'startTime' not in data:
-                    data['startTime'] = jobSpec.startTime.strftime('%Y-%m-%d %H:%M:%S')
-                if jobSpec.endTime is not None and 'endTime' not in data:
-                    data['endTime'] = jobSpec.endTime.strftime('%Y-%m-%d %H:%M:%S')
-                if 'coreCount' not in data and jobSpec.nCore is not None:
-                    data['coreCount'] = jobSpec.nCore
-                if jobSpec.is_final_status() and jobSpec.status == jobSpec.get_status():
-                    if jobSpec.metaData is not None:
-                        data['metaData'] = json.dumps(jobSpec.metaData)
-                    if jobSpec.outputFilesToReport is not None:
-                        data['xml'] = jobSpec.outputFilesToReport
-                dataList.append(data)
-            harvester_id = harvester_config.master.harvester_id
-            tmpData = {'jobList': json.dumps(dataList), 'harvester_id': harvester_id}
-            tmpStat, tmpRes = self.post_ssl('updateJobsInBulk', tmpData)
-            retMaps = None
-            errStr = ''
-            if tmpStat is False:
-                errStr = core_utils.dump_error_message(tmpLogG, tmpRes)
-            else:
-                try:
-                    tmpStat, retMaps = tmpRes.json()
-                    if tmpStat is False:
-                        tmpLogG.error('updateJobsInBulk failed with {0}'.format(retMaps))
-                        retMaps = None
-                except Exception:
-                    errStr = core_utils.dump_error_message(tmpLogG)
-            if retMaps is None:
+            data = jobSpec.get_job_attributes_for_panda()
+            data['jobId'] = jobSpec.PandaID
+            data['siteName'] = jobSpec.computingSite
+            data['state'] = jobSpec.get_status()
+            data['attemptNr'] = jobSpec.attemptNr
+            data['jobSubStatus'] = jobSpec.subStatus
+            # change cancelled to failed to be accepted by panda server
+            if data['state'] in ['cancelled', 'missed']:
+                if jobSpec.is_pilot_closed():
+                    data['jobSubStatus'] = 'pilot_closed'
+                else:
+                    data['jobSubStatus'] = data['state']
+                data['state'] = 'failed'
+            if jobSpec.startTime is not None and 'startTime' not in data:
+                data['startTime'] = jobSpec.startTime.strftime('%Y-%m-%d %H:%M:%S')
+            if jobSpec.endTime is not None and 'endTime' not in data:
+                data['endTime'] = jobSpec.endTime.strftime('%Y-%m-%d %H:%M:%S')
+            if 'coreCount' not in data and jobSpec.nCore is not None:
+                data['coreCount'] = jobSpec.nCore
+            if jobSpec.is_final_status() and jobSpec.status == jobSpec.get_status():
+                if jobSpec.metaData is not None:
+                    data['metaData'] = json.dumps(jobSpec.metaData)
+                if jobSpec.outputFilesToReport is not None:
+                    data['xml'] = jobSpec.outputFilesToReport
+            dataList.append(data)
+        harvester_id = harvester_config.master.harvester_id
+        tmpData = {'jobList': json.dumps(dataList), 'harvester_id': harvester_id}
+        tmpStat, tmpRes = self.post_ssl('updateJobsInBulk', tmpData)
+        retMaps = None
+        errStr = ''
+        if tmpStat is False:
+            errStr = core_utils.dump_error_message(tmp_log, tmpRes)
+        else:
+            try:
+                tmpStat, retMaps = tmpRes.json()
+                if tmpStat is False:
+                    tmp_log.error('updateJobsInBulk failed with {0}'.format(retMaps))
+                    retMaps = None
+            except Exception:
+                errStr = core_utils.dump_error_message(tmp_log)
+        if retMaps is None:
+            retMap = {}
+            retMap['content'] = {}
+            retMap['content']['StatusCode'] = 999
+            retMap['content']['ErrorDiag'] = errStr
+            retMaps = [json.dumps(retMap)] * len(jobspec_list)
+        for jobSpec, retMap, data in zip(jobspec_list, retMaps, dataList):
+            tmpLog = self.make_logger('id={0} PandaID={1}'.format(id, jobSpec.PandaID),
+                                      method_name='update_jobs')
+            try:
+                retMap = json.loads(retMap['content'])
+            except Exception:
+                errStr = 'falied to load json'
                 retMap = {}
-                retMap['content'] = {}
-                retMap['content']['StatusCode'] = 999
-                retMap['content']['ErrorDiag'] = errStr
-                retMaps = [json.dumps(retMap)] * len(jobSpecSubList)
-            for jobSpec, retMap, data in zip(jobSpecSubList, retMaps, dataList):
-                tmpLog = self.make_logger('id={0} PandaID={1}'.format(id, jobSpec.PandaID),
-                                          method_name='update_jobs')
-                try:
-                    retMap = json.loads(retMap['content'])
-                except Exception:
-                    errStr = 'falied to load json'
-                    retMap = {}
-                    retMap['StatusCode'] = 999
-                    retMap['ErrorDiag'] = errStr
-                tmpLog.debug('data={0}'.format(str(data)))
-                tmpLog.debug('done with {0}'.format(str(retMap)))
-                retList.append(retMap)
-            iLookup += nLookup
-        tmpLogG.debug('done' + sw.get_elapsed_time())
+                retMap['StatusCode'] = 999
+                retMap['ErrorDiag'] = errStr
+            tmpLog.debug('data={0}'.format(str(data)))
+            tmpLog.debug('done with {0}'.format(str(retMap)))
+            retList.append(retMap)
         return retList
 
     # get events
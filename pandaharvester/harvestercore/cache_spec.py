@@ -2,6 +2,9 @@
 Cache class
 
 """
+import json
+import hashlib
+
 from .spec_base import SpecBase
 
 
@@ -10,9 +13,26 @@ class CacheSpec(SpecBase):
     attributesWithTypes = ('mainKey:text',
                            'subKey:text',
                            'data:blob',
-                           'lastUpdate:timestamp'
+                           'lastUpdate:timestamp',
+                           'checksum:text'
                            )
 
     # constructor
     def __init__(self):
         SpecBase.__init__(self)
+
+    # set data with checksum to be used as version
+    def set_data(self, data):
+        self.data = data
+        try:
+            m = hashlib.md5()
+            m.update(json.dumps(data, sort_keys=True, default=str).encode('utf-8'))
+            self.checksum = m.hexdigest()
+        except Exception:
+            self.checksum = None
+
+    # get version of data
+    def get_version(self):
+        if self.checksum is not None:
+            return self.checksum
+        return str(self.lastUpdate)
@@ -17,6 +17,7 @@ import datetime
 import threading
 import traceback
 import functools
+import collections
 import Cryptodome.Random
 import Cryptodome.Hash.HMAC
 import Cryptodome.Cipher.AES
@@ -105,6 +106,88 @@ class MapWithLock(object):
         return iteritems(self.dataMap)
 
 
+# LRU cache with lock
+class LRUCache(object):
+    def __init__(self, max_size=1000):
+        self.lock = threading.Lock()
+        self.maxSize = max_size
+        self.dataMap = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.dataMap.pop(key)
+            except KeyError:
+                return default
+            # move to the most recently used position
+            self.dataMap[key] = value
+            return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.dataMap.pop(key, None)
+            self.dataMap[key] = value
+            # evict the least recently used items
+            while len(self.dataMap) > self.maxSize:
+                self.dataMap.popitem(last=False)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.dataMap
+
+    def __len__(self):
+        with self.lock:
+            return len(self.dataMap)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self.dataMap.pop(key, default)
+
+    def clear(self):
+        with self.lock:
+            self.dataMap.clear()
+
+    def keys(self):
+        with self.lock:
+            return list(self.dataMap.keys())
+
+
+# shared/exclusive lock which prefers writers
+class ReadWriteLock(object):
+    def __init__(self):
+        self.cond = threading.Condition(threading.Lock())
+        self.nReaders = 0
+        self.nWaitingWriters = 0
+        self.writing = False
+
+    def acquire_read(self):
+        with self.cond:
+            while self.writing or self.nWaitingWriters > 0:
+                self.cond.wait()
+            self.nReaders += 1
+
+    def release_read(self):
+        with self.cond:
+            self.nReaders -= 1
+            if self.nReaders == 0:
+                self.cond.notify_all()
+
+    def acquire_write(self):
+        with self.cond:
+            self.nWaitingWriters += 1
+            try:
+                while self.writing or self.nReaders > 0:
+                    self.cond.wait()
+            finally:
+                self.nWaitingWriters -= 1
+            self.writing = True
+
+    def release_write(self):
+        with self.cond:
+            self.writing = False
+            self.cond.notify_all()
+
+
 # singleton distinguishable with id
 class SingletonWithID(type):
     def __init__(cls, *args,**kwargs):
@@ -52,6 +52,16 @@ serviceMetricsTableName = 'sm_table'
 # connection lock
 conLock = threading.Lock()
 
+# shared/exclusive connection lock
+conRWLock = core_utils.ReadWriteLock()
+
+# wait time for the connection lock per method
+lockWaitStats = dict()
+lockWaitStatsLock = threading.Lock()
+
+# cache of SQL statements converted for the DB engine
+sqlCache = core_utils.LRUCache(1000)
+
 
 # connection class
 class DBProxy(object):
@@ -137,6 +147,10 @@ class DBProxy(object):
             self.usingAppLock = False
         else:
             self.usingAppLock = True
+        # using shared lock for read and exclusive lock for write instead of a simple lock
+        self.useReadWriteLock = False
+        if hasattr(harvester_config.db, 'useReadWriteLock') and harvester_config.db.useReadWriteLock is True:
+            self.useReadWriteLock = True
 
     # exception handler for type of DBs
     def _handle_exception(self, exc, retry_time=30):
@@ -164,40 +178,99 @@ class DBProxy(object):
                         tmpLog.error('failed to renew connection; {0}'.format(e))
                         time.sleep(1)
 
-    # convert param dict to list
-    def convert_params(self, sql, varmap):
-        # lock database if application side lock is used
-        if self.usingAppLock and \
-                (re.search('^INSERT', sql, re.I) is not None
-                 or re.search('^UPDATE', sql, re.I) is not None
-                 or re.search(' FOR UPDATE', sql, re.I) is not None
-                 or re.search('^DELETE', sql, re.I) is not None
-                 ):
-                self.lockDB = True
+    # convert SQL for the DB engine and extract placeholders
+    def convert_sql(self, sql):
+        cachedVal = sqlCache.get(sql)
+        if cachedVal is not None:
+            return cachedVal
+        # check if the statement needs write lock
+        needLock = re.search('^INSERT', sql, re.I) is not None \
+            or re.search('^UPDATE', sql, re.I) is not None \
+            or re.search(' FOR UPDATE', sql, re.I) is not None \
+            or re.search('^DELETE', sql, re.I) is not None
         # remove FOR UPDATE for sqlite
         if harvester_config.db.engine == 'sqlite':
-            sql = re.sub(' FOR UPDATE', ' ', sql, re.I)
-            sql = re.sub('INSERT IGNORE', 'INSERT OR IGNORE', sql, re.I)
+            newSQL = re.sub(' FOR UPDATE', ' ', sql, re.I)
+            newSQL = re.sub('INSERT IGNORE', 'INSERT OR IGNORE', newSQL, re.I)
         else:
-            sql = re.sub('INSERT OR IGNORE', 'INSERT IGNORE', sql, re.I)
-        # no conversation unless dict
-        if not isinstance(varmap, dict):
-            # using the printf style syntax for mariaDB
-            if harvester_config.db.engine == 'mariadb':
-                sql = re.sub(':[^ $,)]+', '%s', sql)
-            return sql, varmap
-        paramList = []
+            newSQL = re.sub('INSERT OR IGNORE', 'INSERT IGNORE', sql, re.I)
         # extract placeholders
-        items = re.findall(':[^ $,)]+', sql)
-        for item in items:
-            if item not in varmap:
-                raise KeyError('{0} is missing in SQL parameters'.format(item))
-            if item not in paramList:
-                paramList.append(varmap[item])
+        items = tuple(re.findall(':[^ $,)]+', newSQL))
         # using the printf style syntax for mariaDB
         if harvester_config.db.engine == 'mariadb':
-            sql = re.sub(':[^ $,)]+', '%s', sql)
-        return sql, paramList
+            newSQL = re.sub(':[^ $,)]+', '%s', newSQL)
+        cachedVal = (newSQL, items, needLock)
+        sqlCache[sql] = cachedVal
+        return cachedVal
+
+    # convert param dict to list
+    def convert_params(self, sql, varmap):
+        newSQL, items, needLock = self.convert_sql(sql)
+        # no conversation unless dict
+        if not isinstance(varmap, dict):
+            return newSQL, varmap
+        try:
+            paramList = [varmap[item] for item in items]
+        except KeyError as e:
+            raise KeyError('{0} is missing in SQL parameters'.format(e.args[0]))
+        return newSQL, paramList
+
+    # get application side lock. Return True if the lock is to be released after the statement
+    def acquire_app_lock(self, need_lock):
+        # lock is already held until commit or rollback
+        if not self.usingAppLock or self.lockDB:
+            return False
+        if harvester_config.db.verbose:
+            self.verbLog.debug('thr={0} locking'.format(self.thrName))
+        timeStart = time.time()
+        if not self.useReadWriteLock:
+            conLock.acquire()
+        elif need_lock:
+            conRWLock.acquire_write()
+        else:
+            conRWLock.acquire_read()
+        # record wait time for the caller of execute or executemany
+        waitTime = time.time() - timeStart
+        methodName = sys._getframe(2).f_code.co_name
+        with lockWaitStatsLock:
+            if methodName not in lockWaitStats:
+                lockWaitStats[methodName] = {'nLocks': 0, 'totalWait': 0., 'maxWait': 0.}
+            tmpStat = lockWaitStats[methodName]
+            tmpStat['nLocks'] += 1
+            tmpStat['totalWait'] += waitTime
+            tmpStat['maxWait'] = max(tmpStat['maxWait'], waitTime)
+        if harvester_config.db.verbose:
+            self.verbLog.debug('thr={0} locked'.format(self.thrName))
+        # keep the lock until commit or rollback for write
+        if need_lock:
+            self.lockDB = True
+            return False
+        return True
+
+    # release application side lock held only during a statement
+    def release_app_lock(self):
+        if harvester_config.db.verbose:
+            self.verbLog.debug('thr={0} release'.format(self.thrName))
+        if not self.useReadWriteLock:
+            conLock.release()
+        else:
+            conRWLock.release_read()
+
+    # release application side lock held until commit or rollback
+    def release_app_lock_for_write(self, verb_str):
+        if self.usingAppLock and self.lockDB:
+            if harvester_config.db.verbose:
+                self.verbLog.debug('thr={0} release with {1}'.format(self.thrName, verb_str))
+            if not self.useReadWriteLock:
+                conLock.release()
+            else:
+                conRWLock.release_write()
+            self.lockDB = False
+
+    # get wait time for the application side lock per method
+    def get_lock_wait_stats(self):
+        with lockWaitStatsLock:
+            return copy.deepcopy(lockWaitStats)
 
     # wrapper for execute
     def execute(self, sql, varmap=None):
@@ -205,12 +278,7 @@ class DBProxy(object):
         if varmap is None:
             varmap = dict()
         # get lock if application side lock is used
-        if self.usingAppLock and not self.lockDB:
-            if harvester_config.db.verbose:
-                self.verbLog.debug('thr={0} locking'.format(self.thrName))
-            conLock.acquire()
-            if harvester_config.db.verbose:
-                self.verbLog.debug('thr={0} locked'.format(self.thrName))
+        releaseLock = self.acquire_app_lock(self.convert_sql(sql)[2])
         # execute
         try:
             # verbose
@@ -233,10 +301,8 @@ class DBProxy(object):
                 raise
         finally:
             # release lock
-            if self.usingAppLock and not self.lockDB:
-                if harvester_config.db.verbose:
-                    self.verbLog.debug('thr={0} release'.format(self.thrName))
-                conLock.release()
+            if releaseLock:
+                self.release_app_lock()
         # return
         if harvester_config.db.verbose:
             self.verbLog.debug('thr={0}  {1}  sql=[{2}]'.format(self.thrName, sw.get_elapsed_time(),
@@ -246,12 +312,7 @@ class DBProxy(object):
     # wrapper for executemany
     def executemany(self, sql, varmap_list):
         # get lock
-        if self.usingAppLock and not self.lockDB:
-            if harvester_config.db.verbose:
-                self.verbLog.debug('thr={0} locking'.format(self.thrName))
-            conLock.acquire()
-            if harvester_config.db.verbose:
-                self.verbLog.debug('thr={0} locked'.format(self.thrName))
+        releaseLock = self.acquire_app_lock(self.convert_sql(sql)[2])
         try:
             # verbose
             if harvester_config.db.verbose:
@@ -287,10 +348,8 @@ class DBProxy(object):
                 raise
         finally:
             # release lock
-            if self.usingAppLock and not self.lockDB:
-                if harvester_config.db.verbose:
-                    self.verbLog.debug('thr={0} release'.format(self.thrName))
-                conLock.release()
+            if releaseLock:
+                self.release_app_lock()
         # return
         return retVal
 
@@ -303,11 +362,7 @@ class DBProxy(object):
             if harvester_config.db.verbose:
                 self.verbLog.debug('thr={0} exception during commit'.format(self.thrName))
             raise
-        if self.usingAppLock and self.lockDB:
-            if harvester_config.db.verbose:
-                self.verbLog.debug('thr={0} release with commit'.format(self.thrName))
-            conLock.release()
-            self.lockDB = False
+        self.release_app_lock_for_write('commit')
 
     # rollback
     def rollback(self):
@@ -318,11 +373,7 @@ class DBProxy(object):
             if harvester_config.db.verbose:
                 self.verbLog.debug('thr={0} exception during rollback'.format(self.thrName))
         finally:
-            if self.usingAppLock and self.lockDB:
-                if harvester_config.db.verbose:
-                    self.verbLog.debug('thr={0} release with rollback'.format(self.thrName))
-                conLock.release()
-                self.lockDB = False
+            self.release_app_lock_for_write('rollback')
 
     # type conversion
     def type_conversion(self, attr_type):
@@ -732,6 +783,119 @@ class DBProxy(object):
             # return
             return None
 
+    # update jobs in bulk. rows with the same set of changed columns are updated with one executemany.
+    # return the list of the number of updated rows for each job
+    def update_jobs(self, jobspec_list, criteria=None, update_in_file=False):
+        try:
+            # get logger
+            tmpLog = core_utils.make_logger(_logger, method_name='update_jobs')
+            tmpLog.debug('start for {0} jobs'.format(len(jobspec_list)))
+            if criteria is None:
+                criteria = {}
+            # max number of IDs in one IN clause
+            nIDsInBatch = 500
+            # sql to check jobs with criteria
+            sqlC = "SELECT PandaID FROM {0} ".format(jobTableName)
+            sqlC += "WHERE PandaID IN ({0}) "
+            for tmpKey in criteria:
+                sqlC += "AND {0}=:{0}_cr ".format(tmpKey)
+            sqlC += "FOR UPDATE "
+            # sql to set file status to done
+            sqlFD = "UPDATE {0} SET status=:status ".format(fileTableName)
+            sqlFD += "WHERE PandaID=:PandaID AND fileType IN (:type1,:type2) "
+            # sql to set to_delete flag
+            sqlD = "UPDATE {0} SET todelete=:to_delete ".format(fileTableName)
+            sqlD += "WHERE PandaID=:PandaID "
+            # check jobs
+            pandaIDs = [jobspec.PandaID for jobspec in jobspec_list]
+            matchedIDs = set()
+            for iBatch in range(0, len(pandaIDs), nIDsInBatch):
+                varMap = dict()
+                for tmpKey, tmpVal in iteritems(criteria):
+                    varMap[':{0}_cr'.format(tmpKey)] = tmpVal
+                inStr = self.make_in_clause('PandaID', pandaIDs[iBatch:iBatch+nIDsInBatch], varMap)
+                self.execute(sqlC.format(inStr), varMap)
+                for tmpPandaID, in self.cur.fetchall():
+                    matchedIDs.add(tmpPandaID)
+            # group jobs, events and files by changed columns
+            jobVarMapsMap = dict()
+            eventVarMapsMap = dict()
+            fileVarMapsMap = dict()
+            varMapsFD = []
+            varMapsD = []
+            retList = []
+            for jobspec in jobspec_list:
+                if jobspec.PandaID not in matchedIDs:
+                    retList.append(0)
+                    continue
+                retList.append(1)
+                bindExpr = jobspec.bind_update_changes_expression()
+                if bindExpr.strip():
+                    varMap = jobspec.values_map(only_changed=True)
+                    varMap[':PandaID'] = jobspec.PandaID
+                    jobVarMapsMap.setdefault(bindExpr, [])
+                    jobVarMapsMap[bindExpr].append(varMap)
+                # events
+                for eventSpec in jobspec.events:
+                    varMap = eventSpec.values_map(only_changed=True)
+                    if varMap != {}:
+                        varMap[':eventRangeID'] = eventSpec.eventRangeID
+                        bindExpr = eventSpec.bind_update_changes_expression()
+                        eventVarMapsMap.setdefault(bindExpr, [])
+                        eventVarMapsMap[bindExpr].append(varMap)
+                # input files
+                if update_in_file:
+                    for fileSpec in jobspec.inFiles:
+                        varMap = fileSpec.values_map(only_changed=True)
+                        if varMap != {}:
+                            varMap[':fileID'] = fileSpec.fileID
+                            bindExpr = fileSpec.bind_update_changes_expression()
+                            fileVarMapsMap.setdefault(bindExpr, [])
+                            fileVarMapsMap[bindExpr].append(varMap)
+                elif jobspec.is_final_status():
+                    # set file status to done if jobs are done
+                    varMap = dict()
+                    varMap[':PandaID'] = jobspec.PandaID
+                    varMap[':type1'] = 'input'
+                    varMap[':type2'] = FileSpec.AUX_INPUT
+                    varMap[':status'] = 'done'
+                    varMapsFD.append(varMap)
+                # set to_delete flag
+                if jobspec.subStatus == 'done':
+                    varMap = dict()
+                    varMap[':PandaID'] = jobspec.PandaID
+                    varMap[':to_delete'] = 1
+                    varMapsD.append(varMap)
+            # update
+            for bindExpr, varMaps in iteritems(jobVarMapsMap):
+                sql = "UPDATE {0} SET {1} ".format(jobTableName, bindExpr)
+                sql += "WHERE PandaID=:PandaID "
+                self.executemany(sql, varMaps)
+            for bindExpr, varMaps in iteritems(eventVarMapsMap):
+                sqlE = "UPDATE {0} SET {1} ".format(eventTableName, bindExpr)
+                sqlE += "WHERE eventRangeID=:eventRangeID "
+                self.executemany(sqlE, varMaps)
+            for bindExpr, varMaps in iteritems(fileVarMapsMap):
+                sqlF = "UPDATE {0} SET {1} ".format(fileTableName, bindExpr)
+                sqlF += "WHERE fileID=:fileID "
+                self.executemany(sqlF, varMaps)
+            if varMapsFD:
+                self.executemany(sqlFD, varMapsFD)
+            if varMapsD:
+                self.executemany(sqlD, varMapsD)
+            # commit
+            self.commit()
+            tmpLog.debug('done with {0} jobs in {1} statements'.format(len(matchedIDs), len(jobVarMapsMap)))
+            # return
+            return retList
+        except Exception:
+            # roll back
+            self.rollback()
+            # dump error
+            core_utils.dump_error_message(_logger)
+            # return
+            return None
+
     # insert output files into database
     def insert_files(self,jobspec_list):
         # get logger
@@ -799,6 +963,70 @@ class DBProxy(object):
             # return
             return None
 
+    # update workers in bulk. rows with the same set of changed columns are updated with one executemany.
+    # return the list of the number of updated rows for each worker, or None if nothing to update
+    def update_workers(self, workspec_list, criteria=None):
+        try:
+            # get logger
+            tmpLog = core_utils.make_logger(_logger, method_name='update_workers')
+            tmpLog.debug('start for {0} workers'.format(len(workspec_list)))
+            if criteria is None:
+                criteria = {}
+            # max number of IDs in one IN clause
+            nIDsInBatch = 500
+            # sql to check workers with criteria
+            sqlC = "SELECT workerID FROM {0} ".format(workTableName)
+            sqlC += "WHERE workerID IN ({0}) "
+            for tmpKey in criteria:
+                sqlC += "AND {0}=:{0}_cr ".format(tmpKey)
+            sqlC += "FOR UPDATE "
+            # workers with updated attributes
+            workerIDs = [workspec.workerID for workspec in workspec_list
+                         if workspec.bind_update_changes_expression().strip()]
+            # check workers
+            matchedIDs = set()
+            for iBatch in range(0, len(workerIDs), nIDsInBatch):
+                varMap = dict()
+                for tmpKey, tmpVal in iteritems(criteria):
+                    varMap[':{0}_cr'.format(tmpKey)] = tmpVal
+                inStr = self.make_in_clause('workerID', workerIDs[iBatch:iBatch+nIDsInBatch], varMap)
+                self.execute(sqlC.format(inStr), varMap)
+                for tmpWorkerID, in self.cur.fetchall():
+                    matchedIDs.add(tmpWorkerID)
+            # group workers by changed columns
+            varMapsMap = dict()
+            retList = []
+            for workspec in workspec_list:
+                bindExpr = workspec.bind_update_changes_expression()
+                if not bindExpr.strip():
+                    retList.append(None)
+                    continue
+                if workspec.workerID not in matchedIDs:
+                    retList.append(0)
+                    continue
+                retList.append(1)
+                varMap = workspec.values_map(only_changed=True)
+                varMap[':workerID'] = workspec.workerID
+                varMapsMap.setdefault(bindExpr, [])
+                varMapsMap[bindExpr].append(varMap)
+            # update
+            for bindExpr, varMaps in iteritems(varMapsMap):
+                sql = "UPDATE {0} SET {1} ".format(workTableName, bindExpr)
+                sql += "WHERE workerID=:workerID "
+                self.executemany(sql, varMaps)
+            # commit
+            self.commit()
+            tmpLog.debug('done with {0} workers in {1} statements'.format(len(matchedIDs), len(varMapsMap)))
+            # return
+            return retList
+        except Exception:
+            # roll back
+            self.rollback()
+            # dump error
+            core_utils.dump_error_message(_logger)
+            # return
+            return None
+
     # fill panda queue table
     def fill_panda_queue_table(self, panda_queue_list, queue_config_mapper):
         try:
@@ -1714,42 +1942,56 @@ class DBProxy(object):
             # return
             return []
 
+    # make a comma-separated list of bind variables for IN clause and update varMap
+    def make_in_clause(self, prefix, values, var_map):
+        names = []
+        for idx, value in enumerate(values):
+            name = ':{0}{1}'.format(prefix, idx)
+            names.append(name)
+            var_map[name] = value
+        return ','.join(names)
+
     # get workers to monitor
     def get_workers_to_update(self, max_workers, check_interval, lock_interval, locked_by):
         try:
             # get logger
             tmpLog = core_utils.make_logger(_logger, method_name='get_workers_to_update')
             tmpLog.debug('start')
+            # max number of IDs in one IN clause
+            nIDsInBatch = 500
             # sql to get workers
             sqlW = "SELECT workerID,configID,mapType FROM {0} ".format(workTableName)
             sqlW += "WHERE status IN (:st_submitted,:st_running,:st_idle) "
             sqlW += "AND ((modificationTime<:lockTimeLimit AND lockedBy IS NOT NULL) "
             sqlW += "OR (modificationTime<:checkTimeLimit AND lockedBy IS NULL)) "
             sqlW += "ORDER BY modificationTime LIMIT {0} ".format(max_workers)
-            # sql to lock worker without time check
+            # sql to lock workers without time check
             sqlL = "UPDATE {0} SET modificationTime=:timeNow,lockedBy=:lockedBy ".format(workTableName)
-            sqlL += "WHERE workerID=:workerID "
+            sqlL += "WHERE workerID IN ({0}) "
             # sql to update modificationTime
             sqlLM = "UPDATE {0} SET modificationTime=:timeNow ".format(workTableName)
-            sqlLM += "WHERE workerID=:workerID "
-            # sql to lock worker with time check
+            sqlLM += "WHERE workerID IN ({0}) "
+            # sql to lock workers with time check
             sqlLT = "UPDATE {0} SET modificationTime=:timeNow,lockedBy=:lockedBy ".format(workTableName)
-            sqlLT += "WHERE workerID=:workerID "
+            sqlLT += "WHERE workerID IN ({0}) "
             sqlLT += "AND status IN (:st_submitted,:st_running,:st_idle) "
             sqlLT += "AND ((modificationTime<:lockTimeLimit AND lockedBy IS NOT NULL) "
             sqlLT += "OR (modificationTime<:checkTimeLimit AND lockedBy IS NULL)) "
+            # sql to check locked workers
+            sqlLC = "SELECT workerID FROM {0} ".format(workTableName)
+            sqlLC += "WHERE workerID IN ({0}) AND lockedBy=:lockedBy AND modificationTime=:timeNow "
             # sql to get associated workerIDs
-            sqlA = "SELECT t.workerID FROM {0} t, {0} s, {1} w ".format(jobWorkerTableName, workTableName)
-            sqlA += "WHERE s.PandaID=t.PandaID AND s.workerID=:workerID "
+            sqlA = "SELECT s.workerID,t.workerID FROM {0} t, {0} s, {1} w ".format(jobWorkerTableName, workTableName)
+            sqlA += "WHERE s.PandaID=t.PandaID AND s.workerID IN ({0}) "
             sqlA += "AND w.workerID=t.workerID AND w.status IN (:st_submitted,:st_running,:st_idle) "
             # sql to get associated workers
             sqlG = "SELECT {0} FROM {1} ".format(WorkSpec.column_names(), workTableName)
-            sqlG += "WHERE workerID=:workerID "
+            sqlG += "WHERE workerID IN ({0}) "
             # sql to get associated PandaIDs
-            sqlP = "SELECT PandaID FROM {0} ".format(jobWorkerTableName)
-            sqlP += "WHERE workerID=:workerID "
-            # get workerIDs
-            timeNow = datetime.datetime.utcnow()
+            sqlP = "SELECT workerID,PandaID FROM {0} ".format(jobWorkerTableName)
+            sqlP += "WHERE workerID IN ({0}) "
+            # get workerIDs. timeNow without microseconds to find locked workers with timestamp columns
+            timeNow = datetime.datetime.utcnow().replace(microsecond=0)
             lockTimeLimit = timeNow - datetime.timedelta(seconds=lock_interval)
             checkTimeLimit = timeNow - datetime.timedelta(seconds=check_interval)
             varMap = dict()
@@ -1766,39 +2008,43 @@ class DBProxy(object):
                 if not core_utils.dynamic_plugin_change():
                     configID = None
                 tmpWorkers.add((workerID, configID, mapType))
-            checkedIDs = set()
-            retVal = {}
-            for workerID, configID, mapType in tmpWorkers:
-                # skip
-                if workerID in checkedIDs:
-                    continue
-                # get associated workerIDs
+            tmpWorkers = list(tmpWorkers)
+            candidateIDs = [workerID for workerID, configID, mapType in tmpWorkers]
+            # get associated workerIDs
+            associatedIDsMap = dict()
+            for iBatch in range(0, len(candidateIDs), nIDsInBatch):
                 varMap = dict()
-                varMap[':workerID'] = workerID
                 varMap[':st_submitted'] = WorkSpec.ST_submitted
                 varMap[':st_running'] = WorkSpec.ST_running
                 varMap[':st_idle'] = WorkSpec.ST_idle
-                self.execute(sqlA, varMap)
-                resA = self.cur.fetchall()
-                workerIDtoScan = set()
-                for tmpWorkID, in resA:
-                    workerIDtoScan.add(tmpWorkID)
+                inStr = self.make_in_clause('workerID', candidateIDs[iBatch:iBatch+nIDsInBatch], varMap)
+                self.execute(sqlA.format(inStr), varMap)
+                for workerID, tmpWorkID in self.cur.fetchall():
+                    associatedIDsMap.setdefault(workerID, set())
+                    associatedIDsMap[workerID].add(tmpWorkID)
+            workerIDtoScanMap = dict()
+            toTouchIDs = []
+            toLockIDs = []
+            for workerID, configID, mapType in tmpWorkers:
+                workerIDtoScan = associatedIDsMap.get(workerID, set())
                 # add original ID just in case since no relation when job is not yet bound
                 workerIDtoScan.add(workerID)
+                workerIDtoScanMap[workerID] = workerIDtoScan
                 # use only the largest worker to avoid updating the same worker set concurrently
-                if mapType == WorkSpec.MT_MultiWorkers:
-                    if workerID != min(workerIDtoScan):
-                        # update modification time
-                        varMap = dict()
-                        varMap[':workerID'] = workerID
-                        varMap[':timeNow'] = timeNow
-                        self.execute(sqlLM, varMap)
-                        # commit
-                        self.commit()
-                        continue
-                # lock worker
+                if mapType == WorkSpec.MT_MultiWorkers and workerID != min(workerIDtoScan):
+                    toTouchIDs.append(workerID)
+                else:
+                    toLockIDs.append(workerID)
+            # update modification time
+            for iBatch in range(0, len(toTouchIDs), nIDsInBatch):
+                varMap = dict()
+                varMap[':timeNow'] = timeNow
+                inStr = self.make_in_clause('workerID', toTouchIDs[iBatch:iBatch+nIDsInBatch], varMap)
+                self.execute(sqlLM.format(inStr), varMap)
+            # lock workers
+            lockedIDs = set()
+            for iBatch in range(0, len(toLockIDs), nIDsInBatch):
                 varMap = dict()
-                varMap[':workerID'] = workerID
                 varMap[':lockedBy'] = locked_by
                 varMap[':timeNow'] = timeNow
                 varMap[':st_submitted'] = WorkSpec.ST_submitted
@@ -1806,49 +2052,77 @@ class DBProxy(object):
                 varMap[':st_idle'] = WorkSpec.ST_idle
                 varMap[':lockTimeLimit'] = lockTimeLimit
                 varMap[':checkTimeLimit'] = checkTimeLimit
-                self.execute(sqlLT, varMap)
+                inStr = self.make_in_clause('workerID', toLockIDs[iBatch:iBatch+nIDsInBatch], varMap)
+                self.execute(sqlLT.format(inStr), varMap)
                 nRow = self.cur.rowcount
-                # commit
-                self.commit()
-                # skip if not locked
                 if nRow == 0:
                     continue
-                # get workers
+                # check which workers were locked
+                varMap = dict()
+                varMap[':lockedBy'] = locked_by
+                varMap[':timeNow'] = timeNow
+                inStr = self.make_in_clause('workerID', toLockIDs[iBatch:iBatch+nIDsInBatch], varMap)
+                self.execute(sqlLC.format(inStr), varMap)
+                for tmpWorkID, in self.cur.fetchall():
+                    lockedIDs.add(tmpWorkID)
+            # commit
+            self.commit()
+            # make worker groups
+            checkedIDs = set()
+            groupList = []
+            for workerID, configID, mapType in tmpWorkers:
+                # skip if already checked or not locked
+                if workerID in checkedIDs or workerID not in lockedIDs:
+                    continue
+                workerIDtoScan = workerIDtoScanMap[workerID]
+                checkedIDs.update(workerIDtoScan)
+                groupList.append((workerID, configID, workerIDtoScan))
+            # get workers and associated PandaIDs
+            workSpecMap = dict()
+            pandaIDsMap = dict()
+            allIDs = list(checkedIDs)
+            for iBatch in range(0, len(allIDs), nIDsInBatch):
+                varMap = dict()
+                inStr = self.make_in_clause('workerID', allIDs[iBatch:iBatch+nIDsInBatch], varMap)
+                self.execute(sqlG.format(inStr), varMap)
+                for resG in self.cur.fetchall():
+                    workSpec = WorkSpec()
+                    workSpec.pack(resG)
+                    workSpecMap[workSpec.workerID] = workSpec
+                varMap = dict()
+                inStr = self.make_in_clause('workerID', allIDs[iBatch:iBatch+nIDsInBatch], varMap)
+                self.execute(sqlP.format(inStr), varMap)
+                for tmpWorkID, tmpPandaID in self.cur.fetchall():
+                    pandaIDsMap.setdefault(tmpWorkID, [])
+                    pandaIDsMap[tmpWorkID].append(tmpPandaID)
+            # lock associated workers
+            toLockIDs = [tmpWorkID for workerID, configID, workerIDtoScan in groupList
+                         for tmpWorkID in workerIDtoScan if tmpWorkID != workerID]
+            for iBatch in range(0, len(toLockIDs), nIDsInBatch):
+                varMap = dict()
+                varMap[':lockedBy'] = locked_by
+                varMap[':timeNow'] = timeNow
+                inStr = self.make_in_clause('workerID', toLockIDs[iBatch:iBatch+nIDsInBatch], varMap)
+                self.execute(sqlL.format(inStr), varMap)
+            # commit
+            self.commit()
+            # group workers
+            retVal = {}
+            for workerID, configID, workerIDtoScan in groupList:
                 queueName = None
                 workersList = []
                 for tmpWorkID in workerIDtoScan:
-                    checkedIDs.add(tmpWorkID)
-                    # get worker
-                    varMap = dict()
-                    varMap[':workerID'] = tmpWorkID
-                    self.execute(sqlG, varMap)
-                    resG = self.cur.fetchone()
-                    workSpec = WorkSpec()
-                    workSpec.pack(resG)
+                    if tmpWorkID not in workSpecMap:
+                        continue
+                    workSpec = workSpecMap[tmpWorkID]
                     if queueName is None:
                         queueName = workSpec.computingSite
                     workersList.append(workSpec)
-                    # get associated PandaIDs
-                    varMap = dict()
-                    varMap[':workerID'] = tmpWorkID
-                    self.execute(sqlP, varMap)
-                    resP = self.cur.fetchall()
-                    workSpec.pandaid_list = []
-                    for tmpPandaID, in resP:
-                        workSpec.pandaid_list.append(tmpPandaID)
+                    workSpec.pandaid_list = pandaIDsMap.get(tmpWorkID, [])
                     if len(workSpec.pandaid_list) > 0:
                         workSpec.nJobs = len(workSpec.pandaid_list)
-                    # lock worker
-                    if tmpWorkID != workerID:
-                        varMap = dict()
-                        varMap[':workerID'] = tmpWorkID
-                        varMap[':lockedBy'] = locked_by
-                        varMap[':timeNow'] = timeNow
-                        self.execute(sqlL, varMap)
                     workSpec.lockedBy = locked_by
                     workSpec.force_not_update('lockedBy')
-                # commit
-                self.commit()
                 # add
                 if queueName is not None:
                     retVal.setdefault(queueName, dict())
@@ -2986,11 +3260,11 @@ class DBProxy(object):
             # make spec
             cacheSpec = CacheSpec()
             cacheSpec.lastUpdate = datetime.datetime.utcnow()
-            cacheSpec.data = new_info
+            cacheSpec.set_data(new_info)
             # check if already there
             varMap = dict()
             varMap[":mainKey"] = main_key
-            sqlC = "SELECT lastUpdate FROM {0} WHERE mainKey=:mainKey ".format(cacheTableName)
+            sqlC = "SELECT lastUpdate,checksum FROM {0} WHERE mainKey=:mainKey ".format(cacheTableName)
             if sub_key is not None:
                 sqlC += "AND subKey=:subKey "
                 varMap[":subKey"] = sub_key
@@ -3004,6 +3278,10 @@ class DBProxy(object):
                 sqlU += CacheSpec.bind_values_expression()
                 varMap = cacheSpec.values_list()
             else:
+                # only update lastUpdate if data is unchanged
+                if cacheSpec.checksum is not None and retC[1] == cacheSpec.checksum:
+                    cacheSpec.force_not_update('data')
+                    cacheSpec.force_not_update('checksum')
                 # update
                 sqlU = "UPDATE {0} SET {1} ".format(cacheTableName, cacheSpec.bind_update_changes_expression())
                 sqlU += "WHERE mainKey=:mainKey "
@@ -3019,7 +3297,12 @@ class DBProxy(object):
             cacheKey = 'cache|{0}|{1}'.format(main_key, sub_key)
             globalDict = core_utils.get_global_dict()
             globalDict.acquire()
-            globalDict[cacheKey] = cacheSpec.data
+            version = cacheSpec.get_version()
+            newData = cacheSpec.data
+            if cacheKey in globalDict and globalDict[cacheKey][0] == version:
+                # keep the same object when unchanged
+                newData = globalDict[cacheKey][1]
+            globalDict[cacheKey] = (version, newData, time.time())
             globalDict.release()
             tmpLog.debug('refreshed')
             return True
@@ -3031,7 +3314,7 @@ class DBProxy(object):
             # return
             return False
 
-    # get a cached info
+    # get a cached info. data is shared among threads, so it must not be modified
     def get_cache(self, main_key, sub_key=None):
         useDB = False
         try:
@@ -3042,40 +3325,63 @@ class DBProxy(object):
             # get from global dict
             cacheKey = 'cache|{0}|{1}'.format(main_key, sub_key)
             globalDict = core_utils.get_global_dict()
-            # lock dict
             globalDict.acquire()
-            # found
             if cacheKey in globalDict:
-                # release dict
-                globalDict.release()
-                # make spec
+                cachedEntry = globalDict[cacheKey]
+            else:
+                cachedEntry = None
+            globalDict.release()
+            # use data in memory if recently validated
+            timeNow = time.time()
+            revalidateInterval = getattr(harvester_config.db, 'cacheRevalidateInterval', 60)
+            if cachedEntry is not None and timeNow - cachedEntry[2] < revalidateInterval:
                 cacheSpec = CacheSpec()
-                cacheSpec.data = globalDict[cacheKey]
+                cacheSpec.data = cachedEntry[1]
+                tmpLog.debug('done from memory')
+                return cacheSpec
+            # check version in database
+            useDB = True
+            varMap = dict()
+            varMap[":mainKey"] = main_key
+            sqlV = "SELECT lastUpdate,checksum FROM {0} ".format(cacheTableName)
+            sqlV += "WHERE mainKey=:mainKey "
+            if sub_key is not None:
+                sqlV += "AND subKey=:subKey "
+                varMap[":subKey"] = sub_key
+            self.execute(sqlV, varMap)
+            resV = self.cur.fetchone()
+            if resV is None:
+                # commit
+                self.commit()
+                return None
+            cacheSpec = CacheSpec()
+            cacheSpec.lastUpdate, cacheSpec.checksum = resV
+            version = cacheSpec.get_version()
+            if cachedEntry is not None and cachedEntry[0] == version:
+                # unchanged
+                cacheSpec.data = cachedEntry[1]
             else:
                 # read from database
-                useDB = True
                 sql = "SELECT {0} FROM {1} ".format(CacheSpec.column_names(), cacheTableName)
                 sql += "WHERE mainKey=:mainKey "
-                varMap = dict()
-                varMap[":mainKey"] = main_key
                 if sub_key is not None:
                     sql += "AND subKey=:subKey "
-                    varMap[":subKey"] = sub_key
                 self.execute(sql, varMap)
                 resJ = self.cur.fetchone()
-                # commit
-                self.commit()
                 if resJ is None:
-                    # release dict
-                    globalDict.release()
+                    # commit
+                    self.commit()
                     return None
                 # make spec
                 cacheSpec = CacheSpec()
                 cacheSpec.pack(resJ)
-                # put into global dict
-                globalDict[cacheKey] = cacheSpec.data
-                # release dict
-                globalDict.release()
+                version = cacheSpec.get_version()
+            # commit
+            self.commit()
+            # put into global dict
+            globalDict.acquire()
+            globalDict[cacheKey] = (version, cacheSpec.data, timeNow)
+            globalDict.release()
             tmpLog.debug('done')
             # return
             return cacheSpec
@@ -4071,6 +4377,49 @@ class DBProxy(object):
             # return
             return {}
 
+    # get file status for many LFNs
+    def get_files_status(self, lfns, file_type, endpoint, job_status):
+        try:
+            # get logger
+            tmpLog = core_utils.make_logger(_logger, 'nLFNs={0} endpoint={1}'.format(len(lfns), endpoint),
+                                            method_name='get_files_status')
+            tmpLog.debug('start')
+            # max number of LFNs in one IN clause
+            nLFNsInBatch = 500
+            # sql to get files
+            sqlF = "SELECT f.lfn, f.status, COUNT(*) cnt FROM {0} f, {1} j ".format(fileTableName, jobTableName)
+            sqlF += "WHERE j.PandaID=f.PandaID AND j.status=:jobStatus "
+            sqlF += "AND f.lfn IN ({0}) AND f.fileType=:type "
+            if endpoint is not None:
+                sqlF += "AND f.endpoint=:endpoint "
+            sqlF += "GROUP BY f.lfn, f.status "
+            # get files
+            lfns = list(lfns)
+            retMap = dict()
+            for lfn in lfns:
+                retMap[lfn] = dict()
+            for iBatch in range(0, len(lfns), nLFNsInBatch):
+                varMap = dict()
+                varMap[':type'] = file_type
+                varMap[':jobStatus'] = job_status
+                if endpoint is not None:
+                    varMap[':endpoint'] = endpoint
+                inStr = self.make_in_clause('lfn', lfns[iBatch:iBatch+nLFNsInBatch], varMap)
+                self.execute(sqlF.format(inStr), varMap)
+                for lfn, status, cnt in self.cur.fetchall():
+                    retMap[lfn][status] = cnt
+            # commit
+            self.commit()
+            tmpLog.debug('got {0}'.format(str(retMap)))
+            return retMap
+        except Exception:
+            # roll back
+            self.rollback()
+            # dump error
+            core_utils.dump_error_message(_logger)
+            # return
+            return {}
+
     # change file status
     def change_file_status(self, panda_id, data, locked_by):
         try:
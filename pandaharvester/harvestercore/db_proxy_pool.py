@@ -72,6 +72,12 @@ class DBProxyPool(object):
                     cls.instance.initialize(read_only=read_only)
         return cls.instance
 
+    # drop the singleton to make new connections, e.g. in a child process after fork
+    @classmethod
+    def reset_instance(cls):
+        with cls.lock:
+            cls.instance = None
+
     # override __getattribute__
     def __getattribute__(self, name):
         try:
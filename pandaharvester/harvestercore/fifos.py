@@ -112,6 +112,26 @@ class FIFOBase(object):
         mainLog.debug('score={0}'.format(score))
         return retVal
 
+    # enqueue list of (item, score) in bulk
+    def putmany(self, item_score_list, encode_item=True):
+        mainLog = self.make_logger(_logger, 'id={0}-{1}'.format(self.fifoName, self.get_pid()), method_name='putmany')
+        timeNow = time.time()
+        serialized_list = []
+        for item, score in item_score_list:
+            if encode_item:
+                item = self.encode(item)
+            if score is None:
+                score = timeNow
+            serialized_list.append((item, score))
+        if hasattr(self.fifo, 'putmany'):
+            retVal = self.fifo.putmany(serialized_list)
+        else:
+            for item_serialized, score in serialized_list:
+                self.fifo.put(item_serialized, score)
+            retVal = len(serialized_list)
+        mainLog.debug('put {0} objects'.format(len(serialized_list)))
+        return retVal
+
     # enqueue by id, which is unique
     def putbyid(self, id, item, score=None, encode_item=True):
         mainLog = self.make_logger(_logger, 'id={0}-{1}'.format(self.fifoName, self.get_pid()), method_name='putbyid')
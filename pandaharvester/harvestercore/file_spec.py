@@ -11,6 +11,9 @@ class FileSpec(SpecBase):
     # file type
     AUX_INPUT = 'aux_input'
 
+    # members other than attributes
+    __slots__ = ('associatedFiles',)
+
     # attributes
     attributesWithTypes = ('fileID:integer primary key autoincrement',
                            'PandaID:integer / index',
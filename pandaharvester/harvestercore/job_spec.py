@@ -26,6 +26,9 @@ class JobSpec(SpecBase):
     AUX_inReady = 3
     AUX_allReady = 4
 
+    # members other than attributes
+    __slots__ = ('events', 'zipEventMap', 'inFiles', 'outFiles', 'zipFileMap', 'workspec_list')
+
     # attributes
     attributesWithTypes = ('PandaID:integer primary key',
                            'taskID:integer / index',
@@ -3,6 +3,9 @@ from pandaharvester.harvestercore import core_utils
 
 
 class PluginBase(object):
+    # set False in plugins which are not thread-safe not to reuse instances cached in PluginFactory
+    instanceCacheable = True
+
     def __init__(self, **kwarg):
         for tmpKey, tmpVal in iteritems(kwarg):
             setattr(self, tmpKey, tmpVal)
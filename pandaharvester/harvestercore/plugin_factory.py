@@ -1,11 +1,19 @@
+import json
+import hashlib
+import threading
 from future.utils import iteritems
 
+from pandaharvester.harvesterconfig import harvester_config
 from . import core_utils
 from .db_interface import DBInterface
 
 # logger
 _logger = core_utils.setup_logger('plugin_factory')
 
+# generation of plugin configs, incremented to invalidate cached plugin instances
+_configGeneration = 0
+_configGenerationLock = threading.Lock()
+
 
 # plugin factory
 class PluginFactory(object):
@@ -13,6 +21,23 @@ class PluginFactory(object):
     def __init__(self, no_db=False):
         self.classMap = {}
         self.noDB = no_db
+        # cache of plugin instances
+        self.useInstanceCache = getattr(harvester_config.master, 'pluginInstanceCache', False)
+        self.instanceCache = core_utils.LRUCache(getattr(harvester_config.master, 'pluginInstanceCacheSize', 100))
+        self.configGeneration = _configGeneration
+
+    # invalidate plugin instances cached in all factories, e.g. when queue configs are reloaded
+    @staticmethod
+    def invalidate_instance_cache():
+        global _configGeneration
+        with _configGenerationLock:
+            _configGeneration += 1
+
+    # get stable hash of plugin config
+    @staticmethod
+    def get_config_hash(plugin_conf):
+        confStr = json.dumps(plugin_conf, sort_keys=True, default=str)
+        return hashlib.md5(confStr.encode('utf-8')).hexdigest()
 
     # get plugin
     def get_plugin(self, plugin_conf):
@@ -35,6 +60,17 @@ class PluginFactory(object):
             cls = getattr(mod, className)
             # add
             self.classMap[pluginKey] = cls
+        cls = self.classMap[pluginKey]
+        # get cached instance unless the plugin opts out with instanceCacheable=False in the class or config
+        instanceKey = None
+        if self.useInstanceCache and plugin_conf.get('instanceCacheable', getattr(cls, 'instanceCacheable', True)):
+            if self.configGeneration != _configGeneration:
+                self.instanceCache.clear()
+                self.configGeneration = _configGeneration
+            instanceKey = self.get_config_hash(plugin_conf)
+            impl = self.instanceCache.get(instanceKey)
+            if impl is not None:
+                return impl
         # make args
         args = {}
         for tmpKey, tmpVal in iteritems(plugin_conf):
@@ -45,10 +81,12 @@ class PluginFactory(object):
         if not self.noDB:
             args['dbInterface'] = DBInterface()
         # instantiate
-        cls = self.classMap[pluginKey]
         impl = cls(**args)
         # bare instance when middleware is used
         if 'original_config' in plugin_conf and 'bareFunctions' in plugin_conf:
             bare_impl = self.get_plugin(plugin_conf['original_config'])
             impl.bare_impl = bare_impl
+        # cache
+        if instanceKey is not None:
+            self.instanceCache[instanceKey] = impl
         return impl
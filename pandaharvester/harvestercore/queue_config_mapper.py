@@ -172,6 +172,13 @@ class QueueConfigMapper(six.with_metaclass(SingletonWithID, object)):
     def __init__(self, update_db=True):
         self.lock = threading.Lock()
         self.lastUpdate = None
+        self.queueConfig = dict()
+        self.activeQueues = dict()
+        self.queueConfigWithID = dict()
+        # queue configs built in the last reload with fingerprints of their sources
+        self.builtQueueConfigCache = dict()
+        # module and class names of plugins already validated
+        self.validPluginClasses = set()
         self.dbProxy = DBProxy()
         self.toUpdateDB = update_db
         try:
@@ -242,6 +249,18 @@ class QueueConfigMapper(six.with_metaclass(SingletonWithID, object)):
             resolver = None
         return resolver
 
+    # check if module and class of plugin exist
+    def _validate_plugin_class(self, module_name, class_name):
+        if (module_name, class_name) not in self.validPluginClasses:
+            tmpMod = importlib.import_module(module_name)
+            getattr(tmpMod, class_name)
+            self.validPluginClasses.add((module_name, class_name))
+
+    # get fingerprint of sources of a queue config
+    @staticmethod
+    def _get_queue_fingerprint(*sources):
+        return json.dumps(sources, sort_keys=True, default=str)
+
     # load data
     def load_data(self):
         mainLog = _make_logger(method_name='QueueConfigMapper.load_data')
@@ -250,7 +269,17 @@ class QueueConfigMapper(six.with_metaclass(SingletonWithID, object)):
         if self.lastUpdate is not None and timeNow - self.lastUpdate < datetime.timedelta(minutes=10):
             return
         # start
-        with self.lock:
+        if self.lastUpdate is not None:
+            # use the current configs while another thread is reloading
+            if not self.lock.acquire(False):
+                return
+        else:
+            self.lock.acquire()
+        try:
+            # check interval again since another thread may have reloaded
+            timeNow = datetime.datetime.utcnow()
+            if self.lastUpdate is not None and timeNow - self.lastUpdate < datetime.timedelta(minutes=10):
+                return
             # init
             newQueueConfig = dict()
             localTemplatesDict = dict()
@@ -352,6 +381,8 @@ class QueueConfigMapper(six.with_metaclass(SingletonWithID, object)):
             allQueuesNameList |= set(localQueuesDict)
             allQueuesNameList.discard(None)
             # set attributes
+            newBuiltQueueConfigCache = dict()
+            fingerprintMap = dict()
             for queueName in allQueuesNameList:
                 # sources or queues and templates
                 queueSourceList = []
@@ -365,6 +396,17 @@ class QueueConfigMapper(six.with_metaclass(SingletonWithID, object)):
                     tmp_templateQueueName = tmp_queueDict.get('templateQueueName')
                     if tmp_templateQueueName is not None:
                         templateQueueName = tmp_templateQueueName
+                # reuse the queue config if its sources are unchanged
+                fingerprint = self._get_queue_fingerprint(
+                                remoteQueuesDict.get(queueName), dynamicQueuesDict.get(queueName),
+                                localQueuesDict.get(queueName), templateQueueName,
+                                finalTemplatesDict.get(templateQueueName),
+                                resolver.get_panda_queue_name(queueName.split('/')[0]) if resolver is not None else None)
+                fingerprintMap[queueName] = fingerprint
+                if queueName in self.builtQueueConfigCache \
+                        and self.builtQueueConfigCache[queueName][0] == fingerprint:
+                    newQueueConfig[queueName] = copy.copy(self.builtQueueConfigCache[queueName][1])
+                    continue
                 # prepare queueDict
                 queueDict = dict()
                 if templateQueueName in finalTemplatesDict:
@@ -425,16 +467,12 @@ class QueueConfigMapper(six.with_metaclass(SingletonWithID, object)):
                                 val[c_key] = c_val
                         # check module and class name
                         try:
-                            _t3mP_1Mp0R7_mO6U1e__ = importlib.import_module(val['module'])
-                            _t3mP_1Mp0R7_N4m3__ = getattr(_t3mP_1Mp0R7_mO6U1e__, val['name'])
+                            self._validate_plugin_class(val['module'], val['name'])
                         except Exception as _e:
                             invalidQueueList.add(queueConfig.queueName)
                             mainLog.error('Module or class not found. Omitted {0} in queue config ({1})'.format(
                                             queueConfig.queueName, _e))
                             continue
-                        else:
-                            del _t3mP_1Mp0R7_mO6U1e__
-                            del _t3mP_1Mp0R7_N4m3__
                         # fill in siteName and queueName
                         if 'siteName' not in val:
                             val['siteName'] = queueConfig.siteName
@@ -500,6 +538,13 @@ class QueueConfigMapper(six.with_metaclass(SingletonWithID, object)):
             for invalidQueueName in invalidQueueList:
                 if invalidQueueName in newQueueConfig:
                     del newQueueConfig[invalidQueueName]
+            # keep copies of valid queue configs before dynamic information is set
+            for queueName, queueConfig in iteritems(newQueueConfig):
+                newBuiltQueueConfigCache[queueName] = (fingerprintMap[queueName], copy.copy(queueConfig))
+            mainLog.debug('rebuilt {0} queue configs out of {1}'.format(
+                            len([q for q in newQueueConfig if q not in self.builtQueueConfigCache
+                                 or self.builtQueueConfigCache[q][0] != fingerprintMap[q]]),
+                            len(newQueueConfig)))
             # auto blacklisting
             autoBlacklist = False
             if resolver is not None and hasattr(harvester_config.qconf, 'autoBlacklist') and \
@@ -553,16 +598,26 @@ class QueueConfigMapper(six.with_metaclass(SingletonWithID, object)):
                         queueName not in harvester_config.qconf.queueList:
                     continue
                 activeQueues[queueName] = queueConfig
-            self.queueConfig = newQueueConfig
-            self.activeQueues = activeQueues
             newQueueConfigWithID = dict()
             for dumpSpec in queueConfigDumps.values():
+                if dumpSpec.configID in self.queueConfigWithID:
+                    # dumps are immutable for configID
+                    newQueueConfigWithID[dumpSpec.configID] = self.queueConfigWithID[dumpSpec.configID]
+                    continue
                 queueConfig = QueueConfig(dumpSpec.queueName)
                 queueConfig.update_attributes(dumpSpec.data)
                 queueConfig.configID = dumpSpec.configID
                 newQueueConfigWithID[dumpSpec.configID] = queueConfig
+            # swap in new configs all together
+            self.queueConfig = newQueueConfig
+            self.activeQueues = activeQueues
             self.queueConfigWithID = newQueueConfigWithID
+            self.builtQueueConfigCache = newBuiltQueueConfigCache
             self.lastUpdate = datetime.datetime.utcnow()
+            # drop plugin instances made with old configs
+            PluginFactory.invalidate_instance_cache()
+        finally:
+            self.lock.release()
         # update database
         if self.toUpdateDB:
             self.dbProxy.fill_panda_queue_table(self.activeQueues.keys(), self)
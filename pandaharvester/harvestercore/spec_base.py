@@ -5,7 +5,8 @@ Base class for XyzSpec
 
 import json
 import pickle
-from future.utils import iteritems
+import threading
+from future.utils import iteritems, with_metaclass
 
 import rpyc
 
@@ -25,6 +26,13 @@ class PythonObjectEncoder(json.JSONEncoder):
         return retVal
 
 
+# lock to decode blob attributes
+_lazyBlobLock = threading.Lock()
+
+# marker for missing blob
+_noBlob = object()
+
+
 # hook for decoder
 def as_python_object(dct):
     if '_non_json_object' in dct:
@@ -32,101 +40,181 @@ def as_python_object(dct):
     return dct
 
 
+# metaclass to precompute attributes and to store them in slots
+class SpecMeta(type):
+    def __new__(mcs, name, bases, dct):
+        attributesWithTypes = dct.get('attributesWithTypes')
+        if attributesWithTypes is None:
+            for base in bases:
+                if hasattr(base, 'attributesWithTypes'):
+                    attributesWithTypes = base.attributesWithTypes
+                    break
+            else:
+                attributesWithTypes = ()
+        # remove types
+        attributes = []
+        serializedAttrs = set()
+        for attr in attributesWithTypes:
+            attr, attrType = attr.split(':')
+            attrType = attrType.split()[0]
+            attributes.append(attr)
+            if attrType in ['blob']:
+                serializedAttrs.add(attr)
+        dct['attributes'] = tuple(attributes)
+        dct['serializedAttrs'] = frozenset(serializedAttrs)
+        # slots for attributes and extra members which are not defined in base classes
+        baseSlots = set()
+        for base in bases:
+            for klass in base.__mro__:
+                baseSlots.update(klass.__dict__.get('__slots__', ()))
+        slots = [attr for attr in dct.get('__slots__', ()) if attr not in baseSlots]
+        slots += [attr for attr in attributes if attr not in baseSlots and attr not in slots]
+        dct['__slots__'] = tuple(slots)
+        # all slots to be pickled
+        dct['slotAttrs'] = tuple(attr for attr in list(baseSlots) + slots if attr != 'changedAttrs')
+        # initial values
+        zeroAttrs = dct.get('zeroAttrs')
+        if zeroAttrs is None:
+            for base in bases:
+                if hasattr(base, 'zeroAttrs'):
+                    zeroAttrs = base.zeroAttrs
+                    break
+            else:
+                zeroAttrs = ()
+        dct['initialValues'] = tuple((attr, 0 if attr in zeroAttrs else None) for attr in attributes)
+        return type.__new__(mcs, name, bases, dct)
+
+
 # base class for XyzSpec
-class SpecBase(object):
+class SpecBase(with_metaclass(SpecMeta, object)):
     # to be set
     attributesWithTypes = ()
     zeroAttrs = ()
     skipAttrsToSlim = ()
 
+    # members other than attributes
+    __slots__ = ('changedAttrs', 'lazyBlobs')
+
     # constructor
     def __init__(self):
-        # remove types
-        object.__setattr__(self, 'attributes', [])
-        object.__setattr__(self, 'serializedAttrs', set())
-        for attr in self.attributesWithTypes:
-            attr, attrType = attr.split(':')
-            attrType = attrType.split()[0]
-            self.attributes.append(attr)
-            if attrType in ['blob']:
-                self.serializedAttrs.add(attr)
         # install attributes
-        for attr in self.attributes:
-            if attr in self.zeroAttrs:
-                object.__setattr__(self, attr, 0)
-            else:
-                object.__setattr__(self, attr, None)
-        # map of changed attributes
-        object.__setattr__(self, 'changedAttrs', {})
+        for attr, val in self.initialValues:
+            object.__setattr__(self, attr, val)
+        # set of changed attributes
+        object.__setattr__(self, 'changedAttrs', set())
+        # serialized values of blob attributes to be decoded at the first access
+        object.__setattr__(self, 'lazyBlobs', {})
+
+    # decode blob attributes at the first access
+    def __getattr__(self, name):
+        try:
+            lazyBlobs = object.__getattribute__(self, 'lazyBlobs')
+        except AttributeError:
+            lazyBlobs = {}
+        if name not in lazyBlobs:
+            return object.__getattribute__(self, name)
+        with _lazyBlobLock:
+            val = lazyBlobs.pop(name, _noBlob)
+            if val is _noBlob:
+                # decoded by another thread in the meantime
+                return object.__getattribute__(self, name)
+            try:
+                val = json.loads(val, object_hook=as_python_object)
+            except JSONDecodeError:
+                pass
+            object.__setattr__(self, name, val)
+        return val
 
     # override __setattr__ to collect changed attributes
     def __setattr__(self, name, value):
         oldVal = getattr(self, name)
         object.__setattr__(self, name, value)
-        newVal = getattr(self, name)
         # collect changed attributes
-        if oldVal != newVal:
-            self.changedAttrs[name] = value
+        if oldVal != value:
+            self.changedAttrs.add(name)
 
     # keep state for pickle
     def __getstate__(self):
-        odict = self.__dict__.copy()
-        del odict['changedAttrs']
+        odict = dict()
+        for attr in self.slotAttrs:
+            try:
+                odict[attr] = object.__getattribute__(self, attr)
+            except AttributeError:
+                # blob attributes not decoded yet
+                pass
+        # not to share undecoded blobs with copies
+        if 'lazyBlobs' in odict:
+            odict['lazyBlobs'] = dict(odict['lazyBlobs'])
         return odict
 
     # restore state from the unpickled state values
     def __setstate__(self, state):
         self.__init__()
+        slotAttrs = self.slotAttrs
         for k, v in state.items():
+            # skip members which were in instance dict in old versions
+            if k not in slotAttrs:
+                continue
+            if k == 'lazyBlobs':
+                v = dict(v)
             object.__setattr__(self, k, v)
+        # blob attributes not decoded yet
+        for attr in self.lazyBlobs:
+            try:
+                object.__delattr__(self, attr)
+            except AttributeError:
+                pass
 
     # reset changed attribute list
     def reset_changed_list(self):
-        object.__setattr__(self, 'changedAttrs', {})
+        object.__setattr__(self, 'changedAttrs', set())
 
     # force update
     def force_update(self, name):
         if name in self.attributes:
-            self.changedAttrs[name] = getattr(self, name)
+            self.changedAttrs.add(name)
 
     # force not update
     def force_not_update(self, name):
-        if name in self.changedAttrs:
-            del self.changedAttrs[name]
+        self.changedAttrs.discard(name)
 
     # check if attributes are updated
     def has_updated_attributes(self):
         return len(self.changedAttrs) > 0
 
-    # pack into attributes
+    # pack into attributes. Blob attributes are decoded at the first access
     def pack(self, values, slim=False):
         if hasattr(values, '_asdict'):
             values = values._asdict()
+        lazyBlobs = {}
         for attr in self.attributes:
             if slim and attr in self.skipAttrsToSlim:
                 val = None
             else:
                 val = values[attr]
                 if attr in self.serializedAttrs and val is not None:
+                    lazyBlobs[attr] = val
                     try:
-                        val = json.loads(val, object_hook=as_python_object)
-                    except JSONDecodeError:
+                        object.__delattr__(self, attr)
+                    except AttributeError:
                         pass
+                    continue
             object.__setattr__(self, attr, val)
+        object.__setattr__(self, 'lazyBlobs', lazyBlobs)
 
     # set blob attribute
     def set_blob_attribute(self, key, val):
         try:
             val = json.loads(val, object_hook=as_python_object)
             object.__setattr__(self, key, val)
+            self.lazyBlobs.pop(key, None)
         except JSONDecodeError:
             pass
 
     # return column names for INSERT
     def column_names(cls, prefix=None, slim=False):
         ret = ""
-        for attr in cls.attributesWithTypes:
-            attr = attr.split(':')[0]
+        for attr in cls.attributes:
             if slim and attr in cls.skipAttrsToSlim:
                 continue
             if prefix is None:
@@ -141,8 +229,7 @@ class SpecBase(object):
     # return expression of bind variables for INSERT
     def bind_values_expression(cls):
         ret = "VALUES("
-        for attr in cls.attributesWithTypes:
-            attr = attr.split(':')[0]
+        for attr in cls.attributes:
             ret += ":%s," % attr
         ret = ret[:-1]
         ret += ")"
@@ -168,6 +255,11 @@ class SpecBase(object):
             if only_changed:
                 if attr not in self.changedAttrs:
                     continue
+            # blob attributes not decoded yet
+            blob = self.lazyBlobs.get(attr, _noBlob)
+            if blob is not _noBlob:
+                ret[':%s' % attr] = blob
+                continue
             val = getattr(self, attr)
             if val is None:
                 if attr in self.zeroAttrs:
@@ -179,6 +271,10 @@ class SpecBase(object):
             ret[':%s' % attr] = val
         return ret
 
+    # return dict of attributes and values
+    def to_dict(self):
+        return dict((attr, getattr(self, attr)) for attr in self.attributes)
+
     # return list of values
     def values_list(self, only_changed=False):
         ret = []
@@ -187,6 +283,11 @@ class SpecBase(object):
             if only_changed:
                 if attr not in self.changedAttrs:
                     continue
+            # blob attributes not decoded yet
+            blob = self.lazyBlobs.get(attr, _noBlob)
+            if blob is not _noBlob:
+                ret.append(blob)
+                continue
             val = getattr(self, attr)
             if val is None:
                 if attr in self.zeroAttrs:
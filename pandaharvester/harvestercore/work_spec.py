@@ -47,6 +47,9 @@ class WorkSpec(SpecBase):
     EV_useEvents = 1
     EV_requestEvents = 2
 
+    # members other than attributes
+    __slots__ = ('isNew', 'nextLookup', 'jobspec_list', 'pandaid_list', 'new_status', 'pilot_closed')
+
     # attributes
     attributesWithTypes = ('workerID:integer primary key',
                            'batchID:text',
@@ -343,6 +343,24 @@ class MysqlFifo(PluginBase):
             self.rollback()
             raise _e
 
+    # enqueue list of objects with priority scores in one transaction
+    def putmany(self, item_score_list):
+        sql_push = (
+                'INSERT INTO {table_name} '
+                '(item, score) '
+                'VALUES (%s, %s) '
+            ).format(table_name=self.tableName)
+        params_list = [(item, score) for item, score in item_score_list]
+        try:
+            self.executemany(sql_push, params_list)
+            n_row = self.cur.rowcount
+            self.commit()
+        except Exception as _e:
+            self.rollback()
+            raise _e
+        else:
+            return n_row
+
     # enqueue by id
     def putbyid(self, id, item, score):
         try:
@@ -381,35 +399,32 @@ class MysqlFifo(PluginBase):
                 '{maxscore_str} '
                 'ORDER BY score {rank} '
                 '{count_str} '
+                'FOR UPDATE '
             ).format(table_name=self.tableName, temporary_str=temporary_str,
                 minscore_str=minscore_str, maxscore_str=maxscore_str,
                 rank=mode_rank_map[mode], count_str=count_str)
-        sql_pop_to_temp = (
+        sql_pop_to_temp_template = (
                 'UPDATE {table_name} SET temporary = 1 '
-                'WHERE id = %s AND temporary = 0 '
+                'WHERE id IN ({{0}}) AND temporary = 0 '
             ).format(table_name=self.tableName)
-        sql_pop_del = (
+        sql_pop_del_template = (
                 'DELETE FROM {table_name} '
-                'WHERE id = %s AND temporary = {temporary} '
+                'WHERE id IN ({{0}}) AND temporary = {temporary} '
             ).format(table_name=self.tableName, temporary=(1 if temporary else 0))
         ret_list = []
         try:
+            # rows are locked until commit
             self.execute(sql_get_many)
             res = self.cur.fetchall()
-            for _rec in res:
-                got_object =False
-                id, item, score = _rec
-                params = (id,)
+            if len(res) > 0:
+                params = tuple(_rec[0] for _rec in res)
+                placeholders_str = ','.join(['%s'] * len(params))
                 if protective:
-                    self.execute(sql_pop_to_temp, params)
+                    self.execute(sql_pop_to_temp_template.format(placeholders_str), params)
                 else:
-                    self.execute(sql_pop_del, params)
-                n_row = self.cur.rowcount
-                self.commit()
-                if n_row >= 1:
-                    got_object = True
-                if got_object:
-                    ret_list.append(_rec)
+                    self.execute(sql_pop_del_template.format(placeholders_str), params)
+            self.commit()
+            ret_list = list(res)
         except Exception as _e:
             self.rollback()
             _exc = _e
@@ -38,6 +38,8 @@ class RedisFifo(PluginBase):
         self.id_score = '{0}-fifo_id-score'.format(self.titleName)
         self.id_item = '{0}-fifo_id-item'.format(self.titleName)
         self.id_temp = '{0}-fifo_id-temp'.format(self.titleName)
+        # scores of objects in temporary space, to restore them
+        self.id_temp_score = '{0}-fifo_id-temp_score'.format(self.titleName)
 
     def __len__(self):
         return self.qconn.zcard(self.id_score)
@@ -55,9 +57,14 @@ class RedisFifo(PluginBase):
                 return None
         else:
             resVal = self.qconn.sismember(self.id_temp, id)
-            if (mode == 'id' and not resVal) or (mode == 'idtemp' and resVal):
+            if mode == 'id' and not resVal:
                 id_gotten = id
                 score = self.qconn.zscore(self.id_score, id)
+            elif mode == 'idtemp' and resVal:
+                id_gotten = id
+                score = self.qconn.hget(self.id_temp_score, id)
+                if score is not None:
+                    score = float(score)
             else:
                 id_gotten, score = None, None
         if skip_item:
@@ -86,12 +93,14 @@ class RedisFifo(PluginBase):
                 while True:
                     try:
                         with self.qconn.pipeline() as pipeline:
-                            pipeline.watch(self.id_score, self.id_item, self.id_temp)
+                            pipeline.watch(self.id_score, self.id_item, self.id_temp, self.id_temp_score)
                             pipeline.multi()
                             if protective:
+                                pipeline.hset(self.id_temp_score, id, score)
                                 pipeline.sadd(self.id_temp, id)
                                 pipeline.zrem(self.id_score, id)
                             else:
+                                pipeline.hdel(self.id_temp_score, id)
                                 pipeline.srem(self.id_temp, id)
                                 pipeline.hdel(self.id_item, id)
                                 pipeline.zrem(self.id_score, id)
@@ -139,6 +148,41 @@ class RedisFifo(PluginBase):
             time.sleep(0.0001)
         return False
 
+    # enqueue list of objects with priority scores in one transaction
+    def putmany(self, item_score_list):
+        n_put = 0
+        remaining_list = list(item_score_list)
+        generate_id_attempt_timestamp = time.time()
+        while True:
+            id_list = [random_id() for _ in remaining_list]
+            resVal = None
+            with self.qconn.pipeline() as pipeline:
+                while True:
+                    try:
+                        pipeline.watch(self.id_score, self.id_item)
+                        pipeline.multi()
+                        for id, (item, score) in zip(id_list, remaining_list):
+                            pipeline.execute_command('ZADD', self.id_score, 'NX', score, id)
+                            pipeline.hsetnx(self.id_item, id, item)
+                        resVal = pipeline.execute()
+                    except redis.WatchError:
+                        continue
+                    else:
+                        break
+            # retry objects with duplicated ids
+            failed_list = []
+            for i_obj, item_score in enumerate(remaining_list):
+                if resVal[2*i_obj] == 1 and resVal[2*i_obj+1] == 1:
+                    n_put += 1
+                else:
+                    failed_list.append(item_score)
+            if not failed_list:
+                return n_put
+            remaining_list = failed_list
+            if time.time() > generate_id_attempt_timestamp + 60:
+                raise Exception('Cannot generate unique id')
+            time.sleep(0.0001)
+
     # enqueue by id
     def putbyid(self, id, item, score):
         with self.qconn.pipeline() as pipeline:
@@ -166,6 +210,89 @@ class RedisFifo(PluginBase):
     def getlast(self, timeout=None, protective=False):
         return self._pop(timeout=timeout, protective=protective, mode='last')
 
+    # dequeue list of objects with some conditions
+    def getmany(self, mode='first', minscore=None, maxscore=None, count=None,
+                    protective=False, temporary=False):
+        if temporary:
+            return self._getmany_temporary(mode=mode, minscore=minscore, maxscore=maxscore, count=count,
+                                           protective=protective)
+        minscore_str = '-inf' if minscore is None else float(minscore)
+        maxscore_str = '+inf' if maxscore is None else float(maxscore)
+        range_kwargs = {'withscores': True}
+        if count is not None:
+            range_kwargs.update({'start': 0, 'num': int(count)})
+        ret_list = []
+        with self.qconn.pipeline() as pipeline:
+            while True:
+                try:
+                    pipeline.watch(self.id_score, self.id_item, self.id_temp, self.id_temp_score)
+                    if mode == 'last':
+                        id_score_list = pipeline.zrevrangebyscore(self.id_score, maxscore_str, minscore_str,
+                                                                  **range_kwargs)
+                    else:
+                        id_score_list = pipeline.zrangebyscore(self.id_score, minscore_str, maxscore_str,
+                                                               **range_kwargs)
+                    ids = [id for id, score in id_score_list]
+                    if not ids:
+                        break
+                    item_list = pipeline.hmget(self.id_item, ids)
+                    pipeline.multi()
+                    if protective:
+                        pipeline.hmset(self.id_temp_score, dict(id_score_list))
+                        pipeline.sadd(self.id_temp, *ids)
+                        pipeline.zrem(self.id_score, *ids)
+                    else:
+                        pipeline.hdel(self.id_temp_score, *ids)
+                        pipeline.srem(self.id_temp, *ids)
+                        pipeline.hdel(self.id_item, *ids)
+                        pipeline.zrem(self.id_score, *ids)
+                    pipeline.execute()
+                except redis.WatchError:
+                    continue
+                else:
+                    ret_list = [(id, item, score) for (id, score), item in zip(id_score_list, item_list)]
+                    break
+        return ret_list
+
+    # get list of objects in temporary space with some conditions. They are deleted unless protective
+    def _getmany_temporary(self, mode='first', minscore=None, maxscore=None, count=None, protective=False):
+        ret_list = []
+        with self.qconn.pipeline() as pipeline:
+            while True:
+                try:
+                    pipeline.watch(self.id_item, self.id_temp, self.id_temp_score)
+                    ids = list(pipeline.smembers(self.id_temp))
+                    if not ids:
+                        break
+                    id_score_list = []
+                    for id, score in zip(ids, pipeline.hmget(self.id_temp_score, ids)):
+                        score = None if score is None else float(score)
+                        if minscore is not None and (score is None or score < minscore):
+                            continue
+                        if maxscore is not None and (score is None or score > maxscore):
+                            continue
+                        id_score_list.append((id, score))
+                    # objects without score go last
+                    id_score_list.sort(key=lambda x: (x[1] is None, x[1]), reverse=(mode == 'last'))
+                    if count is not None:
+                        id_score_list = id_score_list[:int(count)]
+                    ids = [id for id, score in id_score_list]
+                    if not ids:
+                        break
+                    item_list = pipeline.hmget(self.id_item, ids)
+                    pipeline.multi()
+                    if not protective:
+                        pipeline.hdel(self.id_temp_score, *ids)
+                        pipeline.srem(self.id_temp, *ids)
+                        pipeline.hdel(self.id_item, *ids)
+                    pipeline.execute()
+                except redis.WatchError:
+                    continue
+                else:
+                    ret_list = [(id, item, score) for (id, score), item in zip(id_score_list, item_list)]
+                    break
+        return ret_list
+
     # get tuple of (id, item, score) of the first object without dequeuing it
     def peek(self, skip_item=False):
         return self._peek(skip_item=skip_item)
@@ -186,11 +313,12 @@ class RedisFifo(PluginBase):
         with self.qconn.pipeline() as pipeline:
             while True:
                 try:
-                    pipeline.watch(self.id_score, self.id_item, self.id_temp)
+                    pipeline.watch(self.id_score, self.id_item, self.id_temp, self.id_temp_score)
                     pipeline.multi()
                     pipeline.delete(self.id_score)
                     pipeline.delete(self.id_item)
                     pipeline.delete(self.id_temp)
+                    pipeline.delete(self.id_temp_score)
                     pipeline.execute()
                 except redis.WatchError:
                     continue
@@ -203,8 +331,9 @@ class RedisFifo(PluginBase):
             with self.qconn.pipeline() as pipeline:
                 while True:
                     try:
-                        pipeline.watch(self.id_score, self.id_item, self.id_temp)
+                        pipeline.watch(self.id_score, self.id_item, self.id_temp, self.id_temp_score)
                         pipeline.multi()
+                        pipeline.hdel(self.id_temp_score, *ids)
                         pipeline.srem(self.id_temp, *ids)
                         pipeline.hdel(self.id_item, *ids)
                         pipeline.zrem(self.id_score, *ids)
@@ -223,18 +352,21 @@ class RedisFifo(PluginBase):
             while True:
                 now_timestamp = time.time()
                 try:
-                    pipeline.watch(self.id_score, self.id_item, self.id_temp)
+                    pipeline.watch(self.id_score, self.id_item, self.id_temp, self.id_temp_score)
                     if ids is None:
+                        ids = list(pipeline.smembers(self.id_temp))
+                    elif not isinstance(ids, (list, tuple)):
+                        raise TypeError('ids should be list or tuple or None')
+                    if len(ids) > 0:
+                        # put back to the queue with original scores
+                        score_list = pipeline.hmget(self.id_temp_score, ids)
                         pipeline.multi()
-                        pipeline.delete(self.id_temp)
+                        for id, score in zip(ids, score_list):
+                            if score is not None:
+                                pipeline.execute_command('ZADD', self.id_score, 'NX', score, id)
+                        pipeline.hdel(self.id_temp_score, *ids)
+                        pipeline.srem(self.id_temp, *ids)
                         pipeline.execute()
-                    elif isinstance(ids, (list, tuple)):
-                        if len(ids) > 0:
-                            pipeline.multi()
-                            pipeline.srem(self.id_temp, *ids)
-                            pipeline.execute()
-                    else:
-                        raise TypeError('ids should be list or tuple or None')
                 except redis.WatchError:
                     continue
                 else:
@@ -1,6 +1,7 @@
 import os
 import time
 import re
+import threading
 
 import sqlite3
 
@@ -18,6 +19,18 @@ except NameError:
     memoryviewOrBuffer = memoryview
 
 
+# condition variables and generation counters shared by fifos on the same database file
+_notify_map = {}
+_notify_map_lock = threading.Lock()
+
+
+def _get_notifier(db_path):
+    with _notify_map_lock:
+        if db_path not in _notify_map:
+            _notify_map[db_path] = [threading.Condition(), 0]
+        return _notify_map[db_path]
+
+
 class SqliteFifo(PluginBase):
 
     # template of SQL commands
@@ -71,6 +84,7 @@ class SqliteFifo(PluginBase):
     _clear_delete_table_sql = 'DELETE FROM queue_table'
     _clear_drop_table_sql = 'DROP TABLE IF EXISTS queue_table'
     _clear_zero_id_sql = 'DELETE FROM sqlite_sequence WHERE name = "queue_table"'
+    _data_version_sql = 'PRAGMA data_version'
     _peek_sql = (
             'SELECT id, item, score FROM queue_table '
             'WHERE temporary = 0 '
@@ -93,6 +107,10 @@ class SqliteFifo(PluginBase):
         _db_filename = re.sub('\$\(AGENT\)', self.titleName, _db_filename)
         self.db_path = os.path.abspath(_db_filename)
         self._connection_cache = {}
+        # interval in sec to look for objects put by other processes while waiting
+        if not hasattr(self, 'poll_interval'):
+            self.poll_interval = getattr(harvester_config.fifo, 'sqlitePollInterval', 1)
+        self._notifier = _get_notifier(self.db_path)
         with self._get_conn() as conn:
             conn.execute(self._exclusive_lock_sql)
             conn.execute(self._create_sql)
@@ -115,30 +133,52 @@ class SqliteFifo(PluginBase):
             self._connection_cache[id] = sqlite3.Connection(self.db_path, timeout=60)
         return self._connection_cache[id]
 
+    # wake up consumers waiting in the same process
+    def _notify(self):
+        cond = self._notifier[0]
+        with cond:
+            self._notifier[1] += 1
+            cond.notify_all()
+
+    # version of the database file which changes when other connections commit
+    def _data_version(self, conn):
+        try:
+            return next(conn.execute(self._data_version_sql))[0]
+        except Exception:
+            # old sqlite without data_version
+            return None
+
     def _pop(self, get_sql, timeout=None, protective=False):
-        keep_polling = True
-        wait = 0.1
-        max_wait = 2
-        tries = 0
-        last_attempt_timestamp = time.time()
+        cond = self._notifier[0]
+        deadline = None if timeout is None else time.time() + timeout
+        last_version = None
         with self._get_conn() as conn:
             id = None
-            while keep_polling:
-                conn.execute(self._write_lock_sql)
-                cursor = conn.execute(get_sql)
-                try:
-                    id, item_buf, score = next(cursor)
-                    keep_polling = False
-                except StopIteration:
-                    # unlock the database
-                    conn.commit()
-                    now_timestamp = time.time()
-                    if timeout is None or (now_timestamp - last_attempt_timestamp) >= timeout:
-                        keep_polling = False
-                        continue
-                    tries += 1
-                    time.sleep(wait)
-                    wait = min(max_wait, tries/10.0 + wait)
+            while True:
+                with cond:
+                    generation = self._notifier[1]
+                version = self._data_version(conn)
+                if last_version is None or version is None or version != last_version:
+                    conn.execute(self._write_lock_sql)
+                    cursor = conn.execute(get_sql)
+                    try:
+                        id, item_buf, score = next(cursor)
+                        break
+                    except StopIteration:
+                        # unlock the database
+                        conn.commit()
+                    last_version = version
+                if deadline is None:
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                # sleep until notified by a producer in this process or the poll interval passes
+                with cond:
+                    if self._notifier[1] == generation:
+                        cond.wait(min(remaining, self.poll_interval))
+                    if self._notifier[1] != generation:
+                        last_version = None
             if id is not None:
                 if protective:
                     conn.execute(self._move_to_temp_sql, (id,))
@@ -185,8 +225,21 @@ class SqliteFifo(PluginBase):
             n_row =  cursor.rowcount
             if n_row == 1:
                 retVal = True
+        if retVal:
+            self._notify()
         return retVal
 
+    # enqueue list of objects with priority scores in one transaction
+    def putmany(self, item_score_list):
+        params_list = [(memoryviewOrBuffer(item), score) for item, score in item_score_list]
+        with self._get_conn() as conn:
+            conn.execute(self._write_lock_sql)
+            cursor = conn.executemany(self._push_sql, params_list)
+            n_row = cursor.rowcount
+        if n_row:
+            self._notify()
+        return n_row
+
     # enqueue by id
     def putbyid(self, id, item, score):
         retVal = False
@@ -196,6 +249,8 @@ class SqliteFifo(PluginBase):
             n_row =  cursor.rowcount
             if n_row == 1:
                 retVal = True
+        if retVal:
+            self._notify()
         return retVal
 
     # dequeue the first object
@@ -286,6 +341,7 @@ class SqliteFifo(PluginBase):
                 conn.execute(self._restore_sql_template.format(placeholders_str), ids)
             else:
                 raise TypeError('ids should be list or tuple or None')
+        self._notify()
 
     # update a object by its id with some conditions
     def update(self, id, item=None, score=None, temporary=None, cond_score=None):
@@ -1,4 +1,27 @@
 from pandaharvester.harvestercore.plugin_base import PluginBase
+from pandaharvester.harvestercore.work_spec import WorkSpec
+
+
+# inspect a worker with a messenger, to be used by messengers and proxies without bulk inspection
+def inspect_one_worker(messenger, workspec, heartbeat_limit=None):
+    retDict = {'killRequested': messenger.kill_requested(workspec),
+               'isAlive': None,
+               'workAttributes': None,
+               'filesToStageOut': None,
+               'eventsToUpdate': [],
+               'eventsRequestParams': {},
+               'pandaIDs': []}
+    if heartbeat_limit:
+        retDict['isAlive'] = messenger.is_alive(workspec, heartbeat_limit)
+    retDict['workAttributes'] = messenger.get_work_attributes(workspec)
+    retDict['filesToStageOut'] = messenger.get_files_to_stage_out(workspec)
+    if workspec.eventsRequest in [WorkSpec.EV_useEvents, WorkSpec.EV_requestEvents]:
+        retDict['eventsToUpdate'] = messenger.events_to_update(workspec)
+    if workspec.eventsRequest == WorkSpec.EV_useEvents:
+        retDict['eventsRequestParams'] = messenger.events_requested(workspec)
+    if workspec.mapType == WorkSpec.MT_NoJob:
+        retDict['pandaIDs'] = messenger.get_panda_ids(workspec)
+    return retDict
 
 
 # base messenger
@@ -75,6 +98,15 @@ class BaseMessenger(PluginBase):
     def is_alive(self, workspec, time_limit):
         return None
 
+    # inspect workers in bulk. Returns {workerID: {'killRequested', 'isAlive', 'workAttributes', 'filesToStageOut',
+    # 'eventsToUpdate', 'eventsRequestParams', 'pandaIDs'}}
+    # * messengers can override it to inspect many workers more efficiently than one by one
+    def inspect_workers(self, workspec_list, heartbeat_limit=None):
+        retMap = dict()
+        for workspec in workspec_list:
+            retMap[workspec.workerID] = inspect_one_worker(self, workspec, heartbeat_limit)
+        return retMap
+
     # clean up. Called by sweeper agent to clean up stuff made by messenger for the worker
     def clean_up(self, workspec):
         return (None, 'skipped')
@@ -1,7 +1,9 @@
 import json
 import os
 import shutil
+import copy
 import datetime
+import threading
 
 try:
     from urllib.parse import urlencode
@@ -30,7 +32,7 @@ from concurrent.futures import ThreadPoolExecutor as Pool
 
 from pandaharvester.harvestercore import core_utils
 from pandaharvester.harvestercore.work_spec import WorkSpec
-from .base_messenger import BaseMessenger
+from .base_messenger import BaseMessenger, inspect_one_worker
 from pandaharvester.harvesterconfig import harvester_config
 
 # json for worker attributes
@@ -81,6 +83,12 @@ except Exception:
 # suffix to read json
 suffixReadJson = '.read'
 
+# max number of workers to cache parsed json files
+try:
+    jsonCacheSize = harvester_config.payload_interaction.jsonCacheSize
+except Exception:
+    jsonCacheSize = 10000
+
 # logger
 _logger = core_utils.setup_logger('shared_file_messenger')
 
@@ -90,6 +98,69 @@ def set_logger(master_logger):
     _logger = master_logger
 
 
+# parsed json files; workerID -> {path: (file status, parsed object)}
+_jsonCache = core_utils.LRUCache(jsonCacheSize)
+
+
+# load json, reusing the last result if the file is unchanged. The returned object is shared so must not be modified
+def _load_json(workspec, path):
+    tmpStat = os.stat(path)
+    fileStatus = (tmpStat.st_size, getattr(tmpStat, 'st_mtime_ns', tmpStat.st_mtime), tmpStat.st_ino)
+    workerCache = _jsonCache.get(workspec.workerID)
+    if workerCache is None:
+        workerCache = dict()
+        _jsonCache[workspec.workerID] = workerCache
+    cachedEntry = workerCache.get(path)
+    if cachedEntry is not None and cachedEntry[0] == fileStatus:
+        return cachedEntry[1]
+    with open(path) as jsonFile:
+        loadedObj = json.load(jsonFile)
+    workerCache[path] = (fileStatus, loadedObj)
+    return loadedObj
+
+
+# file names in directories scanned by the current thread while inspecting a worker
+_scannedDirs = threading.local()
+
+
+# scan directories to check file existence without stat on each file
+def _scan_dirs(dir_list):
+    scannedMap = dict()
+    for dirName in dir_list:
+        if dirName in scannedMap:
+            continue
+        try:
+            scannedMap[dirName] = set([entry.name for entry in scandir(dirName)])
+        except Exception:
+            # check files one by one
+            pass
+    _scannedDirs.map = scannedMap
+
+
+# clear scanned directories
+def _clear_scanned_dirs():
+    _scannedDirs.map = None
+
+
+# check if a file exists, using scanned directories if available
+def _file_exists(path):
+    scannedMap = getattr(_scannedDirs, 'map', None)
+    if scannedMap:
+        dirName, fileName = os.path.split(path)
+        if dirName in scannedMap:
+            return fileName in scannedMap[dirName]
+    return os.path.exists(path)
+
+
+# record a file created after scan
+def _mark_file_created(path):
+    scannedMap = getattr(_scannedDirs, 'map', None)
+    if scannedMap:
+        dirName, fileName = os.path.split(path)
+        if dirName in scannedMap:
+            scannedMap[dirName].add(fileName)
+
+
 # filter for log.tgz
 def filter_log_tgz(extra=None):
     patt = ['*.log', '*.txt', '*.xml', '*.json', 'log*']
@@ -162,6 +233,7 @@ class SharedFileMessenger(BaseMessenger):
         self.stripJobParams = False
         self.scanInPostProcess = False
         self.leftOverPatterns = None
+        self.nThreadsToInspect = 8
         BaseMessenger.__init__(self, **kwarg)
 
     # get access point
@@ -187,27 +259,25 @@ class SharedFileMessenger(BaseMessenger):
             jsonFilePath = os.path.join(accessPoint, jsonAttrsFileName)
             tmpLog.debug('looking for attributes file {0}'.format(jsonFilePath))
             retDict = dict()
-            if not os.path.exists(jsonFilePath):
+            if not _file_exists(jsonFilePath):
                 # not found
                 tmpLog.debug('not found attributes file')
             else:
                 try:
-                    with open(jsonFilePath) as jsonFile:
-                        retDict = json.load(jsonFile)
+                    retDict = copy.copy(_load_json(workspec, jsonFilePath))
                 except Exception:
                     tmpLog.debug('failed to load {0}'.format(jsonFilePath))
             # look for job report
             jsonFilePath = os.path.join(accessPoint, jsonJobReport)
             tmpLog.debug('looking for job report file {0}'.format(jsonFilePath))
             sw_checkjobrep = core_utils.get_stopwatch()
-            if not os.path.exists(jsonFilePath):
+            if not _file_exists(jsonFilePath):
                 # not found
                 tmpLog.debug('not found job report file')
             else:
                 try:
                     sw_readrep = core_utils.get_stopwatch()
-                    with open(jsonFilePath) as jsonFile:
-                        tmpDict = json.load(jsonFile)
+                    tmpDict = _load_json(workspec, jsonFilePath)
                     retDict['metaData'] = tmpDict
                     tmpLog.debug('got {0} kB of job report. {1} sec.'.format(os.stat(jsonFilePath).st_size / 1024,
                                                                              sw_readrep.get_elapsed_time()))
@@ -235,11 +305,11 @@ class SharedFileMessenger(BaseMessenger):
             readJsonPath = jsonFilePath + suffixReadJson
             # first look for json.read which is not yet acknowledged
             tmpLog.debug('looking for output file {0}'.format(readJsonPath))
-            if os.path.exists(readJsonPath):
+            if _file_exists(readJsonPath):
                 pass
             else:
                 tmpLog.debug('looking for output file {0}'.format(jsonFilePath))
-                if not os.path.exists(jsonFilePath):
+                if not _file_exists(jsonFilePath):
                     # not found
                     tmpLog.debug('not found')
                     continue
@@ -247,6 +317,7 @@ class SharedFileMessenger(BaseMessenger):
                     tmpLog.debug('found')
                     # rename to prevent from being overwritten
                     os.rename(jsonFilePath, readJsonPath)
+                    _mark_file_created(readJsonPath)
                 except Exception:
                     tmpLog.error('failed to rename json')
                     continue
@@ -254,8 +325,7 @@ class SharedFileMessenger(BaseMessenger):
             toSkip = False
             loadDict = None
             try:
-                with open(readJsonPath) as jsonFile:
-                    loadDict = json.load(jsonFile)
+                loadDict = _load_json(workspec, readJsonPath)
             except Exception:
                 tmpLog.error('failed to load json')
                 toSkip = True
@@ -339,6 +409,7 @@ class SharedFileMessenger(BaseMessenger):
                         json.dump(eventsList, f)
                         f.close()
                         os.rename(newName, curName)
+                        _mark_file_created(curName)
             # remove empty file
             if toSkip or nData == 0:
                 try:
@@ -357,7 +428,7 @@ class SharedFileMessenger(BaseMessenger):
         # look for the json just under the access point
         jsonFilePath = os.path.join(workspec.get_access_point(), jsonJobRequestFileName)
         tmpLog.debug('looking for job request file {0}'.format(jsonFilePath))
-        if not os.path.exists(jsonFilePath):
+        if not _file_exists(jsonFilePath):
             # not found
             tmpLog.debug('not found')
             return False
@@ -437,7 +508,7 @@ class SharedFileMessenger(BaseMessenger):
         # look for the json just under the access point
         jsonFilePath = os.path.join(workspec.get_access_point(), jsonEventsRequestFileName)
         tmpLog.debug('looking for event request file {0}'.format(jsonFilePath))
-        if not os.path.exists(jsonFilePath):
+        if not _file_exists(jsonFilePath):
             # not found
             tmpLog.debug('not found')
             return {}
@@ -495,31 +566,30 @@ class SharedFileMessenger(BaseMessenger):
             readJsonPath = jsonFilePath + suffixReadJson
             # first look for json.read which is not yet acknowledged
             tmpLog.debug('looking for event update file {0}'.format(readJsonPath))
-            if os.path.exists(readJsonPath):
+            if _file_exists(readJsonPath):
                 pass
             else:
                 tmpLog.debug('looking for event update file {0}'.format(jsonFilePath))
-                if not os.path.exists(jsonFilePath):
+                if not _file_exists(jsonFilePath):
                     # not found
                     tmpLog.debug('not found')
                     continue
                 try:
                     # rename to prevent from being overwritten
                     os.rename(jsonFilePath, readJsonPath)
+                    _mark_file_created(readJsonPath)
                 except Exception:
                     tmpLog.error('failed to rename json')
                     continue
             # load json
             nData = 0
             try:
-                with open(readJsonPath) as jsonFile:
-                    tmpOrigDict = json.load(jsonFile)
-                    newDict = dict()
-                    # change the key from str to int
-                    for tmpPandaID, tmpDict in iteritems(tmpOrigDict):
-                        tmpPandaID = long(tmpPandaID)
-                        retDict[tmpPandaID] = tmpDict
-                        nData += len(tmpDict)
+                tmpOrigDict = _load_json(workspec, readJsonPath)
+                # change the key from str to int
+                for tmpPandaID, tmpDict in iteritems(tmpOrigDict):
+                    tmpPandaID = long(tmpPandaID)
+                    retDict[tmpPandaID] = tmpDict
+                    nData += len(tmpDict)
             except Exception:
                 tmpLog.error('failed to load json')
             # delete empty file
@@ -696,7 +766,7 @@ class SharedFileMessenger(BaseMessenger):
         jsonFilePath = os.path.join(workspec.get_access_point(), pandaIDsFile)
         tmpLog.debug('looking for PandaID file {0}'.format(jsonFilePath))
         retVal = []
-        if not os.path.exists(jsonFilePath):
+        if not _file_exists(jsonFilePath):
             # not found
             tmpLog.debug('not found')
             return retVal
@@ -717,7 +787,7 @@ class SharedFileMessenger(BaseMessenger):
         # look for the json just under the access point
         jsonFilePath = os.path.join(workspec.get_access_point(), killWorkerFile)
         tmpLog.debug('looking for kill request file {0}'.format(jsonFilePath))
-        if not os.path.exists(jsonFilePath):
+        if not _file_exists(jsonFilePath):
             # not found
             tmpLog.debug('not found')
             return False
@@ -732,7 +802,7 @@ class SharedFileMessenger(BaseMessenger):
         # json file
         jsonFilePath = os.path.join(workspec.get_access_point(), heartbeatFile)
         tmpLog.debug('looking for heartbeat file {0}'.format(jsonFilePath))
-        if not os.path.exists(jsonFilePath): # no heartbeat file was found
+        if not _file_exists(jsonFilePath): # no heartbeat file was found
             tmpLog.debug('startTime: {0}, now: {1}'.format(workspec.startTime, datetime.datetime.utcnow()))
             if not workspec.startTime:
                 # the worker didn't even have time to start
@@ -758,12 +828,39 @@ class SharedFileMessenger(BaseMessenger):
             tmpLog.debug('failed to get mtime')
             return None
 
+    # inspect workers in bulk, with one directory scan per access point and threads for I/O
+    def inspect_workers(self, workspec_list, heartbeat_limit=None):
+        # get logger
+        tmpLog = core_utils.make_logger(_logger, method_name='inspect_workers')
+        tmpLog.debug('start for {0} workers'.format(len(workspec_list)))
+        sw = core_utils.get_stopwatch()
+
+        def _inspect_one(workspec):
+            dirList = [workspec.get_access_point()]
+            for pandaID in workspec.pandaid_list:
+                dirList.append(self.get_access_point(workspec, pandaID))
+            _scan_dirs(dirList)
+            try:
+                return inspect_one_worker(self, workspec, heartbeat_limit)
+            finally:
+                _clear_scanned_dirs()
+
+        with Pool(max(1, min(self.nThreadsToInspect, len(workspec_list)))) as pool:
+            retList = list(pool.map(_inspect_one, workspec_list))
+        retMap = dict()
+        for workspec, retDict in zip(workspec_list, retList):
+            retMap[workspec.workerID] = retDict
+        tmpLog.debug('done ' + sw.get_elapsed_time())
+        return retMap
+
     # clean up. Called by sweeper agent to clean up stuff made by messenger for the worker
     # for shared_file_messenger, clean up worker the directory of access point
     def clean_up(self, workspec):
         # get logger
         tmpLog = core_utils.make_logger(_logger, 'workerID={0}'.format(workspec.workerID),
                                         method_name='clean_up')
+        # forget parsed json files
+        _jsonCache.pop(workspec.workerID)
         # Remove from top directory of access point of worker
         errStr = ''
         worker_accessPoint = workspec.get_access_point()
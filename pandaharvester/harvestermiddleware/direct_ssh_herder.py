@@ -7,6 +7,7 @@ except Exception:
     import pickle
 
 from pandaharvester.harvestercore.plugin_base import PluginBase
+from pandaharvester.harvestercore.spec_base import SpecBase
 from pandaharvester.harvestercore import core_utils
 from .ssh_master_pool import sshMasterPool
 
@@ -50,6 +51,8 @@ class Method(object):
                 elif isinstance(old_arg, types.DictionaryType):
                     old_arg.clear()
                     old_arg.update(new_arg)
+                elif isinstance(old_arg, SpecBase):
+                    old_arg.__setstate__(new_arg.__getstate__())
                 elif hasattr(old_arg, '__dict__'):
                     old_arg.__dict__ = new_arg.__dict__
             new_kwargs = pickle.loads(str(return_dict['kwargs']))
@@ -62,6 +65,8 @@ class Method(object):
                 elif isinstance(old_kwarg, types.DictionaryType):
                     old_kwarg.clear()
                     old_kwarg.update(new_kwarg)
+                elif isinstance(old_kwarg, SpecBase):
+                    old_kwarg.__setstate__(new_kwarg.__getstate__())
                 elif hasattr(old_kwarg, '__dict__'):
                     old_kwarg.__dict__ = new_kwarg.__dict__
             return pickle.loads(str(return_dict['return']))
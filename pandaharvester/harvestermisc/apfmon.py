@@ -2,10 +2,13 @@
 API described here: http://apfmon.lancs.ac.uk/help
 """
 
+import os
 import requests
 import json
 import time
+import threading
 import traceback
+from collections import OrderedDict
 
 from pandaharvester.harvesterconfig import harvester_config
 from pandaharvester.harvestercore import core_utils
@@ -63,8 +66,30 @@ class Apfmon(object):
         except:
             self.base_url = 'http://apfmon.lancs.ac.uk/api'
 
+        # send updates asynchronously in batches from a background thread
+        try:
+            self.__async_mode = harvester_config.apfmon.async_mode
+        except:
+            self.__async_mode = False
+
+        try:
+            self.__max_queue_size = harvester_config.apfmon.max_queue_size
+        except:
+            self.__max_queue_size = 10000
+
+        try:
+            self.__flush_interval = harvester_config.apfmon.flush_interval
+        except:
+            self.__flush_interval = 5
+
         self.queue_config_mapper = queue_config_mapper
 
+    def get_sender(self):
+        """
+        Get the background sender of this process
+        """
+        return _get_sender(self.__max_queue_size, self.__flush_interval)
+
     def create_factory(self):
         """
         Creates or updates a harvester instance to APF Mon. Should be done at startup of the instance.
@@ -196,6 +221,55 @@ class Apfmon(object):
 
         return data
 
+    def get_label_updates(self, site, msg, data, tmp_log):
+        """
+        Get a list of (label, url, label_data) to update labels of a site
+        """
+        data = self.massage_label_data(data)
+
+        panda_queues_dict = PandaQueuesDict()
+
+        site_info = panda_queues_dict.get(site, dict())
+        if not site_info:
+            tmp_log.warning('No site info for {0}'.format(site))
+            return []
+
+        # when no CEs associated to a queue, e.g. P1, HPCs, etc. Try to see if there is something
+        # in local configuration, otherwise set it to a dummy value
+        try:
+            ce = self.queue_config_mapper.queueConfig[site].submitter['ceEndpoint']
+            queues = [{'ce_endpoint': ce}]
+        except KeyError:
+            if site_info['queues']:
+                queues = site_info['queues']
+            else:
+                queues = [{'ce_endpoint': NO_CE}]
+
+        label_updates = []
+        for queue in queues:
+            try:
+                ce = clean_ce(queue['ce_endpoint'])
+            except:
+                ce = ''
+
+            label_data = {'status': msg, 'data': data}
+            label = '{0}-{1}'.format(site, ce)
+            label_id = '{0}:{1}'.format(self.harvester_id, label)
+            url = '{0}/labels/{1}'.format(self.base_url, label_id)
+            label_updates.append((label, url, label_data))
+        return label_updates
+
+    def send_label_updates(self, site, msg, data, tmp_log, session=requests):
+        """
+        Send updates of labels of a site
+        """
+        for label, url, label_data in self.get_label_updates(site, msg, data, tmp_log):
+            try:
+                r = session.post(url, data=json.dumps(label_data), timeout=self.__label_timeout)
+                tmp_log.debug('label update for {0} ended with {1} {2}'.format(label, r.status_code, r.text))
+            except:
+                tmp_log.error('Excepted for site {0} with: {1}'.format(label, traceback.format_exc()))
+
     def update_label(self, site, msg, data):
         """
         Updates a label (=panda queue+CE)
@@ -210,50 +284,81 @@ class Apfmon(object):
 
         try:
             tmp_log.debug('start')
-            data = self.massage_label_data(data)
-
-            # get the active queues from the config mapper
-            all_sites = self.queue_config_mapper.get_active_queues().keys()
-            panda_queues_dict = PandaQueuesDict()
-
-            site_info = panda_queues_dict.get(site, dict())
-            if not site_info:
-                tmp_log.warning('No site info for {0}'.format(site))
-                return
-
-            # when no CEs associated to a queue, e.g. P1, HPCs, etc. Try to see if there is something
-            # in local configuration, otherwise set it to a dummy value
-            try:
-                ce = self.queue_config_mapper.queueConfig[site].submitter['ceEndpoint']
-                queues = [{'ce_endpoint': ce}]
-            except KeyError:
-                if site_info['queues']:
-                    queues = site_info['queues']
-                else:
-                    queues = [{'ce_endpoint': NO_CE}]
-
-            for queue in queues:
-                try:
-                    try:
-                        ce = clean_ce(queue['ce_endpoint'])
-                    except:
-                        ce = ''
 
-                    label_data = {'status': msg, 'data': data}
-                    label = '{0}-{1}'.format(site, ce)
-                    label_id = '{0}:{1}'.format(self.harvester_id, label)
-                    url = '{0}/labels/{1}'.format(self.base_url, label_id)
-
-                    r = requests.post(url, data=json.dumps(label_data), timeout=self.__label_timeout)
-                    tmp_log.debug('label update for {0} ended with {1} {2}'.format(label, r.status_code, r.text))
-                except:
-                    tmp_log.error('Excepted for site {0} with: {1}'.format(label, traceback.format_exc()))
+            if self.__async_mode:
+                # labels are resolved in the background thread
+                self.get_sender().put_label_update(self, site, msg, data)
+            else:
+                self.send_label_updates(site, msg, data, tmp_log)
 
             end_time = time.time()
             tmp_log.debug('done (took {0})'.format(end_time - start_time))
         except:
             tmp_log.error('Excepted with: {0}'.format(traceback.format_exc()))
 
+    def pack_worker(self, worker_spec, tmp_log):
+        """
+        Pack a worker to be created. Returns None if the worker has no batchID
+        """
+        batch_id = worker_spec.batchID
+        worker_id = worker_spec.workerID
+        if not batch_id:
+            tmp_log.debug('no batchID found for workerID {0}... skipping'.format(worker_id))
+            return None
+        factory = self.harvester_id
+        computingsite = worker_spec.computingSite
+        try:
+            ce = clean_ce(worker_spec.computingElement)
+        except AttributeError:
+            tmp_log.debug('no CE found for workerID {0} batchID {1}'.format(worker_id, batch_id))
+            ce = NO_CE
+
+        # extract the log URLs
+        stdout_url = ''
+        stderr_url = ''
+        log_url = ''
+        jdl_url = ''
+
+        work_attribs = worker_spec.workAttributes
+        if work_attribs:
+            if 'stdOut' in work_attribs:
+                stdout_url = work_attribs['stdOut']
+                # jdl_url = '{0}.jdl'.format(stdout_url[:-4])
+            if 'stdErr' in work_attribs:
+                stderr_url = work_attribs['stdErr']
+            if 'batchLog' in work_attribs:
+                log_url = work_attribs['batchLog']
+            if 'jdl' in work_attribs:
+                jdl_url = work_attribs['jdl']
+
+        apfmon_worker = {'cid': batch_id,
+                         'factory': factory,
+                         'label': '{0}-{1}'.format(computingsite, ce),
+                         'jdlurl': jdl_url,
+                         'stdouturl': stdout_url,
+                         'stderrurl': stderr_url,
+                         'logurl': log_url
+                         }
+        tmp_log.debug('packed worker: {0}'.format(apfmon_worker))
+        return apfmon_worker
+
+    def send_workers(self, apfmon_workers, tmp_log, session=requests):
+        """
+        Send packed workers to be created in shards
+        """
+        url = '{0}/jobs'.format(self.base_url)
+
+        for apfmon_workers_shard in generic_utils.create_shards(apfmon_workers, 20):
+            payload = json.dumps(apfmon_workers_shard)
+
+            try:
+                r = session.put(url, data=payload, timeout=self.__worker_timeout)
+                tmp_log.debug('worker creation for {0} ended with {1} {2}'.format(apfmon_workers_shard,
+                                                                                   r.status_code, r.text))
+            except:
+                tmp_log.debug(
+                    'worker creation for {0} failed with {1}'.format(apfmon_workers_shard, traceback.format_exc()))
+
     def create_workers(self, worker_spec_list):
         """
         Creates a worker
@@ -269,62 +374,16 @@ class Apfmon(object):
         try:
             tmp_log.debug('start')
 
-            url = '{0}/jobs'.format(self.base_url)
-
-            for worker_spec_shard in generic_utils.create_shards(worker_spec_list, 20):
-                apfmon_workers = []
-                for worker_spec in worker_spec_shard:
-                    batch_id = worker_spec.batchID
-                    worker_id = worker_spec.workerID
-                    if not batch_id:
-                        tmp_log.debug('no batchID found for workerID {0}... skipping'.format(worker_id))
-                        continue
-                    factory = self.harvester_id
-                    computingsite = worker_spec.computingSite
-                    try:
-                        ce = clean_ce(worker_spec.computingElement)
-                    except AttributeError:
-                        tmp_log.debug('no CE found for workerID {0} batchID {1}'.format(worker_id, batch_id))
-                        ce = NO_CE
-
-                    # extract the log URLs
-                    stdout_url = ''
-                    stderr_url = ''
-                    log_url = ''
-                    jdl_url = ''
-
-                    work_attribs = worker_spec.workAttributes
-                    if work_attribs:
-                        if 'stdOut' in work_attribs:
-                            stdout_url = work_attribs['stdOut']
-                            # jdl_url = '{0}.jdl'.format(stdout_url[:-4])
-                        if 'stdErr' in work_attribs:
-                            stderr_url = work_attribs['stdErr']
-                        if 'batchLog' in work_attribs:
-                            log_url = work_attribs['batchLog']
-                        if 'jdl' in work_attribs:
-                            jdl_url = work_attribs['jdl']
-
-                    apfmon_worker = {'cid': batch_id,
-                                     'factory': factory,
-                                     'label': '{0}-{1}'.format(computingsite, ce),
-                                     'jdlurl': jdl_url,
-                                     'stdouturl': stdout_url,
-                                     'stderrurl': stderr_url,
-                                     'logurl': log_url
-                                     }
-                    tmp_log.debug('packed worker: {0}'.format(apfmon_worker))
+            apfmon_workers = []
+            for worker_spec in worker_spec_list:
+                apfmon_worker = self.pack_worker(worker_spec, tmp_log)
+                if apfmon_worker is not None:
                     apfmon_workers.append(apfmon_worker)
 
-                payload = json.dumps(apfmon_workers)
-
-                try:
-                    r = requests.put(url, data=payload, timeout=self.__worker_timeout)
-                    tmp_log.debug('worker creation for {0} ended with {1} {2}'.format(apfmon_workers, r.status_code, r.text))
-                except:
-                    tmp_log.debug(
-                        'worker creation for {0} failed with'.format(apfmon_workers, format(traceback.format_exc())))
-
+            if self.__async_mode:
+                self.get_sender().put_workers(self, apfmon_workers)
+            else:
+                self.send_workers(apfmon_workers, tmp_log)
 
             end_time = time.time()
             tmp_log.debug('done (took {0})'.format(end_time - start_time))
@@ -346,6 +405,13 @@ class Apfmon(object):
         if harvester_status == 'finished':
             return 'done'
 
+    def send_worker_update(self, url, apfmon_worker, tmp_log, session=requests):
+        """
+        Send an update of a worker
+        """
+        r = session.post(url, data=apfmon_worker, timeout=self.__worker_update_timeout)
+        tmp_log.debug('worker update for {0} ended with {1} {2}'.format(url, r.status_code, r.text))
+
     def update_worker(self, worker_spec, worker_status):
         """
         Updates the state of a worker. This can also be done directly from the wrapper, assuming there is outbound
@@ -377,14 +443,135 @@ class Apfmon(object):
 
             tmp_log.debug('updating worker {0}: {1}'.format(batch_id, apfmon_worker))
 
-            r = requests.post(url, data=apfmon_worker, timeout=self.__worker_update_timeout)
-            tmp_log.debug('worker update for {0} ended with {1} {2}'.format(batch_id, r.status_code, r.text))
+            if self.__async_mode:
+                self.get_sender().put_worker_update(self, url, apfmon_worker)
+            else:
+                self.send_worker_update(url, apfmon_worker, tmp_log)
 
             end_time = time.time()
             tmp_log.debug('done (took {0})'.format(end_time - start_time))
         except:
             tmp_log.error('Excepted with: {0}'.format(traceback.format_exc()))
 
+
+class ApfmonSender(object):
+    """
+    Coalesces updates to APF Mon in a bounded in-memory buffer and sends them in batches
+    from a background thread with one keep-alive session
+    """
+
+    def __init__(self, max_queue_size, flush_interval):
+        self.max_queue_size = max_queue_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.wake_event = threading.Event()
+        # pending updates. The latest one wins for the same label or worker
+        self.label_updates = OrderedDict()
+        self.worker_creations = OrderedDict()
+        self.worker_updates = OrderedDict()
+        self.n_dropped = 0
+        self.n_dropped_reported = 0
+        self.session = requests.Session()
+        self.thread = threading.Thread(target=self.run, name='ApfmonSender')
+        self.thread.daemon = True
+        self.thread.start()
+
+    # number of pending updates
+    def size(self):
+        return len(self.label_updates) + len(self.worker_creations) + len(self.worker_updates)
+
+    # number of updates dropped due to overflow
+    def get_num_dropped(self):
+        return self.n_dropped
+
+    # put an update into a buffer
+    def _put(self, buffer, key, value):
+        with self.lock:
+            if key not in buffer and self.size() >= self.max_queue_size:
+                self.n_dropped += 1
+                return False
+            buffer[key] = value
+            buffer_size = self.size()
+        # flush earlier when the buffer is getting full
+        if buffer_size * 2 >= self.max_queue_size:
+            self.wake_event.set()
+        return True
+
+    def put_label_update(self, apfmon, site, msg, data):
+        return self._put(self.label_updates, (apfmon.base_url, apfmon.harvester_id, site), (apfmon, site, msg, data))
+
+    def put_workers(self, apfmon, apfmon_workers):
+        for apfmon_worker in apfmon_workers:
+            self._put(self.worker_creations,
+                      (apfmon.base_url, apfmon_worker['factory'], apfmon_worker['cid']), (apfmon, apfmon_worker))
+
+    def put_worker_update(self, apfmon, url, apfmon_worker):
+        return self._put(self.worker_updates, url, (apfmon, url, apfmon_worker))
+
+    # main loop of the background thread
+    def run(self):
+        while True:
+            self.wake_event.wait(self.flush_interval)
+            self.wake_event.clear()
+            try:
+                self.flush()
+            except:
+                _base_logger.error('flush failed with: {0}'.format(traceback.format_exc()))
+
+    # send all pending updates
+    def flush(self):
+        with self.lock:
+            label_updates = self.label_updates
+            worker_creations = self.worker_creations
+            worker_updates = self.worker_updates
+            self.label_updates = OrderedDict()
+            self.worker_creations = OrderedDict()
+            self.worker_updates = OrderedDict()
+            n_dropped = self.n_dropped
+        if not (label_updates or worker_creations or worker_updates or n_dropped > self.n_dropped_reported):
+            return
+        start_time = time.time()
+        tmp_log = core_utils.make_logger(_base_logger, method_name='ApfmonSender.flush')
+        if n_dropped > self.n_dropped_reported:
+            tmp_log.warning('dropped {0} updates due to full queue (total {1})'.format(
+                n_dropped - self.n_dropped_reported, n_dropped))
+            self.n_dropped_reported = n_dropped
+        # create workers before updating them
+        workers_map = OrderedDict()
+        for apfmon, apfmon_worker in worker_creations.values():
+            workers_map.setdefault(apfmon, []).append(apfmon_worker)
+        for apfmon, apfmon_workers in workers_map.items():
+            apfmon.send_workers(apfmon_workers, tmp_log, self.session)
+        for apfmon, url, apfmon_worker in worker_updates.values():
+            try:
+                apfmon.send_worker_update(url, apfmon_worker, tmp_log, self.session)
+            except:
+                tmp_log.error('Excepted for {0} with: {1}'.format(url, traceback.format_exc()))
+        for apfmon, site, msg, data in label_updates.values():
+            try:
+                apfmon.send_label_updates(site, msg, data, tmp_log, self.session)
+            except:
+                tmp_log.error('Excepted for site {0} with: {1}'.format(site, traceback.format_exc()))
+        tmp_log.debug('sent {0} label updates, {1} worker creations, {2} worker updates (took {3:.3f} sec)'.format(
+            len(label_updates), len(worker_creations), len(worker_updates), time.time() - start_time))
+
+
+# background sender per process
+_sender = None
+_sender_pid = None
+_sender_lock = threading.Lock()
+
+
+def _get_sender(max_queue_size, flush_interval):
+    global _sender, _sender_pid
+    with _sender_lock:
+        # threads are not inherited by forked processes
+        if _sender is None or _sender_pid != os.getpid():
+            _sender = ApfmonSender(max_queue_size, flush_interval)
+            _sender_pid = os.getpid()
+        return _sender
+
+
 if __name__== "__main__":
 
     """
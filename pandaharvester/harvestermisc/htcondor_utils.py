@@ -5,7 +5,6 @@ import re
 import time
 import datetime
 import threading
-import random
 import multiprocessing
 import tempfile
 import functools
@@ -28,7 +27,6 @@ from pandaharvester.harvestercore import core_utils
 from pandaharvester.harvesterconfig import harvester_config
 from pandaharvester.harvestercore.core_utils import SingletonWithID
 from pandaharvester.harvestercore.work_spec import WorkSpec
-from pandaharvester.harvestercore.fifos import SpecialFIFOBase
 
 # condor python or command api
 try:
@@ -203,35 +201,6 @@ def condor_submit_process(mp_queue, host, jdl_map_list):
 
 #=== Classes ===================================================
 
-# Condor queue cache fifo
-class CondorQCacheFifo(six.with_metaclass(SingletonWithID, SpecialFIFOBase)):
-    global_lock_id = -1
-
-    def __init__(self, target, *args, **kwargs):
-        name_suffix = target.split('.')[0]
-        self.titleName = 'CondorQCache_{0}'.format(name_suffix)
-        SpecialFIFOBase.__init__(self)
-
-    def lock(self, score=None):
-        lock_key = format(int(random.random() * 2**32), 'x')
-        if score is None:
-            score = time.time()
-        retVal = self.putbyid(self.global_lock_id, lock_key, score)
-        if retVal:
-            return lock_key
-        return None
-
-    def unlock(self, key=None, force=False):
-        peeked_tuple = self.peekbyid(id=self.global_lock_id)
-        if peeked_tuple.score is None or peeked_tuple.item is None:
-            return True
-        elif force or self.decode(peeked_tuple.item) == key:
-            self.delete([self.global_lock_id])
-            return True
-        else:
-            return False
-
-
 # Condor client
 class CondorClient(object):
     @classmethod
@@ -349,7 +318,8 @@ class CondorJobQuery(six.with_metaclass(SingletonWithID, CondorClient)):
 <classads>
 """
 
-    def __init__(self, cacheEnable=False, cacheRefreshInterval=None, useCondorHistory=True, *args, **kwargs):
+    def __init__(self, cacheEnable=False, cacheRefreshInterval=None, useCondorHistory=True,
+                 cacheFullSyncInterval=None, *args, **kwargs):
         self.submissionHost = str(kwargs.get('id'))
         # Make logger
         tmpLog = core_utils.make_logger(baseLogger, 'submissionHost={0} thrid={1} oid={2}'.format(self.submissionHost, get_ident(), id(self)), method_name='CondorJobQuery.__init__')
@@ -360,8 +330,17 @@ class CondorJobQuery(six.with_metaclass(SingletonWithID, CondorClient)):
             # For condor_q cache
             self.cacheEnable = cacheEnable
             if self.cacheEnable:
-                self.cache = ([], 0)
+                # job ads of harvester jobs indexed by batchID
+                self.cache = None
+                self.cacheLock = threading.Lock()
                 self.cacheRefreshInterval = cacheRefreshInterval
+                self.cacheFullSyncInterval = cacheFullSyncInterval
+                if self.cacheFullSyncInterval is None:
+                    self.cacheFullSyncInterval = max(3600, 10 * self.cacheRefreshInterval)
+                self.cacheLastRefresh = 0
+                self.cacheLastFullSync = 0
+                # max EnteredCurrentStatus in the cache
+                self.cacheWatermark = 0
             self.useCondorHistory = useCondorHistory
             tmpLog.debug('Initialize done')
 
@@ -448,157 +427,110 @@ class CondorJobQuery(six.with_metaclass(SingletonWithID, CondorClient)):
         # Return
         return job_ads_all_dict
 
+    # refresh the cache of job ads if outdated and return it
+    def refresh_cache(self):
+        # Make logger
+        tmpLog = core_utils.make_logger(baseLogger, 'submissionHost={0}'.format(self.submissionHost), method_name='CondorJobQuery.refresh_cache')
+        if self.cache is not None and time.time() < self.cacheLastRefresh + self.cacheRefreshInterval:
+            return self.cache
+        # use the current cache without waiting while another thread refreshes it
+        if not self.cacheLock.acquire(self.cache is None):
+            tmpLog.debug('another thread is refreshing cache. Use current one')
+            return self.cache
+        try:
+            timeNow = time.time()
+            if self.cache is not None and timeNow < self.cacheLastRefresh + self.cacheRefreshInterval:
+                return self.cache
+            requirements = 'harvesterID =?= "{0}"'.format(harvesterID)
+            fullSync = self.cache is None or timeNow >= self.cacheLastFullSync + self.cacheFullSyncInterval
+            if fullSync:
+                # get all jobs
+                tmpLog.debug('full sync')
+                newCache = dict()
+                watermark = 0
+                jobs_iter = self.schedd.xquery(requirements=requirements, projection=CONDOR_JOB_ADS_LIST)
+            else:
+                # drop jobs gone from the queue, then get jobs whose status changed since last refresh
+                tmpLog.debug('incremental refresh since EnteredCurrentStatus={0}'.format(self.cacheWatermark))
+                newCache = dict()
+                for job in self.schedd.xquery(requirements=requirements, projection=['ClusterId', 'ProcId']):
+                    batchid = get_batchid_from_job(job)
+                    job_ads_dict = self.cache.get(batchid)
+                    if job_ads_dict is not None:
+                        newCache[batchid] = job_ads_dict
+                watermark = self.cacheWatermark
+                jobs_iter = self.schedd.xquery(requirements='{0} && EnteredCurrentStatus >= {1}'.format(
+                                                    requirements, self.cacheWatermark),
+                                               projection=CONDOR_JOB_ADS_LIST)
+            nUpdated = 0
+            for job in jobs_iter:
+                try:
+                    job_ads_dict = dict(job)
+                    batchid = get_batchid_from_job(job_ads_dict)
+                except Exception as e:
+                    tmpLog.error('In updating cache schedd xquery; got exception {0}: {1} ; {2}'.format(
+                                    e.__class__.__name__, e, repr(job)))
+                    continue
+                newCache[batchid] = job_ads_dict
+                nUpdated += 1
+                try:
+                    watermark = max(watermark, int(job_ads_dict.get('EnteredCurrentStatus', 0)))
+                except (TypeError, ValueError):
+                    pass
+            # replace the cache so that readers never see partial updates
+            self.cache = newCache
+            self.cacheWatermark = watermark
+            self.cacheLastRefresh = timeNow
+            if fullSync:
+                self.cacheLastFullSync = timeNow
+            tmpLog.debug('done with {0} jobs updated and {1} jobs in cache (took {2:.3f} sec)'.format(
+                            nUpdated, len(newCache), time.time() - timeNow))
+            return self.cache
+        finally:
+            self.cacheLock.release()
+
     @CondorClient.renew_session_and_retry
     def query_with_python(self, batchIDs_list=[], allJobs=False):
         # Make logger
         tmpLog = core_utils.make_logger(baseLogger, 'submissionHost={0}'.format(self.submissionHost), method_name='CondorJobQuery.query_with_python')
         # Start query
         tmpLog.debug('Start query')
-        cache_fifo = CondorQCacheFifo(target=self.submissionHost, id='{0},{1}'.format(self.submissionHost, get_ident()))
         job_ads_all_dict = {}
         # make id sets
         batchIDs_set = set(batchIDs_list)
-        clusterids_set = set([get_job_id_tuple_from_batchid(batchid)[0] for batchid in batchIDs_list])
         # query from cache
-        def cache_query(requirements=None, projection=CONDOR_JOB_ADS_LIST, timeout=60):
-            # query from condor xquery and update cache to fifo
-            def update_cache(lockInterval=90):
-                tmpLog.debug('update_cache')
-                # acquire lock with score timestamp
-                score = time.time() - self.cacheRefreshInterval + lockInterval
-                lock_key = cache_fifo.lock(score=score)
-                if lock_key is not None:
-                    # acquired lock, update from condor schedd
-                    tmpLog.debug('got lock, updating cache')
-                    jobs_iter_orig = self.schedd.xquery(requirements=requirements, projection=projection)
-                    jobs_iter = []
-                    for job in jobs_iter_orig:
-                        try:
-                            jobs_iter.append(dict(job))
-                        except Exception as e:
-                            tmpLog.error('In updating cache schedd xquery; got exception {0}: {1} ; {2}'.format(
-                                            e.__class__.__name__, e, repr(job)))
-                    timeNow = time.time()
-                    cache_fifo.put(jobs_iter, timeNow)
-                    self.cache = (jobs_iter, timeNow)
-                    # release lock
-                    retVal = cache_fifo.unlock(key=lock_key)
-                    if retVal:
-                        tmpLog.debug('done update cache and unlock')
-                    else:
-                        tmpLog.warning('cannot unlock... Maybe something wrong')
-                    return jobs_iter
-                else:
-                    tmpLog.debug('cache fifo locked by other thread. Skipped')
-                    return None
-            # remove invalid or outdated caches from fifo
-            def cleanup_cache(timeout=60):
-                tmpLog.debug('cleanup_cache')
-                id_list = list()
-                attempt_timestamp = time.time()
-                n_cleanup = 0
-                while True:
-                    if time.time() > attempt_timestamp + timeout:
-                        tmpLog.debug('time is up when cleanup cache. Skipped')
-                        break
-                    peeked_tuple = cache_fifo.peek(skip_item=True)
-                    if peeked_tuple is None:
-                        tmpLog.debug('empty cache fifo')
-                        break
-                    elif peeked_tuple.score is not None \
-                        and time.time() <= peeked_tuple.score + self.cacheRefreshInterval:
-                        tmpLog.debug('nothing expired')
-                        break
-                    elif peeked_tuple.id is not None:
-                        retVal = cache_fifo.delete([peeked_tuple.id])
-                        if isinstance(retVal, int):
-                            n_cleanup += retVal
-                    else:
-                        # problematic
-                        tmpLog.warning('got nothing when cleanup cache, maybe problematic. Skipped')
-                        break
-                tmpLog.debug('cleaned up {0} objects in cache fifo'.format(n_cleanup))
-            # start
-            jobs_iter = tuple()
+        if self.cacheEnable:
+            job_ads_cache = None
             try:
-                attempt_timestamp = time.time()
-                while True:
-                    if time.time() > attempt_timestamp + timeout:
-                        # skip cache_query if too long
-                        tmpLog.debug('cache_query got timeout ({0} seconds). Skipped '.format(timeout))
-                        break
-                    # get latest cache
-                    peeked_tuple = cache_fifo.peeklast(skip_item=True)
-                    if peeked_tuple is not None and peeked_tuple.score is not None:
-                        # got something
-                        if peeked_tuple.id == cache_fifo.global_lock_id:
-                            if time.time() <= peeked_tuple.score + self.cacheRefreshInterval:
-                                # lock
-                                tmpLog.debug('got fifo locked. Wait and retry...')
-                                time.sleep(random.uniform(1, 5))
-                                continue
-                            else:
-                                # expired lock
-                                tmpLog.debug('got lock expired. Clean up and retry...')
-                                cleanup_cache()
-                                continue
-                        elif time.time() <= peeked_tuple.score + self.cacheRefreshInterval:
-                            # got valid cache
-                            _obj, _last_update = self.cache
-                            if _last_update >= peeked_tuple.score:
-                                # valid local cache
-                                tmpLog.debug('valid local cache')
-                                jobs_iter = _obj
-                            else:
-                                # valid fifo cache
-                                tmpLog.debug('update local cache from fifo')
-                                peeked_tuple_with_item = cache_fifo.peeklast()
-                                if peeked_tuple_with_item is not None \
-                                    and peeked_tuple.id != cache_fifo.global_lock_id \
-                                    and peeked_tuple_with_item.item is not None:
-                                    jobs_iter = cache_fifo.decode(peeked_tuple_with_item.item)
-                                    self.cache = (jobs_iter, peeked_tuple_with_item.score)
-                                else:
-                                    tmpLog.debug('peeked invalid cache fifo object. Wait and retry...')
-                                    time.sleep(random.uniform(1, 5))
-                                    continue
-                        else:
-                            # cache expired
-                            tmpLog.debug('update cache in fifo')
-                            retVal = update_cache()
-                            if retVal is not None:
-                                jobs_iter = retVal
-                            cleanup_cache()
-                        break
-                    else:
-                        # no cache in fifo, check with size again
-                        if cache_fifo.size() == 0:
-                            if time.time() > attempt_timestamp + random.uniform(10, 30):
-                                # have waited for long enough, update cache
-                                tmpLog.debug('waited enough, update cache in fifo')
-                                retVal = update_cache()
-                                if retVal is not None:
-                                    jobs_iter = retVal
-                                break
-                            else:
-                                # still nothing, wait
-                                time.sleep(2)
-                        continue
+                job_ads_cache = self.refresh_cache()
             except Exception as _e:
                 tb_str = traceback.format_exc()
-                tmpLog.error('Error querying from cache fifo; {0} ; {1}'.format(_e, tb_str))
-            return jobs_iter
+                tmpLog.error('Error refreshing cache; {0} ; {1}'.format(_e, tb_str))
+            if job_ads_cache is not None:
+                if allJobs:
+                    for batchid, job_ads_dict in six.iteritems(job_ads_cache):
+                        condor_job_id = '{0}#{1}'.format(self.submissionHost, batchid)
+                        job_ads_all_dict[condor_job_id] = job_ads_dict
+                    return job_ads_all_dict
+                for batchid in list(batchIDs_set):
+                    job_ads_dict = job_ads_cache.get(batchid)
+                    if job_ads_dict is not None:
+                        condor_job_id = '{0}#{1}'.format(self.submissionHost, batchid)
+                        job_ads_all_dict[condor_job_id] = job_ads_dict
+                        batchIDs_set.discard(batchid)
+                tmpLog.debug('got {0} jobs from cache'.format(len(job_ads_all_dict)))
+        clusterids_set = set([get_job_id_tuple_from_batchid(batchid)[0] for batchid in batchIDs_set])
         # query method options
         query_method_list = [self.schedd.xquery]
-        if self.cacheEnable:
-            query_method_list.insert(0, cache_query)
         if self.useCondorHistory:
             query_method_list.append(self.schedd.history)
+        if not allJobs and len(batchIDs_set) == 0:
+            query_method_list = []
         # Go
         for query_method in query_method_list:
             # Make requirements
             clusterids_str = ','.join(list(clusterids_set))
-            if query_method is cache_query or allJobs:
+            if allJobs:
                 requirements = 'harvesterID =?= "{0}"'.format(harvesterID)
             else:
                 requirements = 'member(ClusterID, {{{0}}})'.format(clusterids_str)
@@ -646,9 +578,84 @@ class CondorJobSubmit(six.with_metaclass(SingletonWithID, CondorClient)):
         # Initialize
         tmpLog.debug('Start')
         self.lock = threading.Lock()
+        # for coalesced submission; use_spool -> list of pending requests
+        self.coalesceLock = threading.Lock()
+        self.pendingRequests = dict()
         CondorClient.__init__(self, self.submissionHost, *args, **kwargs)
         tmpLog.debug('Initialize done')
 
+    # submit jdls together with those from other threads coming within the window, in one submission
+    def submit_coalesced(self, jdl_list, use_spool=False, window=1):
+        # Make logger
+        tmpLog = core_utils.make_logger(baseLogger, 'submissionHost={0}'.format(self.submissionHost), method_name='CondorJobSubmit.submit_coalesced')
+        request = {'jdl_list': jdl_list, 'event': threading.Event(), 'result': None}
+        with self.coalesceLock:
+            if use_spool in self.pendingRequests:
+                self.pendingRequests[use_spool].append(request)
+                is_leader = False
+            else:
+                self.pendingRequests[use_spool] = [request]
+                is_leader = True
+        if not is_leader:
+            # wait for the submission by the leader
+            request['event'].wait()
+        else:
+            # collect requests
+            try:
+                time.sleep(window)
+            finally:
+                with self.coalesceLock:
+                    request_list = self.pendingRequests.pop(use_spool)
+            try:
+                all_jdl_list = []
+                for tmp_request in request_list:
+                    all_jdl_list.extend(tmp_request['jdl_list'])
+                tmpLog.debug('submitting {0} jobs of {1} requests'.format(len(all_jdl_list), len(request_list)))
+                try:
+                    batchIDs_list, errStr = self.submit(all_jdl_list, use_spool)
+                except Exception as e:
+                    batchIDs_list, errStr = None, 'Exception {0}: {1}'.format(e.__class__.__name__, e)
+                # map batchIDs back to requests
+                if batchIDs_list:
+                    if len(batchIDs_list) != len(all_jdl_list):
+                        # procs are queued in order of jdls, so assign batchIDs in order as far as they go
+                        clusterid = get_job_id_tuple_from_batchid(batchIDs_list[0])[0]
+                        tmpLog.error('got {0} batchIDs for {1} jobs in clusterID={2}: {3}'.format(
+                                        len(batchIDs_list), len(all_jdl_list), clusterid, errStr))
+                    orphanBatchIDs = []
+                    offset = 0
+                    for tmp_request in request_list:
+                        n_jobs = len(tmp_request['jdl_list'])
+                        tmp_batchIDs = batchIDs_list[offset:offset + n_jobs]
+                        offset += n_jobs
+                        if len(tmp_batchIDs) == n_jobs:
+                            tmp_request['result'] = (tmp_batchIDs, errStr)
+                        else:
+                            tmp_request['result'] = ([], 'got {0} batchIDs for {1} jobs: {2}'.format(
+                                                        len(tmp_batchIDs), n_jobs, errStr))
+                            orphanBatchIDs.extend(tmp_batchIDs)
+                    orphanBatchIDs.extend(batchIDs_list[offset:])
+                    # remove jobs not bound to any worker
+                    if orphanBatchIDs:
+                        tmpLog.warning('removing orphan jobs: {0}'.format(' '.join(orphanBatchIDs)))
+                        try:
+                            CondorJobManage(id=self.submissionHost).remove(orphanBatchIDs)
+                        except Exception as e:
+                            tmpLog.error('failed to remove orphan jobs with {0}: {1}'.format(
+                                            e.__class__.__name__, e))
+                elif len(request_list) == 1:
+                    request_list[0]['result'] = ([], errStr)
+                else:
+                    # submit separately not to fail all requests due to one of them
+                    tmpLog.warning('failed to submit {0} requests together. Retry separately ; {1}'.format(
+                                    len(request_list), errStr))
+            finally:
+                for tmp_request in request_list:
+                    tmp_request['event'].set()
+        if request['result'] is None:
+            request['result'] = self.submit(jdl_list, use_spool)
+        return request['result']
+
     def submit(self, jdl_list, use_spool=False):
         # Make logger
         tmpLog = core_utils.make_logger(baseLogger, 'submissionHost={0}'.format(self.submissionHost), method_name='CondorJobSubmit.submit')
@@ -1,3 +1,8 @@
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 from future.utils import iteritems
 
 from pandaharvester.harvesterconfig import harvester_config
@@ -6,49 +11,73 @@ from pandaharvester.harvestercore.db_interface import DBInterface
 
 harvesterID = harvester_config.master.harvester_id
 
-class PandaQueuesDict(dict, PluginBase):
+# resource maps built from cached data, keyed by cacher key
+_resourceMapCache = dict()
+
+class PandaQueuesDict(Mapping, PluginBase):
     """
     Dictionary of PanDA queue info from DB by cacher
     Key is PanDA Resouce name (rather than PanDA Queue name)
     Able to query with either PanDA Queue name or PanDA Resource name
+    Read-only mapping over the resource map shared by all instances made from the same cached data
     """
     def __init__(self, **kwarg):
-        dict.__init__(self)
         PluginBase.__init__(self, **kwarg)
+        self._resource_map = dict()
         dbInterface = DBInterface()
         cacher_key = kwarg.get('cacher_key', 'panda_queues.json')
         panda_queues_cache = dbInterface.get_cache(cacher_key)
         if panda_queues_cache and isinstance(panda_queues_cache.data, dict):
             panda_queues_dict = panda_queues_cache.data
-            for (k, v) in iteritems(panda_queues_dict):
-                try:
-                    panda_resource = v['panda_resource']
-                    assert k == v['nickname']
-                except Exception:
-                    pass
-                else:
-                    self[panda_resource] = v
+            # reuse the map if the cached data is unchanged
+            memo = _resourceMapCache.get(cacher_key)
+            if memo is not None and memo[0] is panda_queues_dict:
+                resourceMap = memo[1]
+            else:
+                resourceMap = dict()
+                for (k, v) in iteritems(panda_queues_dict):
+                    try:
+                        panda_resource = v['panda_resource']
+                        assert k == v['nickname']
+                    except Exception:
+                        pass
+                    else:
+                        resourceMap[panda_resource] = v
+                _resourceMapCache[cacher_key] = (panda_queues_dict, resourceMap)
+            self._resource_map = resourceMap
 
     def __getitem__(self, panda_resource):
-        if panda_resource in self:
-            return dict.__getitem__(self, panda_resource)
+        if panda_resource in self._resource_map:
+            return self._resource_map[panda_resource]
         else:
             panda_queue = self.get_panda_queue_name(panda_resource)
-            return dict.__getitem__(self, panda_queue)
+            return self._resource_map[panda_queue]
 
     def get(self, panda_resource, default=None):
-        if panda_resource in self:
-            return dict.get(self, panda_resource, default)
+        if panda_resource in self._resource_map:
+            return self._resource_map.get(panda_resource, default)
         else:
             panda_queue = self.get_panda_queue_name(panda_resource)
-            return dict.get(self, panda_queue, default)
+            return self._resource_map.get(panda_queue, default)
+
+    def __contains__(self, panda_resource):
+        return panda_resource in self._resource_map
+
+    def __iter__(self):
+        return iter(self._resource_map)
+
+    def __len__(self):
+        return len(self._resource_map)
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(self.__class__.__name__, self._resource_map)
 
     def get_panda_queue_name(self, panda_resource):
         """
         Return PanDA Queue name with specified PanDA Resource name
         """
         try:
-            panda_queue =  self.get(panda_resource).get('nickname')
+            panda_queue = self._resource_map[panda_resource].get('nickname')
             return panda_queue
         except Exception:
             return None
@@ -4,21 +4,138 @@ utilities routines associated with Kubernetes python client
 """
 import os
 import copy
+import time
 import base64
+import threading
 import yaml
 
-from kubernetes import client, config
+from kubernetes import client, config, watch
 from kubernetes.client.rest import ApiException
 
 from pandaharvester.harvesterconfig import harvester_config
+from pandaharvester.harvestercore import core_utils
 from pandaharvester.harvestermisc.info_utils import PandaQueuesDict
 
+# logger
+baseLogger = core_utils.setup_logger('k8s_utils')
+
+# pod informers per namespace and config file
+_pod_informers = dict()
+_pod_informers_lock = threading.Lock()
+
+
+# convert a pod object to pod info
+def make_pod_info(pod):
+    pod_info = {}
+    pod_info['name'] = pod.metadata.name
+    pod_info['start_time'] = pod.status.start_time.replace(tzinfo=None) if pod.status.start_time else pod.status.start_time
+    pod_info['status'] = pod.status.phase
+    pod_info['status_reason'] = pod.status.conditions[0].reason if pod.status.conditions else None
+    pod_info['status_message'] = pod.status.conditions[0].message if pod.status.conditions else None
+    pod_info['job_name'] = pod.metadata.labels['job-name'] if pod.metadata.labels and 'job-name' in pod.metadata.labels else None
+    return pod_info
+
+
+# cache of pods in a namespace, kept current with list and watch in a background thread
+class PodInformer(object):
+
+    def __init__(self, corev1, namespace, watch_timeout=60, retry_interval=10):
+        self.corev1 = corev1
+        self.namespace = namespace
+        self.watch_timeout = watch_timeout
+        self.retry_interval = retry_interval
+        self.lock = threading.Lock()
+        # pod name -> pod info
+        self.pods_info_dict = dict()
+        # job name -> {pod name: pod info}
+        self.job_index = dict()
+        self.resource_version = None
+        self.healthy = False
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # add or update a pod
+    def _set_pod_info(self, pod_info):
+        self._remove_pod_info(pod_info['name'])
+        self.pods_info_dict[pod_info['name']] = pod_info
+        self.job_index.setdefault(pod_info['job_name'], dict())[pod_info['name']] = pod_info
+
+    # remove a pod
+    def _remove_pod_info(self, pod_name):
+        old_info = self.pods_info_dict.pop(pod_name, None)
+        if old_info is not None:
+            job_pods = self.job_index.get(old_info['job_name'])
+            if job_pods is not None:
+                job_pods.pop(pod_name, None)
+                if not job_pods:
+                    del self.job_index[old_info['job_name']]
+
+    # list all pods and rebuild the cache
+    def relist(self):
+        ret = self.corev1.list_namespaced_pod(namespace=self.namespace)
+        with self.lock:
+            self.pods_info_dict = dict()
+            self.job_index = dict()
+            for pod in ret.items:
+                self._set_pod_info(make_pod_info(pod))
+            self.resource_version = ret.metadata.resource_version
+        baseLogger.debug('PodInformer listed {0} pods in {1} with resourceVersion={2}'.format(
+            len(ret.items), self.namespace, self.resource_version))
+
+    # main loop
+    def run(self):
+        while True:
+            try:
+                if self.resource_version is None:
+                    self.relist()
+                self.healthy = True
+                w = watch.Watch()
+                for event in w.stream(self.corev1.list_namespaced_pod, namespace=self.namespace,
+                                      resource_version=self.resource_version,
+                                      timeout_seconds=self.watch_timeout):
+                    if event['type'] == 'ERROR':
+                        # resourceVersion too old, etc
+                        baseLogger.debug('PodInformer got error event {0} ; relist'.format(event['raw_object']))
+                        self.resource_version = None
+                        w.stop()
+                        break
+                    pod = event['object']
+                    with self.lock:
+                        if event['type'] == 'DELETED':
+                            self._remove_pod_info(pod.metadata.name)
+                        elif event['type'] in ['ADDED', 'MODIFIED']:
+                            self._set_pod_info(make_pod_info(pod))
+                        self.resource_version = pod.metadata.resource_version
+            except ApiException as _e:
+                if _e.status == 410:
+                    # resourceVersion expired
+                    self.resource_version = None
+                else:
+                    self.healthy = False
+                    baseLogger.error('PodInformer failed to watch pods in {0} ; {1}'.format(self.namespace, _e))
+                    time.sleep(self.retry_interval)
+            except Exception as _e:
+                self.healthy = False
+                baseLogger.error('PodInformer failed to watch pods in {0} ; {1}'.format(self.namespace, _e))
+                time.sleep(self.retry_interval)
+
+    # check if the cache can be used
+    def is_ready(self):
+        return self.healthy and self.resource_version is not None
+
+    # get list of pod info for a job
+    def get_pods_info_by_job(self, job_name):
+        with self.lock:
+            return list(self.job_index.get(job_name, dict()).values())
+
 
 class k8s_Client(object):
 
     def __init__(self, namespace, config_file=None):
         config.load_kube_config(config_file=config_file)
         self.namespace = namespace if namespace else 'default'
+        self.config_file = config_file
         self.corev1 = client.CoreV1Api()
         self.batchv1 = client.BatchV1Api()
         self.deletev1 = client.V1DeleteOptions(propagation_policy='Background')
@@ -82,20 +199,14 @@ class k8s_Client(object):
         rsp = self.batchv1.create_namespaced_job(body=yaml_content, namespace=self.namespace)
         return rsp
 
-    def get_pods_info(self):
+    def get_pods_info(self, job_name=None):
         pods_list = list()
 
-        ret = self.corev1.list_namespaced_pod(namespace=self.namespace)
+        label_selector = 'job-name=' + job_name if job_name else ''
+        ret = self.corev1.list_namespaced_pod(namespace=self.namespace, label_selector=label_selector)
 
         for i in ret.items:
-            pod_info = {}
-            pod_info['name'] = i.metadata.name
-            pod_info['start_time'] = i.status.start_time.replace(tzinfo=None) if i.status.start_time else i.status.start_time
-            pod_info['status'] = i.status.phase
-            pod_info['status_reason'] = i.status.conditions[0].reason if i.status.conditions else None
-            pod_info['status_message'] = i.status.conditions[0].message if i.status.conditions else None
-            pod_info['job_name'] = i.metadata.labels['job-name'] if i.metadata.labels and 'job-name' in i.metadata.labels else None
-            pods_list.append(pod_info)
+            pods_list.append(make_pod_info(i))
 
         return pods_list
 
@@ -104,6 +215,19 @@ class k8s_Client(object):
             pods_list = [ i for i in pods_list if i['job_name'] == job_name]
         return pods_list
 
+    def index_pods_info(self, pods_list):
+        pods_info_map = dict()
+        for pod_info in pods_list:
+            pods_info_map.setdefault(pod_info['job_name'], []).append(pod_info)
+        return pods_info_map
+
+    def get_pod_informer(self):
+        key = (self.namespace, self.config_file)
+        with _pod_informers_lock:
+            if key not in _pod_informers:
+                _pod_informers[key] = PodInformer(self.corev1, self.namespace)
+            return _pod_informers[key]
+
     def get_jobs_info(self, job_name=None):
         jobs_list = list()
 
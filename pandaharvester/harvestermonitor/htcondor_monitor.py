@@ -196,6 +196,10 @@ class HTCondorMonitor(PluginBase):
             self.cacheRefreshInterval = harvester_config.monitor.pluginCacheRefreshInterval
         except AttributeError:
             self.cacheRefreshInterval = harvester_config.monitor.checkInterval
+        try:
+            self.cacheFullSyncInterval = harvester_config.monitor.pluginCacheFullSyncInterval
+        except AttributeError:
+            self.cacheFullSyncInterval = None
         try:
             self.useCondorHistory
         except AttributeError:
@@ -213,6 +217,7 @@ class HTCondorMonitor(PluginBase):
             # Record batch job query result to this dict, with key = batchID
             job_query = CondorJobQuery( cacheEnable=self.cacheEnable,
                                         cacheRefreshInterval=self.cacheRefreshInterval,
+                                        cacheFullSyncInterval=self.cacheFullSyncInterval,
                                         useCondorHistory=self.useCondorHistory,
                                         id=submissionHost)
             try:
@@ -245,6 +250,7 @@ class HTCondorMonitor(PluginBase):
         for submissionHost in self.submissionHost_list:
             job_query = CondorJobQuery( cacheEnable=self.cacheEnable,
                                         cacheRefreshInterval=self.cacheRefreshInterval,
+                                        cacheFullSyncInterval=self.cacheFullSyncInterval,
                                         useCondorHistory=self.useCondorHistory,
                                         id=submissionHost)
             job_ads_all_dict.update(job_query.get_all(allJobs=True))
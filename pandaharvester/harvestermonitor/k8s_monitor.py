@@ -2,6 +2,7 @@ import os
 import time
 import datetime
 import re
+import functools
 
 from concurrent.futures import ThreadPoolExecutor
 
@@ -37,8 +38,12 @@ class K8sMonitor(PluginBase):
             self.podQueueTimeLimit
         except AttributeError:
             self.podQueueTimeLimit = 172800
-
-        self._all_pods_list = []
+        try:
+            self.usePodInformer
+        except AttributeError:
+            self.usePodInformer = False
+        else:
+            self.usePodInformer = bool(self.usePodInformer)
 
     def check_pods_status(self, pods_status_list):
         newStatus = ''
@@ -66,7 +71,7 @@ class K8sMonitor(PluginBase):
 
         return newStatus
 
-    def check_a_job(self, workspec):
+    def check_a_job(self, workspec, pods_info_map=None, pod_informer=None):
         # set logger
         tmpLog = self.make_logger(baseLogger, 'workerID={0} batchID={1}'.format(workspec.workerID, workspec.batchID),
                                   method_name='check_a_job')
@@ -77,7 +82,13 @@ class K8sMonitor(PluginBase):
         errStr = ''
 
         try:
-            pods_list = self.k8s_client.filter_pods_info(self._all_pods_list, job_name=job_id)
+            if pod_informer is not None:
+                pods_list = pod_informer.get_pods_info_by_job(job_id)
+                if not pods_list:
+                    # pods may not be seen by the watch yet
+                    pods_list = self.k8s_client.get_pods_info(job_name=job_id)
+            else:
+                pods_list = pods_info_map.get(job_id, [])
             timeNow = datetime.datetime.utcnow()
             pods_status_list = []
             pods_name_to_delete_list = []
@@ -127,10 +138,20 @@ class K8sMonitor(PluginBase):
             retList.append(('', errStr))
             return False, retList
 
-        self._all_pods_list = self.k8s_client.get_pods_info()
+        # state of this cycle is passed to check_a_job not to be shared with concurrent cycles
+        pod_informer = None
+        pods_info_map = None
+        if self.usePodInformer:
+            pod_informer = self.k8s_client.get_pod_informer()
+            if not pod_informer.is_ready():
+                tmpLog.debug('pod informer not ready; list pods')
+                pod_informer = None
+        if pod_informer is None:
+            pods_info_map = self.k8s_client.index_pods_info(self.k8s_client.get_pods_info())
+        check_a_job = functools.partial(self.check_a_job, pods_info_map=pods_info_map, pod_informer=pod_informer)
 
         with ThreadPoolExecutor(self.nProcesses) as thread_pool:
-            retIterator = thread_pool.map(self.check_a_job, workspec_list)
+            retIterator = thread_pool.map(check_a_job, workspec_list)
 
         retList = list(retIterator)
 
@@ -16,12 +16,100 @@ baseLogger = core_utils.setup_logger('pbs_monitor')
 class PBSMonitor(PluginBase):
     # constructor
     def __init__(self, **kwarg):
+        # max number of jobs in one qstat command. 0 to check workers one by one
+        self.maxJobsPerQuery = 1000
         PluginBase.__init__(self, **kwarg)
 
+    # convert batch status to worker status
+    def _to_worker_status(self, batch_status):
+        if batch_status in ['R', 'E']:
+            newStatus = WorkSpec.ST_running
+        elif batch_status in ['C', 'H']:
+            newStatus = WorkSpec.ST_finished
+        elif batch_status in ['CANCELLED']:
+            newStatus = WorkSpec.ST_cancelled
+        elif batch_status in ['Q', 'W', 'S']:
+            newStatus = WorkSpec.ST_submitted
+        else:
+            newStatus = WorkSpec.ST_failed
+        return newStatus
+
+    # get map of batchID to (batch status, line) with one qstat command. Unknown jobs have None as status
+    def _get_batch_status_map(self, batch_id_list, tmp_log):
+        comStr = "qstat -f {0}".format(' '.join(batch_id_list))
+        tmp_log.debug('check {0} jobs with qstat'.format(len(batch_id_list)))
+        p = subprocess.Popen(comStr.split(),
+                             shell=False,
+                             universal_newlines=True,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        stdOut, stdErr = p.communicate()
+        retCode = p.returncode
+        tmp_log.debug('retCode={0}'.format(retCode))
+        statusMap = dict()
+        # parse full output
+        jobID = None
+        for tmpLine in stdOut.split('\n'):
+            tmpMatch = re.search(r'^Job Id:\s*(\S+)', tmpLine)
+            if tmpMatch is not None:
+                jobID = tmpMatch.group(1)
+                continue
+            tmpMatch = re.search(r'^\s+job_state\s*=\s*(\S+)', tmpLine)
+            if tmpMatch is not None and jobID is not None:
+                statusMap[jobID] = (tmpMatch.group(1), '{0} {1}'.format(jobID, tmpLine.strip()))
+                # short ID without server name
+                statusMap.setdefault(jobID.split('.')[0], statusMap[jobID])
+        # unknown jobs
+        for tmpLine in stdErr.split('\n'):
+            tmpMatch = re.search(r'Unknown Job Id(?: Error)?\s+(\S+)', tmpLine)
+            if tmpMatch is not None:
+                statusMap[tmpMatch.group(1)] = (None, tmpLine.strip())
+        # failed without any information
+        if retCode != 0 and len(statusMap) == 0:
+            return False, stdOut + ' ' + stdErr
+        return True, statusMap
+
     # check workers
     def check_workers(self, workspec_list):
+        tmpLog = self.make_logger(baseLogger, method_name='check_workers')
+        # check with bulk queries
+        statusMap = dict()
+        failedIDs = set()
+        if self.maxJobsPerQuery > 0:
+            batchIDs = sorted(set([str(workSpec.batchID) for workSpec in workspec_list
+                                   if workSpec.batchID is not None]))
+            for iChunk in range(0, len(batchIDs), self.maxJobsPerQuery):
+                chunk = batchIDs[iChunk:iChunk + self.maxJobsPerQuery]
+                try:
+                    tmpStat, tmpOut = self._get_batch_status_map(chunk, tmpLog)
+                except Exception:
+                    tmpStat, tmpOut = False, core_utils.dump_error_message(tmpLog)
+                if tmpStat:
+                    statusMap.update(tmpOut)
+                else:
+                    # check one by one
+                    tmpLog.error('bulk query failed with {0}'.format(tmpOut))
+                    failedIDs.update(chunk)
         retList = []
         for workSpec in workspec_list:
+            if self.maxJobsPerQuery > 0 and str(workSpec.batchID) not in failedIDs:
+                newStatus = workSpec.status
+                errStr = ''
+                batchID = str(workSpec.batchID)
+                if batchID not in statusMap:
+                    batchID = batchID.split('.')[0]
+                if batchID in statusMap:
+                    batchStatus, errStr = statusMap[batchID]
+                    if batchStatus is None:
+                        tmpLog.info('workerID={0} mark job as finished since unknown'.format(workSpec.workerID))
+                        newStatus = WorkSpec.ST_finished
+                    else:
+                        newStatus = self._to_worker_status(batchStatus)
+                        tmpLog.debug('workerID={0} batchStatus {1} -> workerStatus {2}'.format(workSpec.workerID,
+                                                                                               batchStatus,
+                                                                                               newStatus))
+                retList.append((newStatus, errStr))
+                continue
             # make logger
             tmpLog = self.make_logger(baseLogger, 'workerID={0}'.format(workSpec.workerID),
                                       method_name='check_workers')
@@ -46,16 +134,7 @@ class PBSMonitor(PluginBase):
                     if tmpMatch is not None:
                         errStr = tmpLine
                         batchStatus = tmpLine.split()[-2]
-                        if batchStatus in ['R', 'E']:
-                            newStatus = WorkSpec.ST_running
-                        elif batchStatus in ['C', 'H']:
-                            newStatus = WorkSpec.ST_finished
-                        elif batchStatus in ['CANCELLED']:
-                            newStatus = WorkSpec.ST_cancelled
-                        elif batchStatus in ['Q', 'W', 'S']:
-                            newStatus = WorkSpec.ST_submitted
-                        else:
-                            newStatus = WorkSpec.ST_failed
+                        newStatus = self._to_worker_status(batchStatus)
                         tmpLog.debug('batchStatus {0} -> workerStatus {1}'.format(batchStatus,
                                                                                   newStatus))
                         break
@@ -16,12 +16,82 @@ baseLogger = core_utils.setup_logger('slurm_monitor')
 class SlurmMonitor(PluginBase):
     # constructor
     def __init__(self, **kwarg):
+        # max number of jobs in one sacct command. 0 to check workers one by one
+        self.maxJobsPerQuery = 1000
         PluginBase.__init__(self, **kwarg)
 
+    # convert batch status to worker status
+    def _to_worker_status(self, batch_status):
+        if batch_status in ['RUNNING', 'COMPLETING', 'STOPPED', 'SUSPENDED']:
+            newStatus = WorkSpec.ST_running
+        elif batch_status in ['COMPLETED', 'PREEMPTED', 'TIMEOUT']:
+            newStatus = WorkSpec.ST_finished
+        elif batch_status in ['CANCELLED']:
+            newStatus = WorkSpec.ST_cancelled
+        elif batch_status in ['CONFIGURING', 'PENDING']:
+            newStatus = WorkSpec.ST_submitted
+        else:
+            newStatus = WorkSpec.ST_failed
+        return newStatus
+
+    # get map of batchID to (batch status, line) with one sacct command
+    def _get_batch_status_map(self, batch_id_list, tmp_log):
+        comStr = "sacct --jobs={0} --allocations --noheader --parsable2 --format=JobID,State".format(
+            ','.join(batch_id_list))
+        tmp_log.debug('check {0} jobs with sacct'.format(len(batch_id_list)))
+        p = subprocess.Popen(comStr.split(),
+                             shell=False,
+                             universal_newlines=True,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        stdOut, stdErr = p.communicate()
+        retCode = p.returncode
+        tmp_log.debug('retCode={0}'.format(retCode))
+        if retCode != 0:
+            return False, stdOut + ' ' + stdErr
+        statusMap = dict()
+        for tmpLine in stdOut.split('\n'):
+            items = tmpLine.strip().split('|')
+            if len(items) < 2 or not items[1]:
+                continue
+            # state can be like "CANCELLED by 1234"
+            statusMap[items[0]] = (items[1].split()[0], tmpLine.strip())
+        return True, statusMap
+
     # check workers
     def check_workers(self, workspec_list):
+        tmpLog = self.make_logger(baseLogger, method_name='check_workers')
+        # check with bulk queries
+        statusMap = dict()
+        failedIDs = set()
+        if self.maxJobsPerQuery > 0:
+            batchIDs = sorted(set([str(workSpec.batchID) for workSpec in workspec_list
+                                   if workSpec.batchID is not None]))
+            for iChunk in range(0, len(batchIDs), self.maxJobsPerQuery):
+                chunk = batchIDs[iChunk:iChunk + self.maxJobsPerQuery]
+                try:
+                    tmpStat, tmpOut = self._get_batch_status_map(chunk, tmpLog)
+                except Exception:
+                    tmpStat, tmpOut = False, core_utils.dump_error_message(tmpLog)
+                if tmpStat:
+                    statusMap.update(tmpOut)
+                else:
+                    # check one by one
+                    tmpLog.error('bulk query failed with {0}'.format(tmpOut))
+                    failedIDs.update(chunk)
         retList = []
         for workSpec in workspec_list:
+            if self.maxJobsPerQuery > 0 and str(workSpec.batchID) not in failedIDs:
+                newStatus = workSpec.status
+                errStr = ''
+                if str(workSpec.batchID) in statusMap:
+                    batchStatus, errStr = statusMap[str(workSpec.batchID)]
+                    newStatus = self._to_worker_status(batchStatus)
+                    tmpLog.debug('workerID={0} batchStatus {1} -> workerStatus {2}'.format(workSpec.workerID,
+                                                                                           batchStatus,
+                                                                                           newStatus))
+                retList.append((newStatus, errStr))
+                continue
             # make logger
             tmpLog = self.make_logger(baseLogger, 'workerID={0}'.format(workSpec.workerID),
                                       method_name='check_workers')
@@ -46,16 +116,7 @@ class SlurmMonitor(PluginBase):
                     if tmpMatch is not None:
                         errStr = tmpLine
                         batchStatus = tmpLine.split()[5]
-                        if batchStatus in ['RUNNING', 'COMPLETING', 'STOPPED', 'SUSPENDED']:
-                            newStatus = WorkSpec.ST_running
-                        elif batchStatus in ['COMPLETED', 'PREEMPTED', 'TIMEOUT']:
-                            newStatus = WorkSpec.ST_finished
-                        elif batchStatus in ['CANCELLED']:
-                            newStatus = WorkSpec.ST_cancelled
-                        elif batchStatus in ['CONFIGURING', 'PENDING']:
-                            newStatus = WorkSpec.ST_submitted
-                        else:
-                            newStatus = WorkSpec.ST_failed
+                        newStatus = self._to_worker_status(batchStatus)
                         tmpLog.debug('batchStatus {0} -> workerStatus {1}'.format(batchStatus,
                                                                                   newStatus))
                         break
@@ -39,7 +39,7 @@ def _make_init_script(workspec, template_str):
 
     # make init tempfile
     tmpFile = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='_init.sh', dir=workspec.get_access_point())
-    new_template_str = _init_script_replace(template_str, **workspec.__dict__)
+    new_template_str = _init_script_replace(template_str, **workspec.to_dict())
     tmpFile.write(new_template_str)
     tmpFile.close()
     tmpLog.debug('done')
@@ -4,6 +4,7 @@ import datetime
 import tempfile
 import threading
 import random
+import string
 
 from concurrent.futures import ThreadPoolExecutor
 import re
@@ -21,6 +22,14 @@ from pandaharvester.harvestermisc.htcondor_utils import CondorJobSubmit
 # logger
 baseLogger = core_utils.setup_logger('htcondor_submitter')
 
+# preprocessed SDF templates; path -> (mtime, template dict)
+_sdf_template_cache = dict()
+_sdf_template_cache_lock = threading.Lock()
+
+# SDF templates with fields pre-bound
+_bound_template_cache = dict()
+_bound_template_cache_size = 1000
+
 
 # Integer division round up
 def _div_round_up(a, b):
@@ -173,6 +182,72 @@ def _condor_macro_replace(string, **kwarg):
     return new_string
 
 
+# Read SDF template file, remove commented lines and get batch_log, stdout, stderr filename, with cache
+def _get_sdf_template(template_file):
+    mtime = os.stat(template_file).st_mtime
+    with _sdf_template_cache_lock:
+        cached = _sdf_template_cache.get(template_file)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(template_file) as tmpFile:
+        sdf_template_raw = tmpFile.read()
+    template_dict = {'batch_log': None, 'stdout': None, 'stderr': None}
+    sdf_template_str_list = []
+    for _line in sdf_template_raw.split('\n'):
+        if _line.startswith('#'):
+            continue
+        sdf_template_str_list.append(_line)
+        _match_batch_log = re.match('log = (.+)', _line)
+        _match_stdout = re.match('output = (.+)', _line)
+        _match_stderr = re.match('error = (.+)', _line)
+        if _match_batch_log:
+            template_dict['batch_log'] = _match_batch_log.group(1)
+            continue
+        if _match_stdout:
+            template_dict['stdout'] = _match_stdout.group(1)
+            continue
+        if _match_stderr:
+            template_dict['stderr'] = _match_stderr.group(1)
+            continue
+    template_dict['template'] = '\n'.join(sdf_template_str_list)
+    with _sdf_template_cache_lock:
+        _sdf_template_cache[template_file] = (mtime, template_dict)
+    return template_dict
+
+
+# Fill in some fields of template and leave others as they are, with cache.
+# Fields with nested fields in format_spec are left as they are including the nested fields
+def _bind_template(template, **kwarg):
+    cache_key = (template, tuple(kwarg.items()))
+    bound_template = _bound_template_cache.get(cache_key)
+    if bound_template is not None:
+        return bound_template
+    formatter = string.Formatter()
+    str_list = []
+    for literal_text, field_name, format_spec, conversion in formatter.parse(template):
+        str_list.append(literal_text.replace('{', '{{').replace('}', '}}'))
+        if field_name is None:
+            continue
+        field_root = re.split(r'[.\[]', field_name, 1)[0]
+        if field_root in kwarg and '{' not in format_spec:
+            obj = formatter.get_field(field_name, (), kwarg)[0]
+            obj = formatter.convert_field(obj, conversion)
+            str_list.append(formatter.format_field(obj, format_spec).replace('{', '{{').replace('}', '}}'))
+        else:
+            # leave the field
+            str_list.append('{' + field_name)
+            if conversion:
+                str_list.append('!' + conversion)
+            if format_spec:
+                str_list.append(':' + format_spec)
+            str_list.append('}')
+    bound_template = ''.join(str_list)
+    if len(_bound_template_cache) >= _bound_template_cache_size:
+        _bound_template_cache.clear()
+    _bound_template_cache[cache_key] = bound_template
+    return bound_template
+
+
 # Parse resource type from string for Unified PanDA Queue
 def _get_resource_type(string, is_unified_queue, is_pilot_option=False, pilot_version='1'):
     string = str(string)
@@ -214,7 +289,7 @@ def _get_prodsourcelabel_pilotypeopt_piloturlstr(pilot_type, pilot_version='1'):
 
 
 # submit a bag of workers
-def submit_bag_of_workers(data_list):
+def submit_bag_of_workers(data_list, coalesce_window=0):
     # make logger
     tmpLog = core_utils.make_logger(baseLogger, method_name='submit_bag_of_workers')
     # keep order of workers in data_list
@@ -256,8 +331,8 @@ def submit_bag_of_workers(data_list):
                 host_jdl_list_workerid_map[workspec.submissionHost].append(val)
             except KeyError:
                 host_jdl_list_workerid_map[workspec.submissionHost] = [val]
-    # loop over submissionHost
-    for host, val_list in host_jdl_list_workerid_map.items():
+    # submit to a submissionHost
+    def _submit_one_host(host, val_list):
         # make jdl string of workers
         jdl_list = [ val[1] for val in val_list ]
         # condor job submit object
@@ -265,10 +340,26 @@ def submit_bag_of_workers(data_list):
         condor_job_submit = CondorJobSubmit(id=host)
         # submit
         try:
-            batchIDs_list, ret_err_str = condor_job_submit.submit(jdl_list, use_spool=use_spool)
+            if coalesce_window > 0:
+                # together with workers of other queues
+                batchIDs_list, ret_err_str = condor_job_submit.submit_coalesced(jdl_list, use_spool=use_spool,
+                                                                                window=coalesce_window)
+            else:
+                batchIDs_list, ret_err_str = condor_job_submit.submit(jdl_list, use_spool=use_spool)
         except Exception as e:
             batchIDs_list = None
             ret_err_str = 'Exception {0}: {1}'.format(e.__class__.__name__, e)
+        return batchIDs_list, ret_err_str
+    # submit to submissionHosts in parallel not to wait for coalescing one after another
+    if coalesce_window > 0 and len(host_jdl_list_workerid_map) > 1:
+        with ThreadPoolExecutor(len(host_jdl_list_workerid_map)) as thread_pool:
+            host_ret_list = list(thread_pool.map(lambda _hv_tuple: _submit_one_host(*_hv_tuple),
+                                                 host_jdl_list_workerid_map.items()))
+    else:
+        host_ret_list = [ _submit_one_host(host, val_list)
+                          for host, val_list in host_jdl_list_workerid_map.items() ]
+    # loop over submissionHost
+    for (host, val_list), (batchIDs_list, ret_err_str) in zip(host_jdl_list_workerid_map.items(), host_ret_list):
         # result
         if batchIDs_list:
             # submitted
@@ -371,23 +462,11 @@ def make_a_jdl(workspec, template, n_core_per_node, log_dir, panda_queue_name, e
         prod_source_label, pilot_type_opt, pilot_url_str = pilot_opt_tuple
     # open tmpfile as submit description file
     tmpFile = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='_submit.sdf', dir=workspec.get_access_point())
-    # fill in template string
-    jdl_str = template.format(
-        sdfPath=tmpFile.name,
+    # fields common among workers of the same queue, CE, and resource type
+    static_dict = dict(
         executableFile=executable_file,
         nCorePerNode=n_core_per_node,
-        nCoreTotal=n_core_total,
-        nNode=n_node,
-        requestRam=request_ram,
-        requestRamPerCore=request_ram_per_core,
-        requestDisk=request_disk,
-        requestWalltime=request_walltime,
-        requestWalltimeMinute=request_walltime_minute,
-        requestCputime=request_cputime,
-        requestCputimeMinute=request_cputime_minute,
-        accessPoint=workspec.accessPoint,
         harvesterID=harvester_config.master.harvester_id,
-        workerID=workspec.workerID,
         computingSite=workspec.computingSite,
         pandaQueueName=panda_queue_name,
         x509UserProxy=x509_user_proxy,
@@ -399,14 +478,32 @@ def make_a_jdl(workspec, template, n_core_per_node, log_dir, panda_queue_name, e
         ceVersion=ce_info_dict.get('ce_version', ''),
         logDir=log_dir,
         logSubdir=log_subdir,
-        gtag=batch_log_dict.get('gtag', 'fake_GTAG_string'),
         prodSourceLabel=prod_source_label,
         resourceType=_get_resource_type(workspec.resourceType, is_unified_queue),
         pilotResourceTypeOption=_get_resource_type(workspec.resourceType, is_unified_queue, True, pilot_version),
-        ioIntensity=io_intensity,
         pilotType=pilot_type_opt,
         pilotUrlOption=pilot_url_str,
         )
+    # fill in common fields with cache
+    template = _bind_template(template, **static_dict)
+    # fill in template string. Common fields are given again for fields left by _bind_template
+    jdl_str = template.format(
+        sdfPath=tmpFile.name,
+        nCoreTotal=n_core_total,
+        nNode=n_node,
+        requestRam=request_ram,
+        requestRamPerCore=request_ram_per_core,
+        requestDisk=request_disk,
+        requestWalltime=request_walltime,
+        requestWalltimeMinute=request_walltime_minute,
+        requestCputime=request_cputime,
+        requestCputimeMinute=request_cputime_minute,
+        accessPoint=workspec.accessPoint,
+        workerID=workspec.workerID,
+        gtag=batch_log_dict.get('gtag', 'fake_GTAG_string'),
+        ioIntensity=io_intensity,
+        **static_dict
+        )
     # save jdl to submit description file
     tmpFile.write(jdl_str)
     tmpFile.close()
@@ -497,6 +594,11 @@ class HTCondorSubmitter(PluginBase):
             self.minBulkToRamdomizedSchedd
         except AttributeError:
             self.minBulkToRamdomizedSchedd = 20
+        # window in sec to coalesce submissions to the same schedd across queues. 0 to disable
+        try:
+            self.submitCoalesceWindow
+        except AttributeError:
+            self.submitCoalesceWindow = getattr(harvester_config.submitter, 'pluginCoalesceWindow', 0)
         # record of information of CE statistics
         self.ceStatsLock = threading.Lock()
         self.ceStats = dict()
@@ -621,6 +723,7 @@ class HTCondorSubmitter(PluginBase):
                                             method_name='_handle_one_worker')
             ce_info_dict = dict()
             batch_log_dict = dict()
+            sdf_template_file = None
             data = {'workspec': workspec,
                     'to_submit': to_submit,}
             if to_submit:
@@ -653,7 +756,7 @@ class HTCondorSubmitter(PluginBase):
                     if os.path.isdir(self.CEtemplateDir) and ce_flavour_str:
                         sdf_template_filename = '{ce_flavour_str}{pilot_version_suffix_str}.sdf'.format(
                                                     ce_flavour_str=ce_flavour_str, pilot_version_suffix_str=pilot_version_suffix_str)
-                        self.templateFile = os.path.join(self.CEtemplateDir, sdf_template_filename)
+                        sdf_template_file = os.path.join(self.CEtemplateDir, sdf_template_filename)
                 else:
                     try:
                         # Manually define site condor schedd as ceHostname and central manager as ceEndpoint
@@ -670,33 +773,19 @@ class HTCondorSubmitter(PluginBase):
                         pass
                 # template for batch script
                 try:
-                    tmpFile = open(self.templateFile)
-                    sdf_template_raw = tmpFile.read()
-                    tmpFile.close()
+                    if sdf_template_file is None:
+                        sdf_template_file = self.templateFile
+                    sdf_template_dict = _get_sdf_template(sdf_template_file)
                 except AttributeError:
                     tmpLog.error('No valid templateFile found. Maybe templateFile, CEtemplateDir invalid, or no valid CE found')
                     to_submit = False
                     return data
                 else:
-                    # get batch_log, stdout, stderr filename, and remobe commented liness
-                    sdf_template_str_list = []
-                    for _line in sdf_template_raw.split('\n'):
-                        if _line.startswith('#'):
-                            continue
-                        sdf_template_str_list.append(_line)
-                        _match_batch_log = re.match('log = (.+)', _line)
-                        _match_stdout = re.match('output = (.+)', _line)
-                        _match_stderr = re.match('error = (.+)', _line)
-                        if _match_batch_log:
-                            batch_log_value = _match_batch_log.group(1)
-                            continue
-                        if _match_stdout:
-                            stdout_value = _match_stdout.group(1)
-                            continue
-                        if _match_stderr:
-                            stderr_value = _match_stderr.group(1)
-                            continue
-                    sdf_template = '\n'.join(sdf_template_str_list)
+                    # get batch_log, stdout, stderr filename
+                    sdf_template = sdf_template_dict['template']
+                    batch_log_value = sdf_template_dict['batch_log']
+                    stdout_value = sdf_template_dict['stdout']
+                    stderr_value = sdf_template_dict['stderr']
                     # Choose from Condor schedd and central managers
                     condor_schedd, condor_pool = random.choice(schedd_pool_choice_list)
                     # set submissionHost
@@ -776,7 +865,7 @@ class HTCondorSubmitter(PluginBase):
         tmpLog.debug('{0} workers handled'.format(nWorkers))
 
         # submit
-        retValList = submit_bag_of_workers(list(dataIterator))
+        retValList = submit_bag_of_workers(list(dataIterator), coalesce_window=self.submitCoalesceWindow)
         tmpLog.debug('{0} workers submitted'.format(nWorkers))
 
         # propagate changed attributes
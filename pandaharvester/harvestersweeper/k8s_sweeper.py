@@ -17,8 +17,6 @@ class K8sSweeper(BaseSweeper):
 
         self.k8s_client = k8s_Client(namespace=self.k8s_namespace, config_file=self.k8s_config_file)
 
-        self._all_pods_list = []
-
     # # kill a worker
     # def kill_worker(self, workspec):
     #     tmpLog = self.make_logger(baseLogger, 'workerID={0}'.format(workspec.workerID),
@@ -59,7 +57,7 @@ class K8sSweeper(BaseSweeper):
     def kill_workers(self, workspec_list):
         tmpLog = self.make_logger(baseLogger, method_name='kill_workers')
 
-        self._all_pods_list = self.k8s_client.get_pods_info()
+        pods_info_map = self.k8s_client.index_pods_info(self.k8s_client.get_pods_info())
 
         retList = []
         for workspec in workspec_list:
@@ -73,7 +71,7 @@ class K8sSweeper(BaseSweeper):
                 tmpLog.error(errStr)
                 tmpRetVal = (False, errStr)
 
-            pods_list = self.k8s_client.filter_pods_info(self._all_pods_list, job_name=job_id)
+            pods_list = pods_info_map.get(job_id, [])
             pods_name = [ pods_info['name'] for pods_info in pods_list ]
             job_info = self.k8s_client.get_jobs_info(job_id)
 
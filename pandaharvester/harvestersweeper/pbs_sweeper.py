@@ -1,4 +1,5 @@
 import os
+import re
 import shutil
 try:
     import subprocess32 as subprocess
@@ -16,6 +17,8 @@ baseLogger = core_utils.setup_logger('pbs_sweeper')
 class PBSSweeper(PluginBase):
     # constructor
     def __init__(self, **kwarg):
+        # max number of jobs in one qdel command
+        self.maxJobsPerCommand = 1000
         PluginBase.__init__(self, **kwarg)
 
     # kill a worker
@@ -46,6 +49,56 @@ class PBSSweeper(PluginBase):
         # return
         return True, ''
 
+    # kill workers
+    def kill_workers(self, workspec_list):
+        """Kill workers in a scheduling system like batch systems and computing elements.
+
+        :param workspec_list: a list of workspec instances
+        :return: A list of tuples of return code (True for success, False otherwise) and error dialog
+        :rtype: [(bool, string), ...]
+        """
+        # make logger
+        tmpLog = self.make_logger(baseLogger, method_name='kill_workers')
+        # kill with bulk commands
+        errMap = dict()
+        batchIDs = sorted(set([str(workspec.batchID) for workspec in workspec_list
+                               if workspec.batchID is not None]))
+        nJobs = max(self.maxJobsPerCommand, 1)
+        for iChunk in range(0, len(batchIDs), nJobs):
+            chunk = batchIDs[iChunk:iChunk + nJobs]
+            comStr = 'qdel {0}'.format(' '.join(chunk))
+            p = subprocess.Popen(comStr.split(), shell=False, universal_newlines=True,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdOut, stdErr = p.communicate()
+            retCode = p.returncode
+            if retCode != 0:
+                # failed jobs are reported on their own lines
+                chunkSet = set(chunk)
+                chunkErrMap = dict()
+                for tmpLine in (stdOut + '\n' + stdErr).split('\n'):
+                    for tmpItem in re.split(r'[\s:,]+', tmpLine):
+                        if tmpItem in chunkSet:
+                            chunkErrMap[tmpItem] = tmpLine.strip()
+                if len(chunkErrMap) == 0:
+                    for batchID in chunk:
+                        chunkErrMap[batchID] = stdOut + ' ' + stdErr
+                for batchID, tmpOut in chunkErrMap.items():
+                    errMap[batchID] = 'command "qdel {0}" failed, retCode={1}, error: {2}'.format(batchID,
+                                                                                                 retCode, tmpOut)
+        # fill return list
+        retList = []
+        for workspec in workspec_list:
+            if workspec.batchID is None:
+                retList.append((True, 'worker without batchID; skipped'))
+            elif str(workspec.batchID) in errMap:
+                tmpLog.error('workerID={0} {1}'.format(workspec.workerID, errMap[str(workspec.batchID)]))
+                retList.append((False, errMap[str(workspec.batchID)]))
+            else:
+                tmpLog.info('Succeeded to kill workerID={0} batchID={1}'.format(workspec.workerID, workspec.batchID))
+                retList.append((True, ''))
+        # return
+        return retList
+
     # cleanup for a worker
     def sweep_worker(self, workspec):
         """Perform cleanup procedures for a worker, such as deletion of work directory.
@@ -1,10 +1,18 @@
 import os
 import uuid
 import time
+import zlib
+import tarfile
 import multiprocessing
 import tempfile
 import gc
+import threading
 from concurrent.futures import ThreadPoolExecutor as Pool
+from concurrent.futures import ProcessPoolExecutor
+try:
+    from concurrent.futures.process import BrokenProcessPool
+except ImportError:
+    BrokenProcessPool = RuntimeError
 
 try:
     import subprocess32 as subprocess
@@ -16,6 +24,40 @@ from pandaharvester.harvestercore import core_utils
 from pandaharvester.harvestercore.plugin_base import PluginBase
 
 
+# file object to calculate size and adler32 of data while writing
+class ChecksumWriter(object):
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.size = 0
+        self.adler32 = 1
+
+    def write(self, data):
+        self.fileobj.write(data)
+        self.size += len(data)
+        self.adler32 = zlib.adler32(data, self.adler32)
+
+    def get_checksum(self):
+        val = self.adler32
+        if val < 0:
+            val += 2 ** 32
+        return hex(val)[2:10].zfill(8).lower()
+
+
+# make a tar file in one pass and return its size and adler32. Files are archived with basename
+def make_tar_with_adler32(tar_path, file_list, block_size=8*1024*1024):
+    with open(tar_path, 'wb') as f:
+        writer = ChecksumWriter(f)
+        tar = tarfile.open(fileobj=writer, mode='w|', bufsize=block_size, format=tarfile.GNU_FORMAT)
+        try:
+            # buffer size to read input files
+            tar.copybufsize = block_size
+            for path in file_list:
+                tar.add(path, arcname=os.path.basename(path), recursive=False)
+        finally:
+            tar.close()
+    return writer.size, writer.get_checksum()
+
+
 # base class for zipper plugin
 class BaseZipper(PluginBase):
     # constructor
@@ -23,7 +65,36 @@ class BaseZipper(PluginBase):
         self.zipDir = "${SRCDIR}"
         self.zip_tmp_log = None
         self.zip_jobSpec = None
+        # make zip in process with tarfile instead of tar command, to get size and checksum while writing
+        self.inProcessZip = False
+        # block size in bytes to read and write files for in-process zip
+        self.zipBlockSize = 8 * 1024 * 1024
+        # number of processes for in-process zip. 0 to make zip in the threads
+        self.nProcessesForZip = 0
         PluginBase.__init__(self, **kwarg)
+        # process pool for in-process zip, made on demand and reused
+        self._processPool = None
+        self._processPoolLock = threading.Lock()
+
+    # get the process pool for in-process zip. Processes are spawned not to inherit threads and DB connections
+    def get_process_pool(self):
+        with self._processPoolLock:
+            if self._processPool is None:
+                try:
+                    mpContext = multiprocessing.get_context('spawn')
+                    self._processPool = ProcessPoolExecutor(max_workers=self.nProcessesForZip,
+                                                            mp_context=mpContext)
+                except (AttributeError, TypeError):
+                    # python 2 or older python 3 without mp_context
+                    self._processPool = ProcessPoolExecutor(max_workers=self.nProcessesForZip)
+            return self._processPool
+
+    # discard the process pool when it got broken, e.g. a process was killed
+    def reset_process_pool(self, process_pool):
+        with self._processPoolLock:
+            if self._processPool is process_pool:
+                self._processPool = None
+        process_pool.shutdown(wait=False)
 
     # zip output files
     def simple_zip_output(self, jobspec, tmp_log):
@@ -59,20 +130,20 @@ class BaseZipper(PluginBase):
                 nThreadsForZip = multiprocessing.cpu_count()
             with Pool(max_workers=nThreadsForZip) as pool:
                 retValList = pool.map(self.make_one_zip, argDictList)
-                # check returns
-                for fileSpec, retVal in zip(jobspec.outFiles, retValList):
-                    tmpRet, errMsg, fileInfo = retVal
-                    if tmpRet is True:
-                        # set path
-                        fileSpec.path = fileInfo['path']
-                        fileSpec.fsize = fileInfo['fsize']
-                        fileSpec.chksum = fileInfo['chksum']
-                        msgStr = 'fileSpec.path - {0}, fileSpec.fsize - {1}, fileSpec.chksum(adler32) - {2}' \
-                            .format(fileSpec.path, fileSpec.fsize, fileSpec.chksum)
-                        tmp_log.debug(msgStr)
-                    else:
-                        tmp_log.error('got {0} with {1} when zipping {2}'.format(tmpRet, errMsg, fileSpec.lfn))
-                        return tmpRet, 'failed to zip with {0}'.format(errMsg)
+            # check returns
+            for fileSpec, retVal in zip(jobspec.outFiles, retValList):
+                tmpRet, errMsg, fileInfo = retVal
+                if tmpRet is True:
+                    # set path
+                    fileSpec.path = fileInfo['path']
+                    fileSpec.fsize = fileInfo['fsize']
+                    fileSpec.chksum = fileInfo['chksum']
+                    msgStr = 'fileSpec.path - {0}, fileSpec.fsize - {1}, fileSpec.chksum(adler32) - {2}' \
+                        .format(fileSpec.path, fileSpec.fsize, fileSpec.chksum)
+                    tmp_log.debug(msgStr)
+                else:
+                    tmp_log.error('got {0} with {1} when zipping {2}'.format(tmpRet, errMsg, fileSpec.lfn))
+                    return tmpRet, 'failed to zip with {0}'.format(errMsg)
         except Exception:
             errMsg = core_utils.dump_error_message(tmp_log)
             return False, 'failed to zip with {0}'.format(errMsg)
@@ -81,6 +152,8 @@ class BaseZipper(PluginBase):
 
     # make one zip file
     def make_one_zip(self, arg_dict):
+        if self.inProcessZip:
+            return self.make_one_zip_in_process(arg_dict)
         try:
             zipPath = arg_dict['zipPath']
             lfn = os.path.basename(zipPath)
@@ -140,6 +213,65 @@ class BaseZipper(PluginBase):
         self.zip_tmp_log.debug('{0} done'.format(lfn))
         return True, '', fileInfo
 
+    # make one zip file with tarfile, getting size and checksum while writing
+    def make_one_zip_in_process(self, arg_dict):
+        try:
+            zipPath = arg_dict['zipPath']
+            lfn = os.path.basename(zipPath)
+            self.zip_tmp_log.debug('{0} start zipPath={1} with {2} files in process'.format(
+                lfn, zipPath, len(arg_dict['associatedFiles'])))
+            fileInfo = dict()
+            fileInfo['path'] = zipPath
+            # make zip if doesn't exist
+            if not os.path.exists(zipPath):
+                # tmp file name
+                tmpZipPath = zipPath + '.' + str(uuid.uuid4())
+                if self.nProcessesForZip > 0:
+                    # CPU-bound part in the process pool
+                    processPool = self.get_process_pool()
+                    try:
+                        fsize, chksum = processPool.submit(make_tar_with_adler32, tmpZipPath,
+                                                           arg_dict['associatedFiles'], self.zipBlockSize).result()
+                    except BrokenProcessPool:
+                        self.reset_process_pool(processPool)
+                        raise
+                else:
+                    fsize, chksum = make_tar_with_adler32(tmpZipPath, arg_dict['associatedFiles'],
+                                                          self.zipBlockSize)
+                # avoid overwriting
+                lockName = 'zip.lock.{0}'.format(lfn)
+                lockInterval = 60
+                tmpStat = False
+                # get lock
+                for i in range(lockInterval):
+                    tmpStat = self.dbInterface.get_object_lock(lockName, lock_interval=lockInterval)
+                    if tmpStat:
+                        break
+                    time.sleep(1)
+                # failed to lock
+                if not tmpStat:
+                    msgStr = 'failed to lock for {0}'.format(lfn)
+                    self.zip_tmp_log.error(msgStr)
+                    return None, msgStr, {}
+                if not os.path.exists(zipPath):
+                    os.rename(tmpZipPath, zipPath)
+                    fileInfo['fsize'] = fsize
+                    fileInfo['chksum'] = chksum
+                else:
+                    # made by another thread
+                    os.remove(tmpZipPath)
+                # release lock
+                self.dbInterface.release_object_lock(lockName)
+            # size and checksum of existing zip
+            if 'chksum' not in fileInfo:
+                fileInfo['fsize'] = os.stat(zipPath).st_size
+                fileInfo['chksum'] = core_utils.calc_adler32(zipPath)
+        except Exception:
+            errMsg = core_utils.dump_error_message(self.zip_tmp_log)
+            return False, 'failed to zip with {0}'.format(errMsg), {}
+        self.zip_tmp_log.debug('{0} done'.format(lfn))
+        return True, '', fileInfo
+
     # zip output files; file operations are done on remote side with ssh
     def ssh_zip_output(self, jobspec, tmp_log):
         tmp_log.debug('start')